@@ -0,0 +1,4 @@
+"""Offline micro-benchmarks for the face pipeline hot paths.
+
+Run from the project root, e.g. ``python -m benchmarks.face_benchmarks``.
+"""
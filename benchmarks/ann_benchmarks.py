@@ -0,0 +1,103 @@
+"""Exact vs IVF approximate search over large synthetic galleries.
+
+Vectors are drawn around a set of "identities" (like real galleries, where the
+same person is saved many times), projected to ``--dim`` dimensions::
+
+    python -m benchmarks.ann_benchmarks
+    python -m benchmarks.ann_benchmarks --sizes 100000,1000000 --nprobe 4,8,16
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+# applies the thread budget (BLAS env vars, OpenCV threads) before NumPy/OpenCV load
+from src.utils.config import config  # noqa: F401  isort: skip
+
+import numpy as np
+
+from src.modules.cam.ann_index import IVFIndex
+
+from .harness import BenchmarkRunner, compare_results, save_results
+
+
+def clustered_gallery(count: int, dim: int, identities: int, spread: float = 0.35, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((identities, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    gallery = np.empty((count, dim), dtype=np.float32)
+    chunk = 100000
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        labels = rng.integers(0, identities, n)
+        noise = rng.standard_normal((n, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+        rows = centers[labels] + noise
+        gallery[start:start + n] = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    return gallery
+
+
+def exact_top_k(gallery: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    sims = gallery @ query
+    top = np.argpartition(-sims, k - 1)[:k]
+    return top[np.argsort(-sims[top])]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Busqueda exacta vs IVF aproximada")
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--dim", type=int, default=128, help="Dimensiones (tras la proyeccion)")
+    parser.add_argument("--nprobe", default="4,8,16,32")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="Consultas para medir recall")
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    runner = BenchmarkRunner(min_time=args.min_time)
+    rng = np.random.default_rng(42)
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        gallery = clustered_gallery(size, args.dim, identities=max(100, size // 50))
+        queries = gallery[rng.integers(0, size, args.queries)] + rng.standard_normal((args.queries, args.dim)).astype(np.float32) * 0.02
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        query = queries[0]
+
+        runner.run("search[exact]", lambda: exact_top_k(gallery, query, args.k), gallery=size, dim=args.dim, alloc_iterations=1)
+        truth = [set(exact_top_k(gallery, q, args.k).tolist()) for q in queries]
+
+        index = IVFIndex(args.dim, train_size=size)
+        started = time.perf_counter()
+        sample = gallery[rng.choice(size, size=min(size, 50000), replace=False)]
+        index.train(sample)
+        # incremental inserts in batches, as a growing site would see them
+        for start in range(0, size, 50000):
+            index.add(gallery[start:start + 50000], np.arange(start, min(size, start + 50000)))
+        build_s = time.perf_counter() - started
+        print(f"IVF nlist={index.nlist} construido en {build_s:.1f} s")
+
+        for nprobe in [int(n) for n in args.nprobe.split(",") if n.strip()]:
+            result = runner.run(
+                "search[ivf]",
+                lambda: index.search(query, k=args.k, nprobe=nprobe),
+                gallery=size,
+                dim=args.dim,
+                nprobe=nprobe,
+                alloc_iterations=1,
+            )
+            hits = sum(len(t & set(index.search(q, k=args.k, nprobe=nprobe)[0].tolist())) for q, t in zip(queries, truth))
+            result["recall_at_k"] = hits / float(len(queries) * args.k)
+            result["nlist"] = index.nlist
+            result["build_seconds"] = build_s
+            print(f"    recall@{args.k} = {result['recall_at_k']:.3f}")
+
+    output = save_results("ann", runner.results, args.output)
+    if args.compare:
+        return 0 if compare_results(runner.results, args.compare, args.tolerance) else 1
+    return 0 if output else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Bytes per face and encode/decode time of the saved-crop encodings.
+
+Crops are cut from synthetic frames (or ``--frames`` like ``face_benchmarks``)
+and encoded with every format/quality/grayscale combination; each result also
+records the mean encoded size and the PSNR against the original crop::
+
+    python -m benchmarks.encoding_benchmarks
+    python -m benchmarks.encoding_benchmarks --formats jpeg,webp --qualities 70,85,95
+    python -m benchmarks.encoding_benchmarks --frames data/session.cfrec --size 160
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List
+
+# applies the thread budget (BLAS env vars, OpenCV threads) before NumPy/OpenCV load
+from src.utils.config import config  # noqa: F401  isort: skip
+
+import cv2
+import numpy as np
+
+from src.modules.cam.image_encoding import ImageEncoding, decode, normalize_format
+
+from .face_benchmarks import FACE_BOX, load_frames, synthetic_frame
+from .harness import BenchmarkRunner, compare_results, save_results
+
+
+def psnr(original: np.ndarray, decoded: np.ndarray) -> float:
+    if original.ndim == 3 and decoded.ndim == 3 and original.shape == decoded.shape:
+        return float(cv2.PSNR(original, decoded))
+    gray = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY) if original.ndim == 3 else original
+    other = cv2.cvtColor(decoded, cv2.COLOR_BGR2GRAY) if decoded.ndim == 3 else decoded
+    return float(cv2.PSNR(gray, other))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Tamano y tiempo de codificacion de los recortes guardados")
+    parser.add_argument("--frames", type=Path, help="Directorio con frames (jpg/png) o grabacion .cfrec")
+    parser.add_argument("--formats", default="jpeg,webp,png")
+    parser.add_argument("--qualities", default="60,75,85,95", help="Calidad 0-100 (en png: nivel de compresion)")
+    parser.add_argument("--size", type=int, default=0, help="Lado del recorte (0 = tamano original)")
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.frames:
+        frames = load_frames(args.frames)
+        if not frames:
+            print(f"No se encontraron frames en {args.frames}")
+            return 2
+        source = str(args.frames)
+    else:
+        frames = [synthetic_frame(seed) for seed in range(8)]
+        source = "synthetic"
+    x, y, w, h = FACE_BOX
+    crops = [frame[y:y + h, x:x + w].copy() for frame in frames]
+    if args.size:
+        crops = [cv2.resize(crop, (args.size, args.size)) for crop in crops]
+
+    runner = BenchmarkRunner(min_time=args.min_time)
+    formats = [normalize_format(f) for f in args.formats.split(",") if f.strip()]
+    qualities = [int(q) for q in args.qualities.split(",") if q.strip()]
+    for fmt in formats:
+        for quality in qualities:
+            for grayscale in (False, True):
+                encoding = ImageEncoding(fmt, quality, grayscale)
+                encoded = [encoding.encode(crop) for crop in crops]
+                if any(data is None for data in encoded):
+                    print(f"{fmt} no soportado por esta build de OpenCV")
+                    break
+                tags = dict(format=fmt, quality=quality, grayscale=grayscale, source=source)
+                counter = {"i": 0}
+
+                def encode_once():
+                    counter["i"] += 1
+                    return encoding.encode(crops[counter["i"] % len(crops)])
+
+                def decode_once():
+                    counter["i"] += 1
+                    return decode(encoded[counter["i"] % len(encoded)])
+
+                result = runner.run("encode_face", encode_once, **tags)
+                result["bytes_per_face"] = float(np.mean([len(data) for data in encoded]))
+                result["psnr_db"] = float(np.mean([psnr(c, decode(d)) for c, d in zip(crops, encoded)]))
+                runner.run("decode_face", decode_once, **tags)
+                print(f"{'':<55} {result['bytes_per_face']:>12.0f} B/cara {result['psnr_db']:>8.2f} dB")
+
+    output = save_results("encoding", runner.results, args.output)
+    if args.compare:
+        return 0 if compare_results(runner.results, args.compare, args.tolerance) else 1
+    return 0 if output else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
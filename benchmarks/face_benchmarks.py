@@ -0,0 +1,234 @@
+"""Micro-benchmarks for FaceRecognition and FaceStorage hot paths.
+
+Runs offline on synthetic frames, or on recorded frames with ``--frames DIR``
+(jpg/png) or ``--frames FILE.cfrec`` (see ``src.modules.cam.capture_source``)::
+
+    python -m benchmarks.face_benchmarks
+    python -m benchmarks.face_benchmarks --frames data/recorded --sizes 100,10000
+    python -m benchmarks.face_benchmarks --frames data/session.cfrec
+    python -m benchmarks.face_benchmarks --compare benchmarks/results/face_20250101_120000.json
+"""
+
+import argparse
+import logging
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+# applies the thread budget (BLAS env vars, OpenCV threads) before NumPy/OpenCV load
+from src.utils.config import config  # noqa: F401  isort: skip
+
+import cv2
+import numpy as np
+
+from src.modules.cam.capture_source import ReplaySource
+from src.modules.cam.embedding_codec import EmbeddingCodec, fit_codec
+from src.modules.cam.face_recognition import FaceRecognition
+from src.modules.cam.face_storage import FaceStorage
+
+from .harness import BenchmarkRunner, compare_results, save_results
+
+FACE_BOX = (220, 140, 200, 200)
+
+
+def synthetic_frame(seed: int = 0, width: int = 640, height: int = 480) -> np.ndarray:
+    """Textured background with a face-like ellipse (eyes, mouth) at FACE_BOX."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 180, size=(height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (7, 7), 0)
+    x, y, w, h = FACE_BOX
+    cx, cy = x + w // 2, y + h // 2
+    cv2.ellipse(frame, (cx, cy), (w // 2 - 10, h // 2), 0, 0, 360, (150, 170, 200), -1)
+    for ex in (cx - w // 5, cx + w // 5):
+        cv2.circle(frame, (ex, cy - h // 8), 12, (40, 40, 40), -1)
+        cv2.circle(frame, (ex, cy - h // 8), 4, (250, 250, 250), -1)
+    cv2.ellipse(frame, (cx, cy + h // 4), (w // 6, h // 14), 0, 0, 180, (60, 40, 120), -1)
+    return frame
+
+
+def load_frames(frames_dir: Path, limit: int = 50) -> List[np.ndarray]:
+    frames = []
+    if frames_dir.is_file():
+        source = ReplaySource(frames_dir, pace="fast")
+        while len(frames) < limit:
+            ok, frame = source.read()
+            if not ok:
+                break
+            frames.append(frame)
+        source.release()
+        return frames
+    for path in sorted(frames_dir.iterdir()):
+        if path.suffix.lower() not in (".jpg", ".jpeg", ".png"):
+            continue
+        img = cv2.imread(str(path))
+        if img is not None:
+            frames.append(img)
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+def quality_inputs(recognizer: FaceRecognition, frames: List[np.ndarray]) -> List[Tuple[np.ndarray, Tuple[int, int, int, int]]]:
+    """(frame, box) pairs that pass ``check_face_quality``, so ``save_face`` reaches the disk write.
+
+    The synthetic frames do not fool the eye cascade; with ``--frames`` the
+    detected faces of each recorded frame are tried as well.
+    """
+    inputs = []
+    for frame in frames:
+        for box in [FACE_BOX] + list(recognizer.detect_faces(frame)):
+            ok, _message = recognizer.check_face_quality(frame, tuple(int(v) for v in box))
+            if ok:
+                inputs.append((frame, tuple(int(v) for v in box)))
+    return inputs
+
+
+def random_embeddings(count: int, dim: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    emb = rng.standard_normal((count, dim)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb
+
+
+def make_storage(recognizer: FaceRecognition, save_dir: Path) -> FaceStorage:
+    storage = FaceStorage(face_recognizer=recognizer, save_dir=save_dir)
+    storage.min_detection_interval = timedelta(0)
+    return storage
+
+
+def fill_gallery(storage: FaceStorage, size: int, pool: np.ndarray) -> None:
+    """Gallery of ``size`` recent faces; rows are reused from ``pool`` to bound memory."""
+    now = datetime.now()
+    records = [storage._make_record(row, now, None, None) for row in pool[:min(size, len(pool))]]
+    storage.faces = [dict(records[i % len(records)]) for i in range(size)] if records else []
+    storage.rebuild_search_index()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de FaceRecognition / FaceStorage")
+    parser.add_argument("--frames", type=Path, help="Directorio con frames (jpg/png) o grabacion .cfrec")
+    parser.add_argument("--sizes", default="100,10000,100000", help="Tamanos de galeria para find_similar_face")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Segundos minimos por benchmark")
+    parser.add_argument("--skip-dnn", action="store_true", help="No cargar el modelo DNN (solo cascade)")
+    parser.add_argument("--codec-components", type=int, default=128, help="Dimensiones de la proyeccion (0 = omitir)")
+    parser.add_argument("--output", type=Path, help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", type=Path, help="JSON previo para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.frames:
+        frames = load_frames(args.frames)
+        if not frames:
+            print(f"No se encontraron frames en {args.frames}")
+            return 2
+        source = str(args.frames)
+    else:
+        frames = [synthetic_frame(seed) for seed in range(8)]
+        source = "synthetic"
+    frame = frames[0]
+    face_coords: Tuple[int, int, int, int] = FACE_BOX
+
+    recognizer = FaceRecognition(load_dnn=not args.skip_dnn)
+    runner = BenchmarkRunner(min_time=args.min_time)
+    failed = False
+
+    # --- FaceRecognition ---
+    if recognizer.face_net is not None:
+        runner.run("detect_faces[dnn]", lambda: recognizer.detect_faces(frame), source=source)
+        batch = (frames * 8)[:8]
+        runner.run("detect_faces_batch[dnn]", lambda: recognizer.detect_faces_batch(batch), source=source, batch=len(batch))
+    runner.run("detect_faces[cascade]", lambda: recognizer._detect_faces_cascade(frame), source=source)
+    runner.run("check_face_quality", lambda: recognizer.check_face_quality(frame, face_coords), source=source)
+
+    x, y, w, h = face_coords
+    face_img = cv2.resize(frame[y:y + h, x:x + w], (112, 112))
+    runner.run("get_face_embedding", lambda: recognizer.get_face_embedding(face_img))
+
+    emb = recognizer.get_face_embedding(face_img)
+    dim = int(emb.shape[0])
+    other = random_embeddings(1, dim)[0]
+    runner.run("compare_faces", lambda: recognizer.compare_faces(emb, other), dim=dim)
+
+    # --- FaceStorage ---
+    with tempfile.TemporaryDirectory(prefix="face_bench_") as tmp:
+        storage = make_storage(recognizer, Path(tmp))
+        pool = random_embeddings(1000, dim, seed=2)
+        query = random_embeddings(1, dim, seed=3)[0]
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+        for size in sizes:
+            fill_gallery(storage, size, pool)
+            runner.run(
+                "find_similar_face",
+                lambda: storage.find_similar_face(query),
+                gallery=size,
+                dim=dim,
+            )
+
+        if args.codec_components:
+            fitted, _retained = fit_codec(pool, args.codec_components)
+            for mode in ("float16", "int8"):
+                storage.codec = EmbeddingCodec(fitted.components, storage=mode)
+                for size in sizes:
+                    fill_gallery(storage, size, pool)
+                    runner.run(
+                        "find_similar_face",
+                        lambda: storage.find_similar_face(query),
+                        gallery=size,
+                        dim=fitted.dim,
+                        storage=mode,
+                    )
+            storage.codec = None
+
+        fill_gallery(storage, 0, pool)
+        saves = random_embeddings(256, dim, seed=4)
+        counter = {"i": 0}
+
+        def reset_dedup():
+            # every call must take the full save path, not stop at a duplicate
+            storage.faces.clear()
+            storage.rebuild_search_index()
+            if storage.hash_cache is not None:
+                storage.hash_cache.clear()
+
+        inputs = quality_inputs(recognizer, frames)
+        saved = {"calls": 0, "ok": 0}
+
+        def save_face_once():
+            i = counter["i"] = counter["i"] + 1
+            reset_dedup()
+            frame_in, box = inputs[i % len(inputs)]
+            saved["calls"] += 1
+            saved["ok"] += bool(storage.save_face(frame_in, box))
+
+        def save_analyzed_once():
+            i = counter["i"] = counter["i"] + 1
+            if len(storage.faces) > 100:
+                # keep the dedup window at a steady-state size across iterations
+                reset_dedup()
+            storage.save_analyzed_face(face_img, saves[i % len(saves)], "Face quality OK")
+
+        if not inputs:
+            print(f"save_face omitido: ningun rostro de {source} supera check_face_quality (use --frames con rostros reales)")
+        else:
+            result = runner.run("save_face", save_face_once, source=source, faces=len(inputs))
+            result["saved_ratio"] = saved["ok"] / max(1, saved["calls"])
+            if saved["ok"] == 0:
+                # only the rejection path was timed: the figure is meaningless
+                result["valid"] = False
+                failed = True
+                print("save_face: ningun rostro llego a guardarse; resultado invalido")
+        runner.run("save_analyzed_face", save_analyzed_once, dim=dim)
+        storage.faces = []
+
+    output = save_results("face", runner.results, args.output)
+    if args.compare and not compare_results(runner.results, args.compare, args.tolerance):
+        return 1
+    return 0 if output and not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Tiny timing/allocation harness shared by the benchmark scripts."""
+
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class BenchmarkRunner:
+    """Run callables for a minimum time and collect ops/sec plus allocation figures."""
+
+    def __init__(self, min_time: float = 1.0, min_iterations: int = 3, max_iterations: int = 100000):
+        self.min_time = min_time
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+        self.results: List[Dict[str, Any]] = []
+
+    def run(self, name: str, func: Callable[[], Any], alloc_iterations: int = 3, **params: Any) -> Dict[str, Any]:
+        func()  # warm-up (lazy initialisation, caches)
+        gc.collect()
+
+        iterations = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while iterations < self.max_iterations and (iterations < self.min_iterations or elapsed < self.min_time):
+            func()
+            iterations += 1
+            elapsed = time.perf_counter() - start
+
+        # separate pass so tracemalloc overhead does not skew the timing
+        allocations, peak_kb = self._allocations(func, alloc_iterations)
+
+        result = {
+            "name": name,
+            "params": params,
+            "iterations": iterations,
+            "ops_per_sec": iterations / elapsed if elapsed else 0.0,
+            "mean_ms": elapsed / iterations * 1000.0,
+            "peak_alloc_kb": peak_kb,
+            "allocations_per_op": allocations,
+        }
+        self.results.append(result)
+        label = f"{name} {params}" if params else name
+        print(
+            f"{label:<55} {result['ops_per_sec']:>12.1f} ops/s {result['mean_ms']:>10.3f} ms"
+            f"  {allocations:>9.1f} allocs/op  peak {peak_kb:>9.1f} KiB"
+        )
+        return result
+
+    @staticmethod
+    def _allocations(func: Callable[[], Any], iterations: int) -> Tuple[float, float]:
+        """(memory blocks allocated per call, peak KiB above the starting point).
+
+        Each call is bracketed by tracemalloc snapshots and the new blocks are
+        counted per allocation site, so frees elsewhere cannot cancel them out.
+        Temporaries created and freed within the call are not visible to a
+        snapshot diff; ``peak_alloc_kb`` covers those.
+        """
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        iterations = max(1, iterations)
+        blocks = 0
+        peak = 0
+        gc_enabled = gc.isenabled()
+        gc.disable()  # a collection in the middle of a call would hide its garbage
+        tracemalloc.start()
+        try:
+            for _ in range(iterations):
+                before = tracemalloc.take_snapshot().filter_traces(ignore)
+                tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+                func()
+                _, top = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot().filter_traces(ignore)
+                peak = max(peak, top - base)
+                blocks += sum(stat.count_diff for stat in after.compare_to(before, "lineno") if stat.count_diff > 0)
+                del before, after
+        finally:
+            tracemalloc.stop()
+            if gc_enabled:
+                gc.enable()
+        return blocks / float(iterations), peak / 1024.0
+
+
+def environment() -> Dict[str, Any]:
+    info: Dict[str, Any] = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+    try:
+        import cv2
+        import numpy as np
+
+        info["opencv"] = cv2.__version__
+        info["opencv_threads"] = cv2.getNumThreads()
+        info["numpy"] = np.__version__
+    except Exception:
+        pass
+    return info
+
+
+def save_results(suite: str, results: List[Dict[str, Any]], output: Optional[Path] = None) -> Path:
+    output = output or RESULTS_DIR / f"{suite}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"suite": suite, "timestamp": datetime.now().isoformat(), "environment": environment(), "results": results}
+    output.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    print(f"\nResultados guardados en {output}")
+    return output
+
+
+def compare_results(current: List[Dict[str, Any]], baseline_path: Path, tolerance: float = 0.15) -> bool:
+    """Print speed ratios against a previous JSON run; False if anything regressed past tolerance."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+
+    def key(r: Dict[str, Any]) -> str:
+        return f"{r['name']} {json.dumps(r.get('params', {}), sort_keys=True)}"
+
+    previous = {key(r): r for r in baseline.get("results", [])}
+    ok = True
+    print(f"\nComparacion contra {baseline_path} (tolerancia {tolerance:.0%})")
+    for result in current:
+        old = previous.get(key(result))
+        if not old or not old.get("ops_per_sec"):
+            continue
+        ratio = result["ops_per_sec"] / old["ops_per_sec"]
+        flag = ""
+        if ratio < 1.0 - tolerance:
+            flag = "  <-- REGRESION"
+            ok = False
+        print(f"{key(result):<70} x{ratio:5.2f}{flag}")
+    return ok
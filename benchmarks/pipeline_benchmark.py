@@ -0,0 +1,87 @@
+"""End-to-end throughput of CameraPipeline over a recorded session.
+
+Replays a ``.cfrec`` recording (``python -m src.modules.cam.capture_source record``)
+through the same capture -> analysis -> publish stages the app uses, without a
+camera or UI::
+
+    python -m benchmarks.pipeline_benchmark data/session.cfrec
+    python -m benchmarks.pipeline_benchmark data/session.cfrec --pace original
+    python -m benchmarks.pipeline_benchmark data/session.cfrec --compare benchmarks/results/pipeline_<fecha>.json
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# applies the thread budget (BLAS env vars, OpenCV threads) before NumPy/OpenCV load
+from src.utils.config import config  # noqa: F401  isort: skip
+from src.modules.cam.capture_source import ReplaySource
+from src.modules.cam.face_recognition import FaceRecognition
+from src.modules.cam.face_storage import FaceStorage
+from src.modules.cam.pipeline import CameraPipeline
+from src.modules.cam.pipeline_stats import stats
+
+from .harness import compare_results, save_results
+
+
+def run_replay(recording: Path, pace: str, save_dir: Path, load_dnn: bool = True) -> Dict[str, Any]:
+    source = ReplaySource(recording, pace=pace)
+    storage = FaceStorage(face_recognizer=FaceRecognition(load_dnn=load_dnn), save_dir=save_dir)
+    events = {"frame": 0, "detection": 0}
+
+    def publish(event: Dict[str, Any]) -> None:
+        if event["type"] in events:
+            events[event["type"]] += 1
+
+    pipeline = CameraPipeline(source, storage, publish)
+    start = time.perf_counter()
+    asyncio.run(pipeline.run())
+    elapsed = time.perf_counter() - start
+
+    frames = source.frames_read
+    stages = stats.snapshot()["stages"]
+    return {
+        "name": "pipeline_replay",
+        "params": {"recording": recording.name, "pace": pace, "dnn": load_dnn},
+        "iterations": frames,
+        "ops_per_sec": frames / elapsed if elapsed else 0.0,
+        "mean_ms": elapsed / frames * 1000.0 if frames else 0.0,
+        "frames_published": events["frame"],
+        "detections": events["detection"],
+        "faces_saved": stats.counter_totals().get("faces_saved", 0),
+        "stage_p95_ms": {name: values["p95_ms"] for name, values in stages.items()},
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end del pipeline sobre una grabacion")
+    parser.add_argument("recording", type=Path, help="Archivo .cfrec")
+    parser.add_argument("--pace", choices=("fast", "original"), default="fast")
+    parser.add_argument("--skip-dnn", action="store_true", help="No cargar el modelo DNN (solo cascade)")
+    parser.add_argument("--output", type=Path, help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", type=Path, help="JSON previo para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="pipeline_bench_") as tmp:
+        result = run_replay(args.recording, args.pace, Path(tmp), load_dnn=not args.skip_dnn)
+    print(
+        f"{result['iterations']} frames en {result['iterations'] * result['mean_ms'] / 1000.0:.2f} s: "
+        f"{result['ops_per_sec']:.1f} fps, {result['faces_saved']} caras guardadas"
+    )
+
+    output = save_results("pipeline", [result], args.output)
+    if args.compare:
+        return 0 if compare_results([result], args.compare, args.tolerance) else 1
+    return 0 if output else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Headless capture daemon: camera -> detect -> quality -> dedup -> save, no UI.
+
+Uses the same config and capture service as the Flet app but never imports Flet,
+never encodes previews and logs pipeline statistics instead::
+
+    python -m src.headless
+    python -m src.headless --source data/session.cfrec --stats-interval 10
+
+SIGTERM / SIGINT (Ctrl+C) stop the pipeline, release the camera and shut
+down the analysis pool (unlinking its shared memory) cleanly;
+on POSIX, SIGUSR1 starts a profiling window (see ``profile_seconds``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import sys
+from typing import Any, Dict, List, Optional
+
+from src.modules.cam.analysis_pool import close_shared_analysis_pool
+from src.modules.cam.batch_inference import close_shared_scheduler
+from src.modules.cam.capture_service import get_capture_service
+from src.modules.cam.face_layout import start_retention_sweeper
+from src.modules.cam.metrics_server import (
+    process_memory_bytes,
+    process_peak_memory_bytes,
+    start_metrics_server,
+    stop_metrics_server,
+)
+from src.modules.cam.pipeline_stats import stats
+from src.modules.cam.profiling import profiler
+from src.utils.config import config
+from src.utils.thread_budget import describe_allocation
+
+SUBSCRIBER_KEY = "headless"
+
+
+def _install_signal_handlers(loop: asyncio.AbstractEventLoop, stop: asyncio.Event) -> None:
+    handlers = {signal.SIGINT: stop.set, signal.SIGTERM: stop.set}
+    if hasattr(signal, "SIGUSR1"):
+        handlers[signal.SIGUSR1] = profiler.request
+    for sig, handler in handlers.items():
+        try:
+            loop.add_signal_handler(sig, handler)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops have no add_signal_handler
+            signal.signal(sig, lambda *_args, h=handler: loop.call_soon_threadsafe(h))
+
+
+def _log_event(event: Dict[str, Any], stop: asyncio.Event) -> None:
+    kind = event.get("type")
+    if kind == "detection":
+        if event.get("saved"):
+            logging.info(event.get("message", ""))
+        else:
+            logging.debug(event.get("message", ""))
+    elif kind == "status":
+        logging.info("Estado: %s", event.get("message", ""))
+        if not event.get("running", False):
+            # source ended (replay/video finished) or the camera failed
+            stop.set()
+
+
+async def _log_stats_periodically(stop: asyncio.Event) -> None:
+    # the pipeline only logs on published frames; keep logging while it is stalled too
+    while not stop.is_set():
+        stats.log_if_due()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(source: Optional[str] = None, duration: float = 0.0) -> int:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    _install_signal_handlers(loop, stop)
+
+    service = get_capture_service()
+    service.preview = False
+    if source is not None:
+        service.source = source
+
+    if not service.subscribe(SUBSCRIBER_KEY, lambda event: _log_event(event, stop), loop=loop):
+        logging.error("No se pudo iniciar la captura: %s", service.last_status)
+        return 1
+
+    stats_task = asyncio.create_task(_log_stats_periodically(stop))
+    try:
+        if duration > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=duration)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await stop.wait()
+    finally:
+        stop.set()
+        await stats_task
+        service.unsubscribe(SUBSCRIBER_KEY)
+        if not await loop.run_in_executor(None, service.wait_stopped, 5.0):
+            logging.warning("La captura no se detuvo en 5 s")
+
+    snapshot = stats.snapshot()
+    snapshot["rss_bytes"] = process_memory_bytes()
+    snapshot["peak_rss_bytes"] = process_peak_memory_bytes()
+    logging.info("pipeline_stats_final %s", json.dumps(snapshot, sort_keys=True))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Captura y deteccion de rostros sin interfaz grafica")
+    parser.add_argument("--source", help="Indice de camara, URL, video o grabacion .cfrec (por defecto config)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Segundos de ejecucion (0 = hasta SIGTERM)")
+    parser.add_argument("--stats-interval", type=float, help="Segundos entre lineas de estadisticas")
+    parser.add_argument("--metrics-port", type=int, help="Puerto del endpoint Prometheus (0 = desactivado)")
+    parser.add_argument("--log-level", default=getattr(config, "log_level", "INFO"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger().setLevel(args.log_level.upper())
+    if args.stats_interval is not None:
+        config.stats_log_interval_seconds = args.stats_interval
+    config.stats_overlay = False
+
+    logging.info("Modo headless\n%s", describe_allocation())
+    start_metrics_server(port=args.metrics_port)
+    start_retention_sweeper()
+    try:
+        return asyncio.run(run(args.source, args.duration))
+    finally:
+        # worker processes and the FrameRing's /dev/shm segment outlive us otherwise
+        close_shared_analysis_pool()
+        close_shared_scheduler()
+        stop_metrics_server()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,8 +6,13 @@ from typing import Optional
 
 import flet as ft
 
+from src.modules.cam.camera_local import set_view_visible
+from src.modules.cam.face_layout import start_retention_sweeper
+from src.modules.cam.metrics_server import start_metrics_server
+from src.modules.cam.profiling import profiler
 from src.utils.config import config
 from src.utils.system_tray import setup_system_tray, stop_system_tray
+from src.utils.thread_budget import describe_allocation
 from src.views.camera_view import camera_view
 from src.views.enroll_view import enroll_view
 from src.views.home_view import home_view
@@ -27,10 +32,16 @@ def print_config() -> None:
     print("---------------------")
     for key, value in vars(config).items():
         print(f"{key}: {value}")
+    print()
+    print(describe_allocation())
 
 
 def main(page: ft.Page) -> None:
     logging.info("Inicializando interfaz principal Flet.")
+    # no-op unless metrics_port is configured; safe to call for every session
+    start_metrics_server()
+    # no-op unless a retention_max_* limit is configured
+    start_retention_sweeper()
 
     page.title = "ControlFlow Camera"
     page.padding = 0
@@ -55,6 +66,7 @@ def main(page: ft.Page) -> None:
         logging.info("System tray: restaurar ventana principal.")
         page.window.minimized = False
         page.window.visible = True
+        set_view_visible(page, True)
         try:
             page.window.to_front()
         except Exception:
@@ -65,6 +77,8 @@ def main(page: ft.Page) -> None:
         logging.info("Interceptando cierre/minimizado: manteniendo aplicacion en system tray.")
         page.window.visible = False
         page.window.minimized = True
+        # nobody is looking: the pipeline keeps detecting but stops drawing the preview
+        set_view_visible(page, False)
         if show_notification:
             page.snack_bar = ft.SnackBar(
                 content=ft.Text("ControlFlow Camera sigue activo en la bandeja del sistema."),
@@ -93,6 +107,16 @@ def main(page: ft.Page) -> None:
         dialog.open = True
         page.update()
 
+    def start_profiling() -> None:
+        seconds = float(getattr(config, "profile_seconds", 30))
+        if profiler.request(seconds):
+            message = f"Perfilando pipeline {seconds:.0f} s; reporte en {config.dir_logs}"
+        else:
+            message = "Ya hay un perfilado en curso."
+        page.snack_bar = ft.SnackBar(content=ft.Text(message), duration=3000)
+        page.snack_bar.open = True
+        page.update()
+
     def exit_application() -> None:
         logging.info("Saliendo de la aplicacion por accion del system tray.")
 
@@ -141,6 +165,7 @@ def main(page: ft.Page) -> None:
 
     def change_tab(e: ft.ControlEvent) -> None:
         idx = e.control.selected_index
+        set_view_visible(page, idx == 1, reason="nav")
         match idx:
             case 0:
                 content.content = home_view(page)
@@ -163,6 +188,7 @@ def main(page: ft.Page) -> None:
             ft.NavigationRailDestination(icon=ft.Icons.CAMERA, label="Camara"),
             ft.NavigationRailDestination(icon=ft.Icons.LIST, label="Detecciones"),
             ft.NavigationRailDestination(icon=ft.Icons.SETTINGS, label="Settings"),
+            ft.NavigationRailDestination(icon=ft.Icons.PERSON_ADD, label="Personas"),
         ],
         on_change=change_tab,
     )
@@ -186,6 +212,8 @@ def main(page: ft.Page) -> None:
             show_window()
         elif action == "about":
             show_about_dialog()
+        elif action == "profile":
+            start_profiling()
         elif action == "exit":
             exit_application()
 
@@ -197,6 +225,7 @@ def main(page: ft.Page) -> None:
             on_show=lambda: page.pubsub.send_all({"source": "tray", "action": "show"}),
             on_about=lambda: page.pubsub.send_all({"source": "tray", "action": "about"}),
             on_exit=lambda: page.pubsub.send_all({"source": "tray", "action": "exit"}),
+            on_profile=lambda: page.pubsub.send_all({"source": "tray", "action": "profile"}),
         )
         if tray_icon is None:
             logging.info("System tray no disponible (ver mensajes anteriores).")
@@ -1,4 +1,19 @@
-"""Camera-related modules and helper utilities."""
+"""Camera-related modules and helper utilities.
 
-from .camera_local import start_camera  # noqa: F401
-from .camera_remote import upload_image  # noqa: F401
+The Flet entry points are imported lazily so headless code (``src.headless``,
+benchmarks, CLIs) can use the capture and face modules without loading the UI.
+"""
+
+__all__ = ["start_camera", "upload_image"]
+
+
+def __getattr__(name):
+    if name == "start_camera":
+        from .camera_local import start_camera
+
+        return start_camera
+    if name == "upload_image":
+        from .camera_remote import upload_image
+
+        return upload_image
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,247 @@
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+from src.utils.thread_budget import apply_worker_budget
+
+from .face_recognition import FaceRecognition
+from .pipeline_stats import stats
+
+# Quality verdicts travel between processes as uint8 codes instead of strings.
+VERDICTS: Tuple[str, ...] = (
+    "Face quality OK",
+    "Face too small",
+    "Face too close to frame borders",
+    "Face not properly aligned",
+    "Eyes not clearly visible",
+    "Image too dark",
+    "Image too bright",
+    "Low contrast",
+    "Error analyzing face",
+    "Error processing face",
+    "Recent duplicate",
+)
+VERDICT_OK = 0
+VERDICT_DUPLICATE = VERDICTS.index("Recent duplicate")
+_VERDICT_CODES = {message: code for code, message in enumerate(VERDICTS)}
+_VERDICT_ERROR = _VERDICT_CODES["Error processing face"]
+
+FACE_SIZE = 112
+
+
+def verdict_code(message: Optional[str]) -> int:
+    return _VERDICT_CODES.get(message or "", _VERDICT_ERROR)
+
+
+class AnalysisResult:
+    """Compact per-frame analysis output.
+
+    ``boxes`` is (N, 4) int32 and ``verdicts`` (N,) uint8 for every detected face.
+    ``embeddings`` (M, D) float32 and ``crops`` (M, 112, 112, 3) uint8 only hold the
+    M accepted faces, in the same order as they appear in ``boxes``.
+    """
+
+    __slots__ = ("boxes", "verdicts", "embeddings", "crops")
+
+    def __init__(self, boxes: np.ndarray, verdicts: np.ndarray, embeddings: np.ndarray, crops: np.ndarray):
+        self.boxes = boxes
+        self.verdicts = verdicts
+        self.embeddings = embeddings
+        self.crops = crops
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def faces(self) -> Iterator[Tuple[Tuple[int, int, int, int], Optional[np.ndarray], Optional[np.ndarray], str]]:
+        """Yield (coords, face_img, embedding, quality_message) like ``process_face``."""
+        accepted = 0
+        for box, code in zip(self.boxes, self.verdicts):
+            coords = tuple(int(v) for v in box)
+            if code == VERDICT_OK:
+                yield coords, self.crops[accepted], self.embeddings[accepted], VERDICTS[code]
+                accepted += 1
+            else:
+                yield coords, None, None, VERDICTS[code]
+
+
+def analyze_frame(
+    recognizer: FaceRecognition,
+    frame: np.ndarray,
+    detect: Optional[Callable[[np.ndarray], List[Tuple[int, int, int, int]]]] = None,
+    skip: Optional[Callable[[np.ndarray], bool]] = None,
+) -> AnalysisResult:
+    """Detect and process every face of a frame into an ``AnalysisResult``.
+
+    ``skip`` sees each accepted crop before its embedding is computed; crops it
+    flags (e.g. perceptual-hash duplicates) get the "Recent duplicate" verdict.
+    """
+    faces = (detect or recognizer.detect_faces)(frame)
+    boxes = np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+    verdicts = np.empty(len(boxes), dtype=np.uint8)
+    embeddings: List[np.ndarray] = []
+    crops: List[np.ndarray] = []
+    for i, coords in enumerate(boxes):
+        coords = tuple(int(v) for v in coords)
+        if skip is not None:
+            face_img, quality_message = recognizer.crop_face(frame, coords)
+            if face_img is not None and skip(face_img):
+                verdicts[i] = VERDICT_DUPLICATE
+                continue
+            embedding = None
+            if face_img is not None:
+                with stats.time("embedding"):
+                    embedding = recognizer.get_face_embedding(face_img)
+        else:
+            face_img, embedding, quality_message = recognizer.process_face(frame, coords)
+        if face_img is None or embedding is None:
+            verdicts[i] = verdict_code(quality_message) or _VERDICT_ERROR
+            continue
+        verdicts[i] = VERDICT_OK
+        embeddings.append(np.asarray(embedding, dtype=np.float32))
+        crops.append(face_img)
+    if embeddings:
+        emb = np.stack(embeddings)
+        crop_arr = np.stack(crops)
+    else:
+        emb = np.empty((0, 0), dtype=np.float32)
+        crop_arr = np.empty((0, FACE_SIZE, FACE_SIZE, 3), dtype=np.uint8)
+    return AnalysisResult(boxes, verdicts, emb, crop_arr)
+
+
+class FrameRing:
+    """Fixed set of frame slots in one ``SharedMemory`` block.
+
+    Producers block in ``acquire`` when every slot is in flight, which bounds
+    memory and applies backpressure to the capture side.
+    """
+
+    def __init__(self, slots: int, max_width: int, max_height: int):
+        self.slots = max(1, int(slots))
+        self.slot_bytes = int(max_width) * int(max_height) * 3
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for i in range(self.slots):
+            self._free.put(i)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def acquire(self, frame: np.ndarray, timeout: Optional[float] = None) -> int:
+        slot = self._free.get(timeout=timeout)
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        return slot
+
+    def free_slots(self) -> int:
+        return self._free.qsize()
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def close(self) -> None:
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception as e:
+            logging.debug(f"FrameRing: error releasing shared memory: {e}")
+
+
+# --- worker process side ---
+_worker_recognizer: Optional[FaceRecognition] = None
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_slot_bytes = 0
+
+
+def _init_worker(shm_name: str, slot_bytes: int) -> None:
+    """Load the models once per worker and attach to the frame ring."""
+    global _worker_recognizer, _worker_shm, _worker_slot_bytes
+    apply_worker_budget()
+    _worker_recognizer = FaceRecognition()
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_slot_bytes = slot_bytes
+
+
+def _analyze_slot(slot: int, shape: Tuple[int, ...], frame: Optional[np.ndarray] = None) -> AnalysisResult:
+    if frame is None:
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=_worker_shm.buf, offset=slot * _worker_slot_bytes)
+    return analyze_frame(_worker_recognizer, frame)
+
+
+class AnalysisPool:
+    """Process-pool analysis backend with worker-resident ``FaceRecognition`` models."""
+
+    def __init__(self, workers: Optional[int] = None, slots: Optional[int] = None):
+        if not workers:
+            workers = int(getattr(config, "analysis_workers", 0) or 0) or max(1, (os.cpu_count() or 2) - 1)
+        self.workers = workers
+        if not slots:
+            slots = int(getattr(config, "analysis_ring_slots", 0) or 0) or 2 * workers
+        max_w, max_h = getattr(config, "analysis_max_frame", None) or (1920, 1080)
+        self.ring = FrameRing(slots, max_w, max_h)
+        # spawn keeps workers identical on Windows and Linux and avoids forking OpenCV threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.ring.name, self.ring.slot_bytes),
+        )
+        logging.info(f"Analysis pool started with {workers} workers and {self.ring.slots} frame slots")
+
+    def submit(self, frame: np.ndarray) -> Future:
+        """Queue a BGR frame; the future resolves to an ``AnalysisResult``."""
+        if not self.ring.fits(frame):
+            # oversized frames are rare; pickle them instead of growing the ring
+            return self._executor.submit(_analyze_slot, -1, frame.shape, frame)
+        slot = self.ring.acquire(frame)
+        try:
+            future = self._executor.submit(_analyze_slot, slot, frame.shape)
+        except Exception:
+            self.ring.release(slot)
+            raise
+        future.add_done_callback(lambda _f, s=slot: self.ring.release(s))
+        return future
+
+    def analyze(self, frame: np.ndarray, timeout: Optional[float] = None) -> AnalysisResult:
+        return self.submit(frame).result(timeout=timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.ring.close()
+
+
+_shared_pool: Optional[AnalysisPool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_analysis_pool() -> Optional[AnalysisPool]:
+    """Return the process-wide pool when ``analysis_backend`` is ``"process"``, else None."""
+    global _shared_pool
+    if str(getattr(config, "analysis_backend", "thread")).lower() != "process":
+        return None
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = AnalysisPool()
+            ring = _shared_pool.ring
+            stats.register_gauge("analysis_ring_free_slots", "Free shared-memory frame slots", ring.free_slots)
+        return _shared_pool
+
+
+def close_shared_analysis_pool() -> None:
+    """Stop the process-wide pool, if one was started, and unlink its shared memory."""
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,189 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index for face embeddings.
+
+Vectors are assigned to the nearest of ``nlist`` spherical k-means centroids
+(sklearn ``MiniBatchKMeans`` on unit vectors); a query only scores the vectors of
+its ``nprobe`` closest lists, so lookups touch ~``nprobe / nlist`` of the
+gallery. ``nprobe`` trades recall for speed and can be changed per query.
+
+Until ``train_size`` vectors have been added the index is a single flat list
+(exact search); it then trains itself once and re-buckets what it holds.
+Inserts are always incremental: lists grow by doubling, nothing is rebuilt.
+"""
+
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_MIN_LIST_CAPACITY = 16
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class _InvertedList:
+    __slots__ = ("vectors", "ids", "size")
+
+    def __init__(self, dim: int, dtype: np.dtype):
+        self.vectors = np.empty((_MIN_LIST_CAPACITY, dim), dtype=dtype)
+        self.ids = np.empty(_MIN_LIST_CAPACITY, dtype=np.int64)
+        self.size = 0
+
+    def append(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids))
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:self.size] = self.ids[:self.size]
+            self.ids = grown_ids
+        self.vectors[self.size:needed] = vectors
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+    def remove(self, ids: set) -> int:
+        keep = ~np.isin(self.ids[:self.size], list(ids))
+        kept = int(keep.sum())
+        removed = self.size - kept
+        if removed:
+            self.vectors[:kept] = self.vectors[:self.size][keep]
+            self.ids[:kept] = self.ids[:self.size][keep]
+            self.size = kept
+        return removed
+
+
+class IVFIndex:
+    """Cosine-similarity IVF index with incremental inserts and per-query ``nprobe``."""
+
+    def __init__(
+        self,
+        dim: int,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_size: int = 10000,
+        dtype: str = "float32",
+    ):
+        self.dim = int(dim)
+        self.nlist = nlist
+        self.nprobe = max(1, int(nprobe))
+        self.train_size = max(1, int(train_size))
+        self.dtype = np.dtype(dtype)
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[_InvertedList] = [_InvertedList(self.dim, self.dtype)]
+        self._count = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, sample: Optional[np.ndarray] = None) -> None:
+        """Fit the coarse quantizer (on ``sample`` or the vectors held) and re-bucket."""
+        from sklearn.cluster import MiniBatchKMeans
+
+        with self._lock:
+            held_vectors, held_ids = self._all()
+            data = _normalize(sample) if sample is not None else held_vectors.astype(np.float32)
+            if len(data) < 2:
+                return
+            # ~sqrt(N) lists balances centroid scoring against list scanning
+            nlist = self.nlist or int(max(1, min(4096, round(4 * np.sqrt(max(len(data), self.train_size))))))
+            nlist = min(nlist, len(data))
+            kmeans = MiniBatchKMeans(n_clusters=nlist, batch_size=4096, n_init=3, random_state=0)
+            kmeans.fit(data)
+            self.centroids = _normalize(kmeans.cluster_centers_)
+            self.nlist = nlist
+            self._lists = [_InvertedList(self.dim, self.dtype) for _ in range(nlist)]
+            self._count = 0
+            if len(held_ids):
+                self._insert(held_vectors.astype(np.float32), held_ids)
+
+    def add(self, vectors: np.ndarray, ids: Sequence[int]) -> None:
+        """Insert vectors (normalised here) under caller-chosen integer ids."""
+        vectors = _normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of {self.dim} dims, got {vectors.shape}")
+        with self._lock:
+            self._insert(vectors, ids)
+            if not self.trained and self._count >= self.train_size:
+                self.train()
+
+    def _insert(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if not self.trained:
+            self._lists[0].append(vectors.astype(self.dtype), ids)
+        else:
+            assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+            for list_no in np.unique(assignment):
+                mask = assignment == list_no
+                self._lists[list_no].append(vectors[mask].astype(self.dtype), ids[mask])
+        self._count += len(ids)
+
+    def remove(self, ids: Sequence[int]) -> int:
+        ids = set(int(i) for i in ids)
+        with self._lock:
+            removed = sum(lst.remove(ids) for lst in self._lists if lst.size)
+            self._count -= removed
+        return removed
+
+    def _all(self) -> Tuple[np.ndarray, np.ndarray]:
+        lists = [lst for lst in self._lists if lst.size]
+        if not lists:
+            return np.zeros((0, self.dim), dtype=self.dtype), np.zeros(0, dtype=np.int64)
+        return (
+            np.concatenate([lst.vectors[:lst.size] for lst in lists]),
+            np.concatenate([lst.ids[:lst.size] for lst in lists]),
+        )
+
+    def _candidates(self, query: np.ndarray, nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Similarities and ids of every vector in the probed lists."""
+        if self.trained:
+            nprobe = min(max(1, int(nprobe or self.nprobe)), len(self._lists))
+            coarse = self.centroids @ query
+            if nprobe < len(coarse):
+                probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+            else:
+                probe = np.arange(len(coarse))
+            lists = [self._lists[i] for i in probe if self._lists[i].size]
+        else:
+            lists = [lst for lst in self._lists if lst.size]
+        if not lists:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        # float16 products are not BLAS-accelerated: upcast one list at a time
+        sims = [lst.vectors[:lst.size].astype(np.float32, copy=False) @ query for lst in lists]
+        ids = [lst.ids[:lst.size] for lst in lists]
+        return np.concatenate(sims), np.concatenate(ids)
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-``k`` (ids, similarities), best first."""
+        q = _normalize(query)[0]
+        with self._lock:
+            sims, ids = self._candidates(q, nprobe)
+        if not len(ids):
+            return ids, sims
+        k = min(int(k), len(ids))
+        top = np.argpartition(-sims, k - 1)[:k]
+        order = top[np.argsort(-sims[top])]
+        return ids[order], sims[order]
+
+    def range_search(self, query: np.ndarray, threshold: float, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Every (id, similarity) above ``threshold`` among the probed lists, best first."""
+        q = _normalize(query)[0]
+        with self._lock:
+            sims, ids = self._candidates(q, nprobe)
+        mask = sims > threshold
+        ids, sims = ids[mask], sims[mask]
+        order = np.argsort(-sims)
+        return ids[order], sims[order]
+
+    def list_sizes(self) -> np.ndarray:
+        return np.array([lst.size for lst in self._lists], dtype=np.int64)
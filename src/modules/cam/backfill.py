@@ -0,0 +1,189 @@
+"""Resumable embedding backfill for face crops saved before the embedding index.
+
+Walks ``detected_faces_dir``, recomputes embeddings with
+``FaceRecognition.get_face_embedding`` in worker processes and appends them to
+the persistent ``EmbeddingIndex``. Every batch written to the index is a
+checkpoint: files already indexed, or recorded as unreadable in
+``backfill_failed.jsonl``, are skipped on the next run. The job lowers its own
+priority (nice / BELOW_NORMAL) and uses few workers by default, so the live
+camera pipeline keeps its throughput::
+
+    python -m src.modules.cam.backfill
+    python -m src.modules.cam.backfill --workers 2 --batch 128
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+from src.utils.thread_budget import apply_worker_budget, lower_process_priority
+
+from .embedding_index import EmbeddingIndex, shared_embedding_index
+from .face_recognition import FaceRecognition
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+_NAME_TIMESTAMP = re.compile(r"(\d{8}_\d{6})")
+
+_worker_recognizer: Optional[FaceRecognition] = None
+
+
+def _init_worker() -> None:
+    global _worker_recognizer
+    apply_worker_budget()
+    # the HOG embedding needs no detector
+    _worker_recognizer = FaceRecognition(load_dnn=False)
+
+
+def _embed_file(path: str) -> Tuple[str, Optional[np.ndarray], Optional[str]]:
+    img = cv2.imread(path)
+    if img is None:
+        return path, None, "unreadable image"
+    embedding = _worker_recognizer.get_face_embedding(img)
+    if embedding is None:
+        return path, None, "embedding failed"
+    return path, embedding.astype(np.float32), None
+
+
+def file_timestamp(path: Path) -> datetime:
+    """Capture time from ``face_YYYYmmdd_HHMMSS*.jpg`` names, else the file mtime."""
+    match = _NAME_TIMESTAMP.search(path.name)
+    if match:
+        try:
+            return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+def iter_images(directory: Path, skip_dir: Optional[Path] = None) -> Iterator[Path]:
+    """Image files below ``directory`` in a stable order, without loading them."""
+    for root, dirs, files in os.walk(directory):
+        root_path = Path(root)
+        dirs[:] = sorted(d for d in dirs if skip_dir is None or (root_path / d) != skip_dir)
+        for name in sorted(files):
+            if Path(name).suffix.lower() in IMAGE_SUFFIXES:
+                yield root_path / name
+
+
+class BackfillJob:
+    """Index every not-yet-indexed image of ``directory``."""
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        index: Optional[EmbeddingIndex] = None,
+        workers: Optional[int] = None,
+        batch_size: int = 64,
+    ):
+        self.directory = Path(directory or config.detected_faces_dir)
+        self.index = index or shared_embedding_index() or EmbeddingIndex()
+        # leave most cores to the live pipeline unless told otherwise
+        self.workers = max(1, int(workers or max(1, (os.cpu_count() or 2) // 4)))
+        self.batch_size = max(1, int(batch_size))
+        self.failed_path = self.index.directory / "backfill_failed.jsonl"
+        self.processed = 0
+        self.indexed = 0
+        self.failed = 0
+
+    def _done(self) -> Set[str]:
+        done = {os.path.abspath(f) for f in self.index.filenames()}
+        if self.failed_path.exists():
+            with open(self.failed_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        done.add(os.path.abspath(json.loads(line)["filename"]))
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+        return done
+
+    def pending(self) -> List[Path]:
+        done = self._done()
+        return [p for p in iter_images(self.directory, skip_dir=self.index.directory) if os.path.abspath(p) not in done]
+
+    def _checkpoint(self, results: List[Tuple[str, Optional[np.ndarray], Optional[str]]]) -> None:
+        records = []
+        failures = []
+        for path, embedding, error in results:
+            if embedding is None:
+                failures.append({"filename": path, "error": error, "at": datetime.now().isoformat()})
+            else:
+                records.append((embedding, path, file_timestamp(Path(path)), None))
+        self.index.add_many(records, source="backfill")
+        if failures:
+            with open(self.failed_path, "a", encoding="utf-8") as f:
+                for failure in failures:
+                    f.write(json.dumps(failure) + "\n")
+        self.indexed += len(records)
+        self.failed += len(failures)
+
+    def run(self, progress_interval: float = 10.0) -> int:
+        """Process every pending file; returns the number of files handled."""
+        todo = [str(p) for p in self.pending()]
+        if not todo:
+            logging.info("Backfill: nothing to do in %s", self.directory)
+            return 0
+        logging.info("Backfill: %s pending file(s) in %s, %s worker(s)", len(todo), self.directory, self.workers)
+        started = time.monotonic()
+        next_progress = started + progress_interval
+        batch: List[Tuple[str, Optional[np.ndarray], Optional[str]]] = []
+        ctx = mp.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker) as pool:
+                # map streams results in order; chunks keep IPC overhead low
+                for result in pool.map(_embed_file, todo, chunksize=16):
+                    batch.append(result)
+                    self.processed += 1
+                    if len(batch) >= self.batch_size:
+                        self._checkpoint(batch)
+                        batch = []
+                    if time.monotonic() >= next_progress:
+                        next_progress = time.monotonic() + progress_interval
+                        rate = self.processed / (time.monotonic() - started)
+                        logging.info("Backfill: %s/%s (%.1f img/s)", self.processed, len(todo), rate)
+        finally:
+            # keep whatever finished before an interruption
+            self._checkpoint(batch)
+        elapsed = time.monotonic() - started
+        logging.info(
+            "Backfill finished: %s indexed, %s failed in %.1f s", self.indexed, self.failed, elapsed
+        )
+        return self.processed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calcular embeddings de imagenes guardadas sin indexar")
+    parser.add_argument("--dir", type=Path, help="Carpeta de rostros (por defecto detected_faces_dir)")
+    parser.add_argument("--workers", type=int, help="Procesos de calculo (por defecto 1/4 de los nucleos)")
+    parser.add_argument("--batch", type=int, default=64, help="Resultados por checkpoint")
+    parser.add_argument("--normal-priority", action="store_true", help="No bajar la prioridad del proceso")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if not args.normal_priority:
+        # worker processes inherit the lowered priority
+        lower_process_priority()
+    index = EmbeddingIndex(args.dir / ".index") if args.dir else None
+    job = BackfillJob(args.dir, index=index, workers=args.workers, batch_size=args.batch)
+    try:
+        job.run()
+    except KeyboardInterrupt:
+        logging.info("Backfill interrupted after %s file(s); progress is saved", job.processed)
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
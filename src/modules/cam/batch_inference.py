@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+
+from .face_recognition import FaceRecognition, shared_recognizer
+from .pipeline_stats import stats
+
+Box = Tuple[int, int, int, int]
+
+
+class _PendingFrame:
+    __slots__ = ("frame", "future", "enqueued")
+
+    def __init__(self, frame: np.ndarray):
+        self.frame = frame
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class BatchInferenceScheduler:
+    """Gather frames from several callers and run them through one DNN forward pass.
+
+    A batch is dispatched as soon as ``batch_size`` frames are waiting or the oldest
+    pending frame has waited ``max_wait_ms``, whichever happens first.
+    """
+
+    def __init__(
+        self,
+        recognizer: Optional[FaceRecognition] = None,
+        batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+    ):
+        self.recognizer = recognizer or shared_recognizer()
+        self.batch_size = max(1, int(batch_size or getattr(config, "dnn_batch_size", 8)))
+        if max_wait_ms is None:
+            max_wait_ms = float(getattr(config, "dnn_batch_max_wait_ms", 15))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue: "queue.Queue[_PendingFrame]" = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._batches = 0
+        self._frames = 0
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="dnn-batch", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray) -> Future:
+        """Queue a frame for detection; the future resolves to its list of boxes."""
+        if self._stop.is_set():
+            raise RuntimeError("BatchInferenceScheduler is closed")
+        pending = _PendingFrame(frame)
+        self._queue.put(pending)
+        return pending.future
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def detect(self, frame: np.ndarray, timeout: Optional[float] = None) -> List[Box]:
+        """Blocking helper equivalent to ``FaceRecognition.detect_faces``."""
+        return self.submit(frame).result(timeout=timeout)
+
+    def close(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        # fail whatever is still waiting so callers don't block forever
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending.future.set_running_or_notify_cancel():
+                pending.future.set_exception(RuntimeError("BatchInferenceScheduler closed"))
+
+    def stats(self) -> Dict[str, float]:
+        """Throughput and latency figures since the scheduler started."""
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64)
+            batches, frames = self._batches, self._frames
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        result = {
+            "batches": batches,
+            "frames": frames,
+            "avg_batch_size": frames / batches if batches else 0.0,
+            "frames_per_second": frames / elapsed,
+            "pending": self.pending,
+            "latency_ms_avg": 0.0,
+            "latency_ms_p50": 0.0,
+            "latency_ms_p95": 0.0,
+        }
+        if latencies.size:
+            result["latency_ms_avg"] = float(latencies.mean() * 1000.0)
+            result["latency_ms_p50"] = float(np.percentile(latencies, 50) * 1000.0)
+            result["latency_ms_p95"] = float(np.percentile(latencies, 95) * 1000.0)
+        return result
+
+    def _collect_batch(self) -> List[_PendingFrame]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # deadline passed: still take whatever is already queued
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # callers that went away (pipeline stopped) cancelled their future: skip the frame
+        return [p for p in batch if p.future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                results = self.recognizer.detect_faces_batch([p.frame for p in batch])
+            except Exception as e:
+                logging.error(f"Batch inference failed: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            done = time.monotonic()
+            for pending, faces in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(faces)
+            with self._lock:
+                self._batches += 1
+                self._frames += len(batch)
+                self._latencies.extend(done - p.enqueued for p in batch)
+
+
+_shared_scheduler: Optional[BatchInferenceScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler() -> BatchInferenceScheduler:
+    """Process-wide scheduler so every camera/session batches into the same network."""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = BatchInferenceScheduler()
+            logging.info(
+                "Batch inference scheduler started (batch_size=%s, max_wait_ms=%.1f)",
+                _shared_scheduler.batch_size,
+                _shared_scheduler.max_wait * 1000.0,
+            )
+            scheduler = _shared_scheduler
+            stats.register_gauge("dnn_batch_pending", "Frames waiting for a DNN batch", lambda: scheduler.pending)
+        return _shared_scheduler
+
+
+def close_shared_scheduler() -> None:
+    """Stop the process-wide scheduler, if one was started."""
+    global _shared_scheduler
+    with _shared_lock:
+        scheduler, _shared_scheduler = _shared_scheduler, None
+    if scheduler is not None:
+        scheduler.close()
@@ -1,27 +1,37 @@
-import base64
-import cv2
 import flet as ft
 import logging
-import numpy as np
 import subprocess
 import sys
-import threading
-import time
-import traceback
-from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Hashable, Optional, Set
 
 from src.utils.config import config
 
-from .face_storage import FaceStorage
+from .capture_service import get_capture_service
 from .history_tab import HistoryTab
 
 
+# why each session's live view is off screen: "window" (hidden to the tray),
+# "nav" (another section of the app), "tab" (the history tab is selected)
+_hidden_reasons: Dict[Hashable, Set[str]] = {}
+
+
+def _session_key(page: ft.Page) -> Hashable:
+    return getattr(page, "session_id", None) or id(page)
+
+
+def set_view_visible(page: ft.Page, visible: bool, reason: str = "window") -> None:
+    """Tell the capture service whether this session's live preview is on screen."""
+    key = _session_key(page)
+    reasons = _hidden_reasons.setdefault(key, set())
+    if visible:
+        reasons.discard(reason)
+    else:
+        reasons.add(reason)
+    get_capture_service().set_visible(key, not reasons)
+
+
 def start_camera(page: ft.Page, target_container: Optional[ft.Control] = None):
-    # Global components
-    global img, status, info, faces_grid, running, cap, face_cascade, face_storage
-    
     # Initialize components
     img = ft.Image(
         width=800,
@@ -32,104 +42,55 @@ def start_camera(page: ft.Page, target_container: Optional[ft.Control] = None):
     
     status = ft.Text("Listo para iniciar", size=14)
     info = ft.Text("", size=12)
+    stats_overlay = ft.Text("", size=11, color="#616161", font_family="monospace", visible=False)
     
-    # Initialize faces grid and other state
-    faces_grid = ft.GridView(expand=True, runs_count=5, max_extent=150, child_aspect_ratio=0.8, spacing=10, run_spacing=10, padding=20)
-    running = {"flag": False}
-    cap = {"obj": None}
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    face_storage = FaceStorage()
+    # capture + analysis run once per process; this session only subscribes to it
+    service = get_capture_service()
+    session_key = _session_key(page)
     history = HistoryTab(page, images_dir=config.detected_faces_dir)
 
     # --- MOVER/DEFINIR las funciones antes de construir la UI ---
-    def frame_to_b64(frame: np.ndarray) -> Optional[str]:
-        ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        if not ok:
-            return None
-        return base64.b64encode(buf).decode("utf-8")
-
     def update_faces_grid():
         # delega a HistoryTab
         history.refresh()
 
-    def loop():
-        try:
-            while running["flag"]:
-                ret, frame = cap["obj"].read()
-                if not ret:
-                    status.value = "⚠️ No se pudo leer frame de la cámara"
-                    page.update()
-                    break
-
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                frame_with_faces = frame.copy()
-                
-                for face_coords in faces:
-                    x, y, w, h = face_coords
-                    face_img, embedding, quality_message = face_storage.face_recognizer.process_face(frame, face_coords)
-                    
-                    if face_img is not None and embedding is not None:
-                        cv2.rectangle(frame_with_faces, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                        cv2.putText(frame_with_faces, "OK", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        
-                        if face_storage.save_face(frame, face_coords):
-                            info.value = f"✅ Nueva cara detectada y guardada"
-                            update_faces_grid()
-                        else:
-                            info.value = f"👁️ Rostro detectado: {quality_message}"
-                    else:
-                        cv2.rectangle(frame_with_faces, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                        cv2.putText(frame_with_faces, quality_message or "Error", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-                        info.value = f"⚠️ Rostro rechazado: {quality_message}"
-                    page.update()
-
-                frame_with_faces = cv2.resize(frame_with_faces, (800, 600))
-                frame_with_faces = cv2.cvtColor(frame_with_faces, cv2.COLOR_BGR2RGB)
-                b64 = frame_to_b64(frame_with_faces)
-                if b64:
-                    img.src_base64 = b64
-                    page.update()
-
-                time.sleep(0.03)
-        except Exception as e:
-            logging.error(f"Error in camera loop: {e}")
-            status.value = f"⚠️ Error: {str(e)}"
-            page.update()
-        finally:
-            if cap["obj"]:
-                cap["obj"].release()
-                cap["obj"] = None
-                running["flag"] = False
-                status.value = "⏹ Cámara detenida"
-                page.update()
+    def on_event(event: dict):
+        kind = event.get("type")
+        if kind == "frame":
+            img.src_base64 = event["image"]
+        elif kind == "detection":
+            info.value = event["message"]
+            if event.get("saved"):
+                # events arrive on the event loop: keep disk reads/encoding off it
+                run_thread = getattr(page, "run_thread", None)
+                if run_thread is not None:
+                    run_thread(update_faces_grid)
+                else:
+                    update_faces_grid()
+        elif kind == "status":
+            status.value = event["message"]
+        elif kind == "stats":
+            stats_overlay.value = event["text"]
+            stats_overlay.visible = True
+        page.update()
 
     def start(e):
         try:
-            if running["flag"]:
+            if service.is_subscribed(session_key) and service.running:
                 return
-            c = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            if not c.isOpened():
-                status.value = "❌ No se pudo abrir la cámara"
-                page.update()
-                return
-            cap["obj"] = c
-            running["flag"] = True
-            status.value = "✅ Cámara activa"
+            if service.subscribe(session_key, on_event, loop=getattr(page, "loop", None)):
+                status.value = "✅ Cámara activa"
+            else:
+                service.unsubscribe(session_key)
+                status.value = service.last_status
             page.update()
-            import threading
-            threading.Thread(target=loop, daemon=True).start()
         except Exception as ex:
             status.value = f"❌ Error: {str(ex)}"
             page.update()
 
     def stop(e):
-        if running["flag"]:
-            running["flag"] = False
-            if cap["obj"]:
-                cap["obj"].release()
-                cap["obj"] = None
+        if service.is_subscribed(session_key):
+            service.unsubscribe(session_key)
             status.value = "⏹ Cámara detenida"
             page.update()
         else:
@@ -157,6 +118,8 @@ def start_camera(page: ft.Page, target_container: Optional[ft.Control] = None):
             selected = None
         if selected == 1:
             logging.info("Historial de rostros buscara en: %s", history.images_dir.resolve())
+        # the preview is only drawn while "Cámara en vivo" is showing
+        set_view_visible(page, selected != 1, reason="tab")
     # --- FIN de funciones ---
 
     # ahora construir la UI (usar start/stop ya definidos)
@@ -180,7 +143,7 @@ def start_camera(page: ft.Page, target_container: Optional[ft.Control] = None):
                     ),
                     status,
                     info,
-                    img,
+                    ft.Stack([img, ft.Container(content=stats_overlay, bgcolor="#CCFFFFFF", padding=6, left=0, top=0)]),
                 ])
             ),
             history.tab(),
@@ -201,6 +164,15 @@ def start_camera(page: ft.Page, target_container: Optional[ft.Control] = None):
             # Fallback: attempt to set `content` if available
             setattr(target_container, "content", tabs)
 
+    # a freshly built view opens on "Cámara en vivo"
+    set_view_visible(page, True, reason="nav")
+    set_view_visible(page, True, reason="tab")
+
+    # the view is rebuilt on every tab switch: keep receiving frames in the new controls
+    if service.is_subscribed(session_key):
+        service.subscribe(session_key, on_event, loop=getattr(page, "loop", None))
+        status.value = service.last_status
+
     # cargar historial inicial
     update_faces_grid()
     history.try_deferred_refresh()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Union
+
+from src.utils.config import config
+
+from .capture_source import FrameRecorder, RecordingSource, open_capture_source, session_record_path
+from .face_storage import FaceStorage
+from .pipeline import CameraPipeline
+from .pipeline_stats import stats
+
+Event = Dict[str, Any]
+Subscriber = Callable[[Event], None]
+
+# subscribers that keep failing (closed browser tab, disposed page) are dropped
+_MAX_SUBSCRIBER_ERRORS = 3
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class CaptureService:
+    """Process-wide camera capture and analysis pipeline.
+
+    The camera is opened once and every frame is analysed once, no matter how many
+    Flet sessions are watching. Sessions subscribe with a key (their session id) and
+    receive events as dicts, always on the event loop the pipeline runs on:
+
+    - ``{"type": "frame", "image": <base64 jpeg>}``: annotated preview, encoded once
+    - ``{"type": "detection", "message": str, "saved": bool, "accepted": bool, "identity": str | None}``
+    - ``{"type": "status", "message": str, "running": bool}``
+
+    A subscriber whose view is not on screen (window hidden to the tray, another
+    tab selected) is marked with ``set_visible(key, False)`` and only receives
+    status events; while no subscriber is visible the pipeline skips preview
+    rendering altogether and keeps detecting and saving at full rate.
+
+    Capture starts with the first subscriber and stops when the last one leaves.
+    The source is ``config.capture_source`` (camera index, video or ``.cfrec``
+    recording) unless one is given explicitly.
+    """
+
+    def __init__(self, source: Union[int, str, None] = None, preview: bool = True):
+        self.source = source
+        self.preview = preview
+        self.face_storage: Optional[FaceStorage] = None
+        self._subscribers: Dict[Hashable, Subscriber] = {}
+        self._errors: Dict[Hashable, int] = {}
+        self._hidden: Set[Hashable] = set()
+        self._lock = threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[Future] = None
+        # set while no pipeline holds the camera (the task future reports "done" as
+        # soon as it is cancelled, before the stages have released the device)
+        self._idle = threading.Event()
+        self._idle.set()
+        self.pipeline: Optional[CameraPipeline] = None
+        self.last_status = "Listo para iniciar"
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def is_subscribed(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._subscribers
+
+    def set_visible(self, key: Hashable, visible: bool) -> None:
+        """Whether the view of subscriber ``key`` is on screen (preview and UI updates)."""
+        with self._lock:
+            was_hidden = key in self._hidden
+            if visible:
+                self._hidden.discard(key)
+            else:
+                self._hidden.add(key)
+            subscribed = key in self._subscribers
+        if was_hidden and visible and subscribed:
+            # detection events were withheld while hidden: refresh the status line
+            self._publish({"type": "status", "message": self.last_status, "running": self.running})
+
+    def preview_wanted(self) -> bool:
+        """True while at least one subscriber's view is visible."""
+        with self._lock:
+            return any(key not in self._hidden for key in self._subscribers)
+
+    def wait_stopped(self, timeout: Optional[float] = None) -> bool:
+        """Block until no pipeline holds the capture source; False on timeout."""
+        return self._idle.wait(timeout=timeout)
+
+    def subscribe(self, key: Hashable, callback: Subscriber, loop: Optional[asyncio.AbstractEventLoop] = None) -> bool:
+        """Register (or replace) a viewer and make sure capture is running.
+
+        ``loop`` is the event loop that runs the pipeline (``page.loop`` in Flet);
+        it defaults to the running loop when called from a coroutine.
+        """
+        with self._lock:
+            self._subscribers[key] = callback
+            self._errors.pop(key, None)
+            if self.running:
+                return True
+            return self._start(loop)
+
+    def unsubscribe(self, key: Hashable) -> None:
+        with self._lock:
+            self._subscribers.pop(key, None)
+            self._errors.pop(key, None)
+            self._hidden.discard(key)
+            if not self._subscribers:
+                self._stop()
+
+    def _start(self, loop: Optional[asyncio.AbstractEventLoop]) -> bool:
+        loop = loop or _running_loop() or self._loop
+        if loop is None:
+            raise RuntimeError("CaptureService needs an asyncio event loop")
+        self._loop = loop
+
+        if _running_loop() is not loop:
+            # let a cancelled pipeline release the device before reopening it
+            self._idle.wait(timeout=2.0)
+
+        if self.face_storage is None:
+            self.face_storage = FaceStorage()
+        try:
+            cap = open_capture_source(self.source)
+        except (OSError, ValueError) as e:
+            logging.error(f"Capture service: cannot open source: {e}")
+            cap = None
+        if cap is None or not cap.isOpened():
+            self._publish_status("❌ No se pudo abrir la cámara", running=False)
+            return False
+        record_path = getattr(config, "capture_record_path", "")
+        if record_path:
+            # one file per camera session: a restart must not truncate the previous recording
+            record_path = session_record_path(record_path)
+            cap = RecordingSource(cap, FrameRecorder(record_path))
+            logging.info("Capture service: recording frames to %s", record_path)
+
+        self.pipeline = CameraPipeline(
+            cap, self.face_storage, self._publish_now, preview=self.preview, preview_wanted=self.preview_wanted
+        )
+        self._idle.clear()
+        self._task = asyncio.run_coroutine_threadsafe(self._run(self.pipeline), loop)
+        logging.info("Capture service started (source=%s)", type(cap).__name__)
+        self._publish_status("✅ Cámara activa", running=True)
+        return True
+
+    def _stop(self) -> None:
+        if not self.running:
+            return
+        # cancels the pipeline task on its loop; stages unwind and release the camera
+        self._task.cancel()
+        logging.info("Capture service stopped")
+
+    async def _run(self, pipeline: CameraPipeline) -> None:
+        try:
+            await pipeline.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error in camera loop: {e}")
+            self._publish_status(f"⚠️ Error: {str(e)}", running=False)
+        finally:
+            self._idle.set()
+            self.last_status = "⏹ Cámara detenida"
+            self._publish_now({"type": "status", "message": self.last_status, "running": False})
+
+    def _publish(self, event: Event) -> None:
+        """Deliver an event on the pipeline loop, from whatever thread we are on."""
+        loop = self._loop
+        if loop is None or _running_loop() is loop:
+            self._publish_now(event)
+        else:
+            loop.call_soon_threadsafe(self._publish_now, event)
+
+    def _publish_now(self, event: Event) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+            hidden = set(self._hidden) if event.get("type") != "status" else set()
+        for key, callback in subscribers:
+            if key in hidden:
+                continue
+            try:
+                callback(event)
+                self._errors.pop(key, None)
+            except Exception as e:
+                count = self._errors.get(key, 0) + 1
+                self._errors[key] = count
+                logging.debug(f"Capture service: subscriber {key!r} failed ({count}): {e}")
+                if count >= _MAX_SUBSCRIBER_ERRORS:
+                    logging.info(f"Capture service: dropping unresponsive subscriber {key!r}")
+                    self.unsubscribe(key)
+
+    def _publish_status(self, message: str, running: bool) -> None:
+        self.last_status = message
+        self._publish({"type": "status", "message": message, "running": running})
+
+
+_service: Optional[CaptureService] = None
+_service_lock = threading.Lock()
+
+
+def get_capture_service() -> CaptureService:
+    """Return the single capture service shared by all sessions of this process."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = CaptureService()
+            _register_gauges(_service)
+        return _service
+
+
+def _register_gauges(service: CaptureService) -> None:
+    def depth(index: int) -> float:
+        pipeline = service.pipeline
+        return pipeline.queue_depths()[index] if pipeline is not None and service.running else 0
+
+    stats.register_gauge("pipeline_frame_queue_depth", "Frames waiting for analysis", lambda: depth(0))
+    stats.register_gauge("pipeline_result_queue_depth", "Analysed frames waiting to be published", lambda: depth(1))
+    stats.register_gauge("capture_subscribers", "Sessions subscribed to the capture service", lambda: service.subscriber_count)
+    stats.register_gauge("capture_running", "1 while the camera pipeline runs", lambda: int(service.running))
@@ -0,0 +1,350 @@
+"""Capture sources: live camera, recorded replay and a frame recorder.
+
+Every source exposes the small ``cv2.VideoCapture`` subset the pipeline uses
+(``read``, ``release``, ``isOpened``) plus ``is_live``, so recorded sessions can
+be fed through exactly the same pipeline on machines without a camera.
+
+Recording format (``.cfrec``)::
+
+    b"CFREC1\\n"
+    repeated records: <d timestamp> <I payload length> <B codec> <H height> <H width> <B channels> payload
+
+``codec`` 0 is raw BGR bytes, 1 is a JPEG (MJPEG stream).
+"""
+
+import abc
+import argparse
+import logging
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+
+MAGIC = b"CFREC1\n"
+_RECORD = struct.Struct("<dIBHHB")
+CODEC_RAW = 0
+CODEC_MJPEG = 1
+_CODECS = {"raw": CODEC_RAW, "mjpeg": CODEC_MJPEG}
+
+Frame = Tuple[bool, Optional[np.ndarray]]
+
+
+class CaptureSource(abc.ABC):
+    """Base class; subclasses implement ``_read`` and ``release``.
+
+    ``last_timestamp`` is the capture time (epoch seconds) of the last frame read:
+    wall clock for cameras, the recorded time for replays.
+    """
+
+    is_live = True
+
+    def __init__(self):
+        self.last_timestamp: Optional[float] = None
+        self.frames_read = 0
+
+    def isOpened(self) -> bool:  # noqa: N802 - mirrors cv2.VideoCapture
+        return True
+
+    def read(self) -> Frame:
+        ok, frame, ts = self._read()
+        if ok:
+            self.last_timestamp = ts
+            self.frames_read += 1
+        return ok, frame
+
+    @abc.abstractmethod
+    def _read(self) -> Tuple[bool, Optional[np.ndarray], Optional[float]]:
+        """(ok, frame, capture timestamp)."""
+
+    def release(self) -> None:
+        pass
+
+
+class CameraSource(CaptureSource):
+    """Live camera (or any URL/device accepted by ``cv2.VideoCapture``)."""
+
+    def __init__(self, device: Union[int, str] = 0):
+        super().__init__()
+        # DirectShow opens much faster on Windows; other platforms pick their default backend
+        api = cv2.CAP_DSHOW if sys.platform == "win32" and isinstance(device, int) else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(device, api)
+
+    def isOpened(self) -> bool:  # noqa: N802
+        return bool(self.cap.isOpened())
+
+    def _read(self):
+        ret, frame = self.cap.read()
+        return ret, frame, time.time()
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class VideoFileSource(CameraSource):
+    """Video file decoded as fast as the pipeline consumes it.
+
+    Timestamps are the file's modification time plus the media position, so two
+    runs over the same file see the same capture times.
+    """
+
+    is_live = False
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            self._base = os.path.getmtime(path)
+        except OSError:
+            self._base = time.time()
+
+    def _read(self):
+        ret, frame = self.cap.read()
+        return ret, frame, self._base + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+
+def session_record_path(path: Union[str, Path], started: Optional[datetime] = None) -> Path:
+    """``capture_record_path`` with the session start appended (``session_20250101_120000.cfrec``)."""
+    path = Path(path)
+    stamp = (started or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    candidate = path.with_name(f"{path.stem}_{stamp}{path.suffix or '.cfrec'}")
+    n = 0
+    while candidate.exists():
+        n += 1
+        candidate = path.with_name(f"{path.stem}_{stamp}_{n}{path.suffix or '.cfrec'}")
+    return candidate
+
+
+class FrameRecorder:
+    """Append frames with their capture timestamps to a ``.cfrec`` file.
+
+    An existing recording is never truncated unless ``overwrite`` is set
+    (``FileExistsError`` otherwise).
+    """
+
+    def __init__(self, path: Union[str, Path], codec: str = "mjpeg", jpeg_quality: int = 90, overwrite: bool = False):
+        if codec not in _CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {sorted(_CODECS)}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.codec = _CODECS[codec]
+        self.jpeg_quality = int(jpeg_quality)
+        self.frames_written = 0
+        self._file: BinaryIO = open(self.path, "wb" if overwrite else "xb")
+        self._file.write(MAGIC)
+
+    def write(self, frame: np.ndarray, timestamp: Optional[float] = None) -> None:
+        timestamp = time.time() if timestamp is None else timestamp
+        h, w = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        if self.codec == CODEC_MJPEG:
+            ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ok:
+                raise ValueError("Failed to encode frame as JPEG")
+            payload = buf.tobytes()
+        else:
+            payload = np.ascontiguousarray(frame).tobytes()
+        self._file.write(_RECORD.pack(timestamp, len(payload), self.codec, h, w, channels))
+        self._file.write(payload)
+        self.frames_written += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "FrameRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class RecordingSource(CaptureSource):
+    """Pass-through source that records every frame read from ``inner``."""
+
+    def __init__(self, inner: CaptureSource, recorder: FrameRecorder):
+        super().__init__()
+        self.inner = inner
+        self.recorder = recorder
+        self.is_live = inner.is_live
+
+    def isOpened(self) -> bool:  # noqa: N802
+        return self.inner.isOpened()
+
+    def _read(self):
+        ok, frame = self.inner.read()
+        ts = self.inner.last_timestamp
+        if ok:
+            self.recorder.write(frame, ts)
+        return ok, frame, ts
+
+    def release(self) -> None:
+        self.inner.release()
+        self.recorder.close()
+
+
+class ReplaySource(CaptureSource):
+    """Replay a ``.cfrec`` recording at its original pace or as fast as possible.
+
+    Replays are not live: the pipeline applies backpressure instead of dropping
+    frames, so every recorded frame is processed and runs are reproducible.
+    """
+
+    is_live = False
+
+    def __init__(self, path: Union[str, Path], pace: str = "original", loop: bool = False):
+        super().__init__()
+        if pace not in ("original", "fast"):
+            raise ValueError("pace must be 'original' or 'fast'")
+        self.path = Path(path)
+        self.pace = pace
+        self.loop = loop
+        self._file: Optional[BinaryIO] = open(self.path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            self._file = None
+            raise ValueError(f"{self.path} is not a frame recording")
+        self._first_ts: Optional[float] = None
+        self._start_wall = 0.0
+
+    def isOpened(self) -> bool:  # noqa: N802
+        return self._file is not None
+
+    def _next_record(self):
+        header = self._file.read(_RECORD.size)
+        if len(header) < _RECORD.size and self.loop and self.frames_read:
+            self._file.seek(len(MAGIC))
+            self._first_ts = None
+            header = self._file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return None
+        ts, length, codec, h, w, channels = _RECORD.unpack(header)
+        payload = self._file.read(length)
+        if len(payload) < length:
+            return None
+        if codec == CODEC_MJPEG:
+            frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            shape = (h, w, channels) if channels > 1 else (h, w)
+            frame = np.frombuffer(payload, np.uint8).reshape(shape).copy()
+        return ts, frame
+
+    def _read(self):
+        if self._file is None:
+            return False, None, None
+        record = self._next_record()
+        if record is None:
+            return False, None, None
+        ts, frame = record
+        if self.pace == "original":
+            if self._first_ts is None:
+                self._first_ts = ts
+                self._start_wall = time.monotonic()
+            delay = (ts - self._first_ts) - (time.monotonic() - self._start_wall)
+            if delay > 0:
+                time.sleep(delay)
+        return frame is not None, frame, ts
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_capture_source(spec: Union[int, str, None] = None, pace: Optional[str] = None) -> CaptureSource:
+    """Open the source named by ``spec`` or ``config.capture_source``.
+
+    An int (or digit string) is a camera index; ``*.cfrec`` is a replay; any other
+    path is read as a video file.
+    """
+    if spec is None or spec == "":
+        spec = getattr(config, "capture_source", "") or getattr(config, "capture_device", 0)
+    if isinstance(spec, str) and spec.strip().isdigit():
+        spec = int(spec)
+    if isinstance(spec, int):
+        return CameraSource(spec)
+    path = Path(spec)
+    if path.suffix.lower() == ".cfrec":
+        return ReplaySource(path, pace=pace or getattr(config, "replay_pace", "original"))
+    if path.exists():
+        return VideoFileSource(str(path))
+    # URLs (rtsp://, http://) and anything else OpenCV understands
+    return CameraSource(str(spec))
+
+
+def _record(args: argparse.Namespace) -> int:
+    source = open_capture_source(args.source)
+    if not source.isOpened():
+        print(f"No se pudo abrir la fuente {args.source!r}")
+        return 1
+    deadline = time.monotonic() + args.seconds if args.seconds else None
+    try:
+        recorder = FrameRecorder(args.output, codec=args.codec, overwrite=args.overwrite)
+    except FileExistsError:
+        source.release()
+        print(f"{args.output} ya existe (usa --overwrite para reemplazarlo)")
+        return 1
+    with recorder:
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                ok, frame = source.read()
+                if not ok:
+                    break
+                recorder.write(frame, source.last_timestamp)
+                if args.max_frames and recorder.frames_written >= args.max_frames:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.release()
+    print(f"{recorder.frames_written} frames grabados en {args.output}")
+    return 0
+
+
+def _info(args: argparse.Namespace) -> int:
+    source = ReplaySource(args.recording, pace="fast")
+    first = last = None
+    size = None
+    while True:
+        ok, frame = source.read()
+        if not ok:
+            break
+        first = source.last_timestamp if first is None else first
+        last = source.last_timestamp
+        size = frame.shape
+    source.release()
+    duration = (last - first) if first is not None else 0.0
+    fps = (source.frames_read - 1) / duration if duration > 0 else 0.0
+    print(f"{args.recording}: {source.frames_read} frames, {duration:.1f} s, {fps:.1f} fps, shape={size}")
+    return 0
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Grabar y reproducir fuentes de captura")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Grabar frames de una camara/video a un archivo .cfrec")
+    rec.add_argument("output", type=Path)
+    rec.add_argument("--source", default=None, help="Indice de camara, URL o video (por defecto config)")
+    rec.add_argument("--seconds", type=float, default=30.0)
+    rec.add_argument("--max-frames", type=int, default=0)
+    rec.add_argument("--codec", choices=sorted(_CODECS), default="mjpeg")
+    rec.add_argument("--overwrite", action="store_true", help="Reemplazar la grabacion si ya existe")
+    rec.set_defaults(func=_record)
+
+    info = sub.add_parser("info", help="Mostrar resumen de una grabacion")
+    info.add_argument("recording", type=Path)
+    info.set_defaults(func=_info)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
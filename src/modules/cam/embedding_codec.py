@@ -0,0 +1,237 @@
+"""Compact face embeddings: projection to a few hundred dims plus float16/int8 storage.
+
+The 8100-dim HOG embedding is projected with an *uncentered* PCA (sklearn's
+``TruncatedSVD``), which preserves inner products rather than distances to the
+mean, then re-normalised, so cosine similarities and ``similarity_threshold``
+keep their meaning. Rows are stored as float32, float16 or int8 (symmetric,
+one float32 scale per row). With 128 components and int8 a face takes 132
+bytes instead of 32 KiB.
+
+Projections are versioned ``projection_v<N>.npz`` files in the embedding index
+directory; fit a new one with::
+
+    python -m src.modules.cam.embedding_codec fit --components 128
+"""
+
+import argparse
+import logging
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+CODEC_FORMAT = 1
+_BLOCK_ROWS = 8192
+_VERSION_RE = re.compile(r"projection_v(\d+)\.npz$")
+
+Codes = Tuple[np.ndarray, np.ndarray]
+
+
+class EmbeddingCodec:
+    """Project + quantize embeddings and score them against stored codes."""
+
+    def __init__(self, components: Optional[np.ndarray], storage: str = "float32", version: int = 0):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage {storage!r}, expected one of {sorted(STORAGE_DTYPES)}")
+        # (k, D) projection rows, or None to keep the raw embedding
+        self.components = None if components is None else np.ascontiguousarray(components, dtype=np.float32)
+        self.storage = storage
+        self.dtype = STORAGE_DTYPES[storage]
+        self.version = version
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.components is None else int(self.components.shape[0])
+
+    def bytes_per_embedding(self, input_dim: int) -> int:
+        dim = self.dim or input_dim
+        return dim * np.dtype(self.dtype).itemsize + (4 if self.storage == "int8" else 0)
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        """(N, D) or (D,) raw embeddings -> (N, k) unit-norm float32."""
+        x = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if self.components is not None:
+            x = x @ self.components.T
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return x / norms
+
+    def encode(self, embeddings: np.ndarray) -> Codes:
+        """Return (codes, scales); scales are 1.0 except for int8."""
+        return self.quantize(self.project(embeddings))
+
+    def quantize(self, projected: np.ndarray) -> Codes:
+        """Store already projected unit-norm rows in the configured dtype."""
+        x = np.atleast_2d(np.asarray(projected, dtype=np.float32))
+        scales = np.ones(len(x), dtype=np.float32)
+        if self.storage == "int8":
+            peak = np.abs(x).max(axis=1)
+            peak[peak == 0] = 1.0
+            scales = (peak / 127.0).astype(np.float32)
+            codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+        else:
+            codes = x.astype(self.dtype)
+        return codes, scales
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """Approximate projected float32 rows (for diagnostics)."""
+        return codes.astype(np.float32) * scales[:, None]
+
+    def similarities(self, query: Codes, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """Cosine similarity of one encoded query against every stored row."""
+        q_codes, q_scales = query
+        q = q_codes[0].astype(np.float32) * float(q_scales[0])
+        n = len(codes)
+        out = np.empty(n, dtype=np.float32)
+        # convert in blocks: float16/int8 products are not BLAS-accelerated, and a
+        # full-size float32 copy would defeat the compact storage
+        for start in range(0, n, _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            out[start:start + len(block)] = block @ q
+        if self.storage == "int8":
+            out *= scales
+        return out
+
+    def save(self, path: Path, explained_variance: float = 0.0, samples: int = 0) -> Path:
+        np.savez(
+            path,
+            format=np.int32(CODEC_FORMAT),
+            version=np.int32(self.version),
+            storage=np.array(self.storage),
+            components=self.components if self.components is not None else np.zeros((0, 0), np.float32),
+            explained_variance=np.float32(explained_variance),
+            samples=np.int64(samples),
+            fitted_at=np.array(datetime.now().isoformat()),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path, storage: Optional[str] = None) -> "EmbeddingCodec":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != CODEC_FORMAT:
+                raise ValueError(f"Unsupported projection format in {path}")
+            components = data["components"]
+            return cls(
+                components if components.size else None,
+                storage=storage or str(data["storage"]),
+                version=int(data["version"]),
+            )
+
+
+def fit_codec(embeddings: np.ndarray, components: int = 128, storage: str = "int8", version: int = 1) -> Tuple[EmbeddingCodec, float]:
+    """Fit an uncentered PCA on a gallery; returns the codec and retained variance."""
+    from sklearn.decomposition import TruncatedSVD
+
+    x = np.asarray(embeddings, dtype=np.float32)
+    components = int(min(components, x.shape[0] - 1, x.shape[1]))
+    if components < 1:
+        raise ValueError("Need at least two embeddings to fit a projection")
+    svd = TruncatedSVD(n_components=components, algorithm="randomized", random_state=0)
+    svd.fit(x)
+    codec = EmbeddingCodec(svd.components_.astype(np.float32), storage=storage, version=version)
+    return codec, float(svd.explained_variance_ratio_.sum())
+
+
+def projection_versions(directory: Path) -> Tuple[int, ...]:
+    versions = []
+    for path in Path(directory).glob("projection_v*.npz"):
+        match = _VERSION_RE.search(path.name)
+        if match:
+            versions.append(int(match.group(1)))
+    return tuple(sorted(versions))
+
+
+def projection_path(directory: Path, version: int) -> Path:
+    return Path(directory) / f"projection_v{version}.npz"
+
+
+def load_configured_codec(index_dir: Optional[Path] = None) -> Optional[EmbeddingCodec]:
+    """Codec selected by ``embedding_projection`` / ``embedding_storage``, or None.
+
+    ``embedding_projection`` is "" (no projection), "latest" (newest version in the
+    index directory), a version number or a path to a ``.npz`` file.
+    """
+    storage = str(getattr(config, "embedding_storage", "float32") or "float32")
+    projection = str(getattr(config, "embedding_projection", "") or "")
+    if not projection:
+        return None if storage == "float32" else EmbeddingCodec(None, storage=storage)
+
+    if index_dir is None:
+        from .embedding_index import default_index_dir
+
+        index_dir = default_index_dir()
+    if projection == "latest":
+        versions = projection_versions(index_dir)
+        if not versions:
+            logging.warning("embedding_projection=latest but no projection has been fitted in %s", index_dir)
+            return None if storage == "float32" else EmbeddingCodec(None, storage=storage)
+        path = projection_path(index_dir, versions[-1])
+    elif projection.isdigit():
+        path = projection_path(index_dir, int(projection))
+    else:
+        path = Path(projection)
+    try:
+        codec = EmbeddingCodec.load(path, storage=storage)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Failed to load embedding projection {path}: {e}")
+        return None
+    logging.info("Embedding projection v%s: %s dims, %s storage", codec.version, codec.dim, codec.storage)
+    return codec
+
+
+def _fit(args: argparse.Namespace) -> int:
+    from .embedding_index import EmbeddingIndex, default_index_dir
+
+    index = EmbeddingIndex(args.index_dir or default_index_dir())
+    vectors = index.vectors()
+    if len(vectors) < 2:
+        print(f"El indice {index.directory} no tiene embeddings suficientes (ejecuta el backfill)")
+        return 1
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(vectors), size=min(len(vectors), args.max_samples), replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+
+    version = (projection_versions(index.directory) or (0,))[-1] + 1
+    codec, retained = fit_codec(sample, args.components, args.storage, version)
+    path = codec.save(projection_path(index.directory, version), explained_variance=retained, samples=len(sample))
+
+    # how far projected + quantized cosines drift from the raw ones
+    a = sample[rng.integers(0, len(sample), 2000)]
+    b = sample[rng.integers(0, len(sample), 2000)]
+    raw = np.einsum("ij,ij->i", a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    codes_a, scales_a = codec.encode(a)
+    codes_b, scales_b = codec.encode(b)
+    approx = np.einsum("ij,ij->i", codec.decode(codes_a, scales_a), codec.decode(codes_b, scales_b))
+    input_dim = sample.shape[1]
+    print(f"Proyeccion v{version} guardada en {path}")
+    print(f"  {input_dim} -> {codec.dim} dims, almacenamiento {codec.storage}, varianza retenida {retained:.1%}")
+    print(f"  {input_dim * 4} -> {codec.bytes_per_embedding(input_dim)} bytes por rostro")
+    print(f"  error de similitud coseno: medio {np.abs(raw - approx).mean():.4f}, max {np.abs(raw - approx).max():.4f}")
+    print(f"Activar con embedding_projection=\"latest\" y embedding_storage=\"{codec.storage}\"")
+    return 0
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Proyeccion y cuantizacion de embeddings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit = sub.add_parser("fit", help="Ajustar una nueva proyeccion sobre el indice de embeddings")
+    fit.add_argument("--components", type=int, default=128)
+    fit.add_argument("--storage", choices=sorted(STORAGE_DTYPES), default="int8")
+    fit.add_argument("--max-samples", type=int, default=20000)
+    fit.add_argument("--index-dir", type=Path)
+    fit.set_defaults(func=_fit)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""Persistent, append-only index of face embeddings.
+
+Layout of the index directory (``detected_faces_dir/.index`` by default)::
+
+    meta.json       {"version": 1, "dim": D, "dtype": "float32"}
+    vectors.f32     raw float32 rows, D values each
+    entries.jsonl   one JSON object per row: row, filename, timestamp, quality, source
+    deleted.txt     absolute filenames removed by retention (their entries are hidden)
+
+Rows are appended under an inter-process file lock, so the live app and a
+backfill job can write to the same index concurrently. Each entry records the
+row it owns, so a partially written tail (crash mid-append) is simply ignored.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+
+INDEX_VERSION = 1
+
+Entry = Dict[str, Any]
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Exclusive advisory lock shared between processes."""
+    with open(path, "a+b") as handle:
+        if sys.platform == "win32":
+            import msvcrt
+
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def default_index_dir() -> Path:
+    configured = getattr(config, "embedding_index_dir", "")
+    if configured:
+        return Path(configured)
+    return Path(config.detected_faces_dir) / ".index"
+
+
+class EmbeddingIndex:
+    """Embeddings of saved faces, keyed by the crop's filename."""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory or default_index_dir())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.directory / "meta.json"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.entries_path = self.directory / "entries.jsonl"
+        self.deleted_path = self.directory / "deleted.txt"
+        self.lock_path = self.directory / ".lock"
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self._deleted: Set[str] = set()
+        self._deleted_offset = 0
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta.get("version") != INDEX_VERSION:
+                raise ValueError(f"Unsupported embedding index version {meta.get('version')} in {self.directory}")
+            self.dim = int(meta["dim"])
+
+    def _write_meta(self, dim: int) -> None:
+        self.meta_path.write_text(
+            json.dumps({"version": INDEX_VERSION, "dim": dim, "dtype": "float32"}), encoding="utf-8"
+        )
+        self.dim = dim
+
+    def add(
+        self,
+        embedding: np.ndarray,
+        filename: Optional[str],
+        timestamp: datetime,
+        quality: Optional[str] = None,
+        source: str = "live",
+    ) -> int:
+        """Append one embedding; returns its row number."""
+        return self.add_many([(embedding, filename, timestamp, quality)], source=source)[0]
+
+    def add_many(
+        self,
+        records: List[Tuple[np.ndarray, Optional[str], datetime, Optional[str]]],
+        source: str = "live",
+    ) -> List[int]:
+        """Append (embedding, filename, timestamp, quality) records in one locked write."""
+        if not records:
+            return []
+        vectors = np.stack([np.asarray(r[0], dtype=np.float32).ravel() for r in records])
+        with self._lock, _file_lock(self.lock_path):
+            if self.dim is None:
+                if self.meta_path.exists():
+                    self.dim = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"])
+                else:
+                    self._write_meta(int(vectors.shape[1]))
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dims, index expects {self.dim}")
+
+            row_bytes = self.dim * 4
+            with open(self.vectors_path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                # drop a torn row from an interrupted write
+                first_row = f.tell() // row_bytes
+                if f.tell() % row_bytes:
+                    f.truncate(first_row * row_bytes)
+                f.write(vectors.tobytes())
+            rows = list(range(first_row, first_row + len(records)))
+            with open(self.entries_path, "a", encoding="utf-8") as f:
+                for row, (_emb, filename, timestamp, quality) in zip(rows, records):
+                    entry = {
+                        "row": row,
+                        "filename": filename,
+                        "timestamp": timestamp.isoformat(),
+                        "quality": quality,
+                        "source": source,
+                    }
+                    f.write(json.dumps(entry) + "\n")
+        return rows
+
+    def mark_deleted(self, filenames: Iterable[str]) -> int:
+        """Hide the entries of crops that no longer exist (rows stay in place)."""
+        names = [os.path.abspath(str(name)) for name in filenames]
+        if not names:
+            return 0
+        with self._lock, _file_lock(self.lock_path):
+            with open(self.deleted_path, "a", encoding="utf-8") as f:
+                f.writelines(name + "\n" for name in names)
+        return len(names)
+
+    @staticmethod
+    def _read_lines(path: Path, offset: int) -> Tuple[List[bytes], int]:
+        """Complete lines appended after byte ``offset`` and the offset to resume from."""
+        try:
+            if path.stat().st_size <= offset:
+                return [], offset
+        except FileNotFoundError:
+            return [], offset
+        lines = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn tail, re-read next time
+                offset += len(line)
+                lines.append(line)
+        return lines, offset
+
+    def deleted_since(self, offset: int = 0) -> Tuple[List[str], int]:
+        """Filenames marked deleted after byte ``offset`` of deleted.txt, and the new offset."""
+        lines, offset = self._read_lines(self.deleted_path, offset)
+        return [line.decode("utf-8").rstrip("\n") for line in lines], offset
+
+    def deleted(self) -> Set[str]:
+        """Absolute filenames marked deleted (new lines are read incrementally)."""
+        with self._lock:
+            names, self._deleted_offset = self.deleted_since(self._deleted_offset)
+            self._deleted.update(names)
+            return set(self._deleted)
+
+    def entries_since(self, offset: int = 0) -> Tuple[List[Entry], int]:
+        """Entries appended after byte ``offset`` of entries.jsonl, and the offset to resume from.
+
+        Deleted crops are included (see ``deleted_since``); reading stops at a
+        torn line or at a row whose vector is not complete yet.
+        """
+        lines, end = self._read_lines(self.entries_path, offset)
+        if not lines:
+            return [], offset
+        rows = self._row_count()
+        result: List[Entry] = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                offset += len(line)  # corrupt line: skip it for good
+                continue
+            if entry.get("row", rows) >= rows:
+                break
+            offset += len(line)
+            result.append(entry)
+        return result, offset
+
+    def is_live(self, entry: Entry, deleted: Set[str]) -> bool:
+        filename = entry.get("filename")
+        return not (filename and deleted and os.path.abspath(filename) in deleted)
+
+    def entries(self) -> List[Entry]:
+        """All complete entries of crops not marked deleted, in append order."""
+        if not self.entries_path.exists():
+            return []
+        rows = self._row_count()
+        deleted = self.deleted()
+        result: List[Entry] = []
+        with open(self.entries_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line
+                if entry.get("row", rows) < rows and self.is_live(entry, deleted):
+                    result.append(entry)
+        return result
+
+    def filenames(self) -> Set[str]:
+        return {e["filename"] for e in self.entries() if e.get("filename")}
+
+    def _row_count(self) -> int:
+        if self.dim is None and self.meta_path.exists():
+            # the first row was written by another process
+            self.dim = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"])
+        if self.dim is None or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (self.dim * 4)
+
+    def __len__(self) -> int:
+        return self._row_count()
+
+    def vectors(self) -> np.ndarray:
+        """Read-only (N, dim) view of every stored row (memory-mapped)."""
+        rows = self._row_count()
+        if rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def recent(self, since: datetime) -> List[Tuple[Entry, np.ndarray]]:
+        """Entries (with their embedding) saved at or after ``since``."""
+        vectors = self.vectors()
+        result = []
+        for entry in self.entries():
+            try:
+                ts = datetime.fromisoformat(entry["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if ts >= since:
+                result.append((dict(entry, timestamp=ts), np.array(vectors[entry["row"]])))
+        return result
+
+
+_shared_index: Optional[EmbeddingIndex] = None
+_shared_lock = threading.Lock()
+
+
+def shared_embedding_index() -> Optional[EmbeddingIndex]:
+    """Process-wide index for the configured faces directory, or None when disabled."""
+    global _shared_index
+    if not getattr(config, "embedding_index_enabled", True):
+        return None
+    with _shared_lock:
+        if _shared_index is None:
+            try:
+                _shared_index = EmbeddingIndex()
+            except (OSError, ValueError) as e:
+                logging.error(f"Embedding index unavailable: {e}")
+                return None
+        return _shared_index
@@ -0,0 +1,383 @@
+"""Packed, append-only archive of face crops (``storage_backend: "archive"``).
+
+Instead of one small JPEG per face, encoded crops are appended to segment
+files and located through a fixed-size index::
+
+    <archive_dir>/seg_000001.dat   encoded crops, back to back
+    <archive_dir>/seg_000001.idx   32-byte records: timestamp, offset, length,
+                                   flags, embedding row (see ``INDEX_DTYPE``)
+
+A face is referred to as ``<archive_dir>/seg_000001.dat#<record>``: an absolute,
+path-like string, so it can stand in for a filename in the embedding index,
+clusters and history views. Record numbers never change; deleting a face only
+sets its tombstone flag in place. Reads go through a memory map of the
+segment. Segments roll over at ``archive_segment_bytes``; when retention has
+deleted more than ``archive_compact_ratio`` of a sealed segment, its live
+crops are rewritten into a smaller file (record numbers are kept) and a
+segment with nothing left is removed.
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.utils.config import config
+
+from .embedding_index import _file_lock
+from .face_layout import StoredFace
+from .pipeline_stats import stats
+
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("flags", "u1"),
+    ("pad", "u1", (3,)),
+    ("embedding_row", "<i8"),
+])
+_RECORD = struct.Struct("<dQIB3xq")
+assert _RECORD.size == INDEX_DTYPE.itemsize
+_FLAGS_OFFSET = INDEX_DTYPE.fields["flags"][1]
+_ROW_OFFSET = INDEX_DTYPE.fields["embedding_row"][1]
+FLAG_DELETED = 1
+
+_SEGMENT_RE = re.compile(r"seg_(\d{6})\.dat$")
+_REF_RE = re.compile(r"seg_(\d{6})\.dat#(\d+)$")
+
+Ref = Union[str, Path]
+
+
+def default_archive_dir() -> Path:
+    configured = getattr(config, "archive_dir", "")
+    if configured:
+        return Path(configured)
+    return Path(config.detected_faces_dir) / ".archive"
+
+
+def is_archive_ref(ref: Ref) -> bool:
+    return _REF_RE.search(str(ref)) is not None
+
+
+class FaceArchive:
+    """Append-only segments of encoded crops with a fixed-size, in-place index."""
+
+    def __init__(self, directory: Optional[Path] = None, segment_bytes: Optional[int] = None):
+        self.directory = Path(directory or default_archive_dir())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = int(segment_bytes or getattr(config, "archive_segment_bytes", 64 * 2**20))
+        self.lock_path = self.directory / ".lock"
+        self._lock = threading.RLock()
+        self._maps: Dict[int, Tuple[int, mmap.mmap, int]] = {}  # segment -> (mapped size, map, inode)
+        self._recover()
+        segments = self.segments()
+        self._active = segments[-1] if segments else 1
+
+    # --- files -----------------------------------------------------------
+
+    def _dat(self, segment: int) -> Path:
+        return self.directory / f"seg_{segment:06d}.dat"
+
+    def _idx(self, segment: int) -> Path:
+        return self.directory / f"seg_{segment:06d}.idx"
+
+    def ref(self, segment: int, record: int) -> str:
+        return f"{self._dat(segment)}#{record}"
+
+    @staticmethod
+    def parse_ref(ref: Ref) -> Tuple[int, int]:
+        match = _REF_RE.search(str(ref))
+        if not match:
+            raise ValueError(f"Not an archive reference: {ref}")
+        return int(match.group(1)), int(match.group(2))
+
+    def segments(self) -> List[int]:
+        found = []
+        for path in self.directory.glob("seg_*.dat"):
+            match = _SEGMENT_RE.search(path.name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def _recover(self) -> None:
+        """Finish or roll back a compaction interrupted by a crash."""
+        for pending in self.directory.glob("seg_*.dat.compact"):
+            # the data file was never swapped in: the old pair is intact
+            pending.unlink(missing_ok=True)
+            Path(str(pending).replace(".dat.compact", ".idx.compact")).unlink(missing_ok=True)
+        for pending in self.directory.glob("seg_*.idx.compact"):
+            # the data file was swapped, the index was not
+            os.replace(pending, str(pending)[: -len(".compact")])
+
+    def index(self, segment: int) -> np.ndarray:
+        """Complete index records of a segment (a torn last record is ignored)."""
+        path = self._idx(segment)
+        if not path.exists():
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        count = path.stat().st_size // INDEX_DTYPE.itemsize
+        return np.fromfile(path, dtype=INDEX_DTYPE, count=count)
+
+    def _close_map(self, segment: int) -> None:
+        entry = self._maps.pop(segment, None)
+        if entry is not None:
+            entry[1].close()
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in list(self._maps):
+                self._close_map(segment)
+
+    # --- write -----------------------------------------------------------
+
+    def append(self, data: bytes, timestamp: datetime, embedding_row: int = -1) -> str:
+        """Store one encoded crop; returns its reference."""
+        with self._lock, _file_lock(self.lock_path):
+            dat = self._dat(self._active)
+            if dat.exists() and dat.stat().st_size + len(data) > self.segment_bytes and dat.stat().st_size:
+                self._active += 1
+                dat = self._dat(self._active)
+                stats.incr("archive_segments_rolled")
+            idx = self._idx(self._active)
+            with open(dat, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            with open(idx, "ab") as f:
+                # drop a torn record from an interrupted write
+                record = f.tell() // _RECORD.size
+                if f.tell() % _RECORD.size:
+                    f.truncate(record * _RECORD.size)
+                f.write(_RECORD.pack(timestamp.timestamp(), offset, len(data), 0, int(embedding_row)))
+            ref = self.ref(self._active, record)
+        stats.incr("archive_appends")
+        return ref
+
+    def _patch(self, ref: Ref, field_offset: int, packed: bytes) -> None:
+        segment, record = self.parse_ref(ref)
+        with self._lock, _file_lock(self.lock_path), open(self._idx(segment), "r+b") as f:
+            f.seek(record * _RECORD.size + field_offset)
+            f.write(packed)
+
+    def set_embedding_row(self, ref: Ref, row: int) -> None:
+        self._patch(ref, _ROW_OFFSET, struct.pack("<q", int(row)))
+
+    def delete(self, ref: Ref) -> bool:
+        """Tombstone one crop (its bytes are reclaimed by ``compact``)."""
+        try:
+            self._patch(ref, _FLAGS_OFFSET, bytes([FLAG_DELETED]))
+        except (OSError, ValueError):
+            return False
+        return True
+
+    # --- read ------------------------------------------------------------
+
+    def _record(self, segment: int, record: int) -> Optional[np.void]:
+        path = self._idx(segment)
+        try:
+            with open(path, "rb") as f:
+                f.seek(record * _RECORD.size)
+                raw = f.read(_RECORD.size)
+        except OSError:
+            return None
+        if len(raw) != _RECORD.size:
+            return None
+        return np.frombuffer(raw, dtype=INDEX_DTYPE)[0]
+
+    def read(self, ref: Ref) -> Optional[bytes]:
+        """Encoded bytes of a crop, or None if it was deleted or is missing."""
+        segment, record_no = self.parse_ref(ref)
+        # record and bytes under the same locks: a compaction (here or in another
+        # process) moves both, so they must come from the same generation
+        with self._lock, _file_lock(self.lock_path):
+            record = self._record(segment, record_no)
+            if record is None or record["flags"] & FLAG_DELETED:
+                return None
+            start, end = int(record["offset"]), int(record["offset"]) + int(record["length"])
+            try:
+                inode = os.stat(self._dat(segment)).st_ino
+            except OSError:
+                return None
+            mapped = self._maps.get(segment)
+            if mapped is None or mapped[0] < end or mapped[2] != inode:
+                # first read, the active segment grew past the mapping, or it was rewritten
+                self._close_map(segment)
+                try:
+                    with open(self._dat(segment), "rb") as f:
+                        st = os.fstat(f.fileno())
+                        if st.st_size < end:
+                            return None
+                        mapped = (st.st_size, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), st.st_ino)
+                except (OSError, ValueError):
+                    return None
+                self._maps[segment] = mapped
+            return bytes(mapped[1][start:end])
+
+    def timestamp(self, ref: Ref) -> Optional[datetime]:
+        record = self._record(*self.parse_ref(ref))
+        return None if record is None else datetime.fromtimestamp(float(record["timestamp"]))
+
+    def iter_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[StoredFace]:
+        """Live crops captured in [start, end], one segment index in memory at a time."""
+        lo = start.timestamp() if start else -np.inf
+        hi = end.timestamp() if end else np.inf
+        for segment in self.segments():
+            records = self.index(segment)
+            if not len(records):
+                continue
+            live = (records["flags"] & FLAG_DELETED) == 0
+            mask = live & (records["timestamp"] >= lo) & (records["timestamp"] <= hi)
+            for record_no in np.flatnonzero(mask):
+                yield StoredFace(Path(self.ref(segment, int(record_no))), datetime.fromtimestamp(float(records["timestamp"][record_no])))
+
+    def list_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None, newest_first: bool = True) -> List[StoredFace]:
+        """Live crops captured in [start, end] (one vectorized filter per segment index)."""
+        return sorted(self.iter_range(start, end), key=lambda f: f.timestamp, reverse=newest_first)
+
+    # --- retention -------------------------------------------------------
+
+    def live_records(self) -> List[Tuple[datetime, int, str]]:
+        """(timestamp, size, ref) of every live crop, oldest first (the retention inventory)."""
+        result = []
+        with self._lock:
+            for segment in self.segments():
+                records = self.index(segment)
+                for record_no in np.flatnonzero((records["flags"] & FLAG_DELETED) == 0):
+                    result.append((
+                        datetime.fromtimestamp(float(records["timestamp"][record_no])),
+                        int(records["length"][record_no]),
+                        self.ref(segment, int(record_no)),
+                    ))
+        result.sort(key=lambda r: r[0])
+        return result
+
+    def compact(self, ratio: Optional[float] = None) -> int:
+        """Rewrite sealed segments whose dead bytes exceed ``ratio``; returns bytes reclaimed."""
+        ratio = float(ratio if ratio is not None else getattr(config, "archive_compact_ratio", 0.5))
+        reclaimed = 0
+        with self._lock, _file_lock(self.lock_path):
+            for segment in self.segments():
+                if segment == self._active:
+                    continue
+                records = self.index(segment)
+                size = self._dat(segment).stat().st_size
+                live = (records["flags"] & FLAG_DELETED) == 0
+                live_bytes = int(records["length"][live].sum())
+                if not live.any():
+                    self._close_map(segment)
+                    self._dat(segment).unlink(missing_ok=True)
+                    self._idx(segment).unlink(missing_ok=True)
+                    reclaimed += size
+                    continue
+                if size == 0 or (size - live_bytes) / size <= ratio:
+                    continue
+                reclaimed += self._rewrite(segment, records, live)
+        if reclaimed:
+            stats.incr("archive_bytes_compacted", reclaimed)
+            logging.info("Archive: compacted %.1f MiB", reclaimed / 2**20)
+        return reclaimed
+
+    def _rewrite(self, segment: int, records: np.ndarray, live: np.ndarray) -> int:
+        dat, idx = self._dat(segment), self._idx(segment)
+        dat_tmp = Path(f"{dat}.compact")
+        idx_tmp = Path(f"{idx}.compact")
+        old_size = dat.stat().st_size
+        records = records.copy()
+        with open(dat, "rb") as src, open(dat_tmp, "wb") as dst:
+            for record_no in range(len(records)):
+                if not live[record_no]:
+                    records["offset"][record_no] = 0
+                    records["length"][record_no] = 0
+                    continue
+                src.seek(int(records["offset"][record_no]))
+                data = src.read(int(records["length"][record_no]))
+                records["offset"][record_no] = dst.tell()
+                dst.write(data)
+        records.tofile(idx_tmp)
+        self._close_map(segment)  # Windows can't replace a mapped file
+        os.replace(dat_tmp, dat)
+        os.replace(idx_tmp, idx)
+        return old_size - dat.stat().st_size
+
+
+def read_face_bytes(path: Ref) -> Optional[bytes]:
+    """Encoded crop from the archive or from a plain image file."""
+    if is_archive_ref(path):
+        archive = shared_face_archive() or FaceArchive(Path(str(path)).parent)
+        return archive.read(path)
+    try:
+        return Path(path).read_bytes()
+    except OSError:
+        return None
+
+
+def stored_timestamp(path: Ref) -> Optional[datetime]:
+    """Capture time of an archived crop, or the modification time of a file."""
+    if is_archive_ref(path):
+        archive = shared_face_archive() or FaceArchive(Path(str(path)).parent)
+        return archive.timestamp(path)
+    try:
+        return datetime.fromtimestamp(Path(path).stat().st_mtime)
+    except OSError:
+        return None
+
+
+def delete_stored_face(path: Ref) -> bool:
+    """Tombstone an archived crop or unlink a file."""
+    if is_archive_ref(path):
+        archive = shared_face_archive() or FaceArchive(Path(str(path)).parent)
+        return archive.delete(path)
+    try:
+        Path(path).unlink()
+    except OSError as e:
+        logging.error(f"Failed to delete {path}: {e}")
+        return False
+    return True
+
+
+_shared_archive: Optional[FaceArchive] = None
+_shared_lock = threading.Lock()
+
+
+def shared_face_archive() -> Optional[FaceArchive]:
+    """Archive of the configured faces directory, or None with the "files" backend."""
+    global _shared_archive
+    if getattr(config, "storage_backend", "files") != "archive":
+        return None
+    with _shared_lock:
+        if _shared_archive is None:
+            _shared_archive = FaceArchive()
+        return _shared_archive
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Archivo empaquetado de rostros")
+    parser.add_argument("command", choices=["info", "compact"])
+    parser.add_argument("--dir", type=Path, help="Carpeta del archivo (por defecto detected_faces_dir/.archive)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    archive = FaceArchive(args.dir)
+    if args.command == "compact":
+        print(f"{archive.compact(ratio=0.0) / 2**20:.1f} MiB recuperados")
+    else:
+        total = live = size = 0
+        segments = archive.segments()
+        for segment in segments:
+            records = archive.index(segment)
+            total += len(records)
+            live += int(((records["flags"] & FLAG_DELETED) == 0).sum())
+            size += archive._dat(segment).stat().st_size
+        print(f"{len(segments)} segmentos, {live} rostros activos de {total}, {size / 2**20:.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""Online clustering of saved faces into "people seen" groups.
+
+Every saved embedding is assigned to the most similar cluster centroid, or
+opens a new cluster when nothing exceeds ``cluster_threshold`` (leader
+clustering; centroids are running means on the unit sphere). That order
+dependent first guess is corrected every ``cluster_refine_every`` assignments
+by one ``MiniBatchKMeans`` step over the recent members of the clusters they
+touched: members may move to a better cluster and clusters whose centroids
+converged are merged.
+
+State lives next to the embedding index::
+
+    clusters/state.json        [{"id", "size", "representative", "merged_into", ...}]
+    clusters/centroids.npy     (clusters, dim) float32, unit rows
+    clusters/assignments.jsonl {"filename", "cluster", "timestamp"}, last line wins
+                               ({"filename", "deleted": true} once retention removed it)
+
+Cluster ids are stable; merged clusters keep their id and point at the
+survivor, so ``resolve`` / ``assignments`` always return the surviving id.
+Cluster an existing history (app stopped) with::
+
+    python -m src.modules.cam.face_clusters rebuild
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+
+from .embedding_codec import EmbeddingCodec, load_configured_codec
+from .embedding_index import EmbeddingIndex, _file_lock, shared_embedding_index
+from .pipeline_stats import stats
+
+_MIN_CAPACITY = 64
+_BLOCK_ROWS = 8192
+# centroids of a large raw-dim gallery are big: don't rewrite them on every new cluster
+_SAVE_INTERVAL_SECONDS = 30.0
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class FaceClusters:
+    """Incremental threshold clustering with periodic mini-batch refinement."""
+
+    def __init__(
+        self,
+        directory: Path,
+        codec: Optional[EmbeddingCodec] = None,
+        threshold: Optional[float] = None,
+        refine_every: Optional[int] = None,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.directory / "state.json"
+        self.centroids_path = self.directory / "centroids.npy"
+        self.assignments_path = self.directory / "assignments.jsonl"
+        self.lock_path = self.directory / ".lock"
+        self.codec = codec
+        self.threshold = float(threshold or getattr(config, "cluster_threshold", 0) or getattr(config, "similarity_threshold", 0.6))
+        self.refine_every = max(2, int(refine_every or getattr(config, "cluster_refine_every", 200)))
+        self._lock = threading.RLock()
+        self._clusters: List[Dict] = []              # id -> cluster entry
+        self._centroids: Optional[np.ndarray] = None  # (capacity, dim)
+        self._active: Optional[np.ndarray] = None     # (capacity,) bool, False once merged
+        self._buffer: List[Tuple[str, datetime, np.ndarray, int]] = []
+        self._assignments: Dict[str, int] = {}
+        self._assignments_offset = 0
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+        stats.register_gauge("face_clusters", "Active face clusters", lambda: len(self))
+
+    def __len__(self) -> int:
+        return 0 if self._active is None else int(self._active[:len(self._clusters)].sum())
+
+    # --- persistence -----------------------------------------------------
+
+    def _load(self) -> None:
+        if self.state_path.exists() and self.centroids_path.exists():
+            try:
+                state = json.loads(self.state_path.read_text(encoding="utf-8"))
+                centroids = np.load(self.centroids_path).astype(np.float32)
+            except (OSError, ValueError) as e:
+                logging.error(f"Face clusters: cannot read {self.directory}: {e}")
+                state, centroids = {}, None
+            version = self.codec.version if self.codec is not None else 0
+            if centroids is not None and state.get("projection") != version:
+                logging.warning("Face clusters: projection changed, run 'face_clusters rebuild'")
+            elif centroids is not None:
+                for cluster, centroid in zip(state.get("clusters", []), centroids):
+                    self._append_cluster(cluster, centroid)
+        # ids referenced by assignments written after the last state save stay reserved
+        highest = max(self.assignments().values(), default=-1)
+        while len(self._clusters) <= highest:
+            self._append_cluster({"id": len(self._clusters), "size": 0, "representative": None, "merged_into": None}, None)
+
+    def save(self) -> None:
+        """Write state.json and centroids.npy (atomically replaced)."""
+        with self._lock:
+            n = len(self._clusters)
+            state = {
+                "projection": self.codec.version if self.codec is not None else 0,
+                "threshold": self.threshold,
+                "clusters": self._clusters,
+            }
+            centroids = self._centroids[:n] if self._centroids is not None else np.zeros((0, 0), np.float32)
+            tmp = self.centroids_path.with_suffix(".tmp.npy")
+            np.save(tmp, centroids)
+            tmp.replace(self.centroids_path)
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(state, default=str), encoding="utf-8")
+            tmp.replace(self.state_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def _save_if_due(self) -> None:
+        if self._dirty and time.monotonic() - self._last_save >= _SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    def _write_assignments(self, rows: List[Tuple[str, int, datetime]]) -> None:
+        if not rows:
+            return
+        with _file_lock(self.lock_path), open(self.assignments_path, "a", encoding="utf-8") as f:
+            for filename, cluster_id, timestamp in rows:
+                f.write(json.dumps({"filename": filename, "cluster": cluster_id, "timestamp": timestamp.isoformat()}) + "\n")
+
+    # --- clusters --------------------------------------------------------
+
+    def _project(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.codec is not None:
+            return self.codec.project(embeddings)
+        return _normalize(embeddings)
+
+    def _ensure_capacity(self, needed: int, dim: int) -> None:
+        capacity = 0 if self._centroids is None else len(self._centroids)
+        if needed <= capacity:
+            return
+        capacity = max(_MIN_CAPACITY, capacity)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, dim), dtype=np.float32)
+        active = np.zeros(capacity, dtype=bool)
+        if self._centroids is not None:
+            grown[:len(self._centroids)] = self._centroids
+            active[:len(self._active)] = self._active
+        self._centroids = grown
+        self._active = active
+
+    def _append_cluster(self, cluster: Dict, centroid: Optional[np.ndarray]) -> int:
+        """Add a cluster; ``centroid`` is None for ids whose centroid was never saved."""
+        cluster_id = len(self._clusters)
+        if centroid is not None or self._centroids is not None:
+            dim = len(centroid) if centroid is not None else self._centroids.shape[1]
+            self._ensure_capacity(cluster_id + 1, dim)
+        if centroid is not None:
+            self._centroids[cluster_id] = centroid
+            self._active[cluster_id] = cluster.get("merged_into") is None
+        self._clusters.append(cluster)
+        return cluster_id
+
+    def resolve(self, cluster_id: int) -> int:
+        """Surviving id of a (possibly merged) cluster."""
+        seen = 0
+        while 0 <= cluster_id < len(self._clusters) and self._clusters[cluster_id].get("merged_into") is not None:
+            cluster_id = self._clusters[cluster_id]["merged_into"]
+            seen += 1
+            if seen > len(self._clusters):
+                break
+        return cluster_id
+
+    def _nearest(self, vector: np.ndarray) -> Tuple[int, float]:
+        n = len(self._clusters)
+        if self._centroids is None or n == 0:
+            return -1, -1.0
+        sims = self._centroids[:n] @ vector
+        sims[~self._active[:n]] = -np.inf
+        best = int(np.argmax(sims))
+        return best, float(sims[best])
+
+    def _assign_vector(self, vector: np.ndarray, filename: str, timestamp: datetime) -> int:
+        best, similarity = self._nearest(vector)
+        if best >= 0 and similarity > self.threshold:
+            cluster = self._clusters[best]
+            size = cluster["size"]
+            self._centroids[best] = _normalize(self._centroids[best] * size + vector)[0]
+            cluster["size"] = size + 1
+            cluster["last_seen"] = timestamp.isoformat()
+            if similarity > cluster.get("representative_similarity", -1.0):
+                cluster["representative"] = filename
+                cluster["representative_similarity"] = similarity
+            cluster_id = best
+        else:
+            cluster_id = self._append_cluster(
+                {
+                    "id": len(self._clusters),
+                    "size": 1,
+                    "representative": filename,
+                    "representative_similarity": 1.0,
+                    "merged_into": None,
+                    "first_seen": timestamp.isoformat(),
+                    "last_seen": timestamp.isoformat(),
+                },
+                vector,
+            )
+            stats.incr("clusters_created")
+        self._buffer.append((filename, timestamp, vector, cluster_id))
+        self._dirty = True
+        return cluster_id
+
+    def assign(self, embedding: np.ndarray, filename: str, timestamp: Optional[datetime] = None) -> int:
+        """Cluster one saved face and persist its assignment; returns the cluster id."""
+        timestamp = timestamp or datetime.now()
+        vector = self._project(embedding)[0]
+        with self._lock:
+            cluster_id = self._assign_vector(vector, filename, timestamp)
+            self._write_assignments([(filename, cluster_id, timestamp)])
+            self._assignments[os.path.abspath(filename)] = cluster_id
+            stats.incr("faces_clustered")
+            if len(self._buffer) >= self.refine_every:
+                self.refine()
+            else:
+                self._save_if_due()
+        return cluster_id
+
+    def refine(self) -> int:
+        """One mini-batch k-means step over the buffered members; returns faces moved."""
+        from sklearn.cluster import MiniBatchKMeans
+
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            if len(buffer) < 2:
+                return 0
+            labels = np.array([self.resolve(c) for _f, _t, _v, c in buffer])
+            touched = np.unique(labels)
+            if len(touched) < 2:
+                return 0
+            vectors = np.stack([v for _f, _t, v, _c in buffer])
+            kmeans = MiniBatchKMeans(n_clusters=len(touched), init=self._centroids[touched], n_init=1, batch_size=len(buffer))
+            kmeans.partial_fit(vectors)
+            # blend the step into the long-run centroids, weighted by history size
+            batch_counts = np.bincount(np.searchsorted(touched, labels), minlength=len(touched))
+            for slot, cluster_id in enumerate(touched):
+                prior = max(0, self._clusters[cluster_id]["size"] - batch_counts[slot])
+                weight = prior / (prior + batch_counts[slot]) if prior + batch_counts[slot] else 0.0
+                blended = weight * self._centroids[cluster_id] + (1 - weight) * kmeans.cluster_centers_[slot]
+                self._centroids[cluster_id] = _normalize(blended)[0]
+
+            moved = []
+            new_labels = touched[kmeans.predict(vectors)]
+            for (filename, timestamp, _v, _c), old, new in zip(buffer, labels, new_labels):
+                if old != new:
+                    self._clusters[old]["size"] -= 1
+                    self._clusters[new]["size"] += 1
+                    moved.append((filename, int(new), timestamp))
+            self._write_assignments(moved)
+            for filename, cluster_id, _t in moved:
+                self._assignments[os.path.abspath(filename)] = cluster_id
+
+            merged = self._merge_close(touched)
+            self.save()
+        if moved or merged:
+            logging.info("Face clusters: refined %s faces, %s moved, %s merged", len(buffer), len(moved), merged)
+        return len(moved)
+
+    def _merge_close(self, candidates: np.ndarray) -> int:
+        """Fold each candidate into a larger active cluster its centroid now matches."""
+        merged = 0
+        for cluster_id in candidates:
+            cluster_id = int(cluster_id)
+            if not self._active[cluster_id]:
+                continue
+            self._active[cluster_id] = False
+            other, similarity = self._nearest(self._centroids[cluster_id])
+            self._active[cluster_id] = True
+            if other < 0 or similarity <= self.threshold:
+                continue
+            keep, drop = (other, cluster_id) if self._clusters[other]["size"] >= self._clusters[cluster_id]["size"] else (cluster_id, other)
+            keep_size, drop_size = self._clusters[keep]["size"], self._clusters[drop]["size"]
+            self._centroids[keep] = _normalize(self._centroids[keep] * keep_size + self._centroids[drop] * drop_size)[0]
+            self._clusters[keep]["size"] = keep_size + drop_size
+            self._clusters[drop]["merged_into"] = keep
+            self._active[drop] = False
+            merged += 1
+        return merged
+
+    # --- queries ---------------------------------------------------------
+
+    def assignments(self) -> Dict[str, int]:
+        """Absolute filename -> surviving cluster id (new lines are read incrementally)."""
+        with self._lock:
+            if self.assignments_path.exists() and self.assignments_path.stat().st_size > self._assignments_offset:
+                with open(self.assignments_path, "r", encoding="utf-8") as f:
+                    f.seek(self._assignments_offset)
+                    for line in f:
+                        if not line.endswith("\n"):
+                            break  # torn tail, re-read next time
+                        self._assignments_offset += len(line.encode("utf-8"))
+                        try:
+                            row = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if row.get("deleted"):
+                            self._assignments.pop(os.path.abspath(row["filename"]), None)
+                        else:
+                            self._assignments[os.path.abspath(row["filename"])] = int(row["cluster"])
+            return {filename: self.resolve(cluster_id) for filename, cluster_id in self._assignments.items()}
+
+    def forget(self, filenames: List[str]) -> int:
+        """Remove deleted crops from their clusters; representatives move to a remaining member."""
+        self.assignments()  # pick up lines written by other processes first
+        with self._lock:
+            removed = []
+            orphaned = set()
+            for name in filenames:
+                path = os.path.abspath(str(name))
+                cluster_id = self._assignments.pop(path, None)
+                if cluster_id is None:
+                    continue
+                cluster = self._clusters[self.resolve(cluster_id)]
+                cluster["size"] = max(0, cluster["size"] - 1)
+                representative = cluster.get("representative")
+                if representative and os.path.abspath(representative) == path:
+                    cluster["representative"] = None
+                    cluster["representative_similarity"] = -1.0
+                    orphaned.add(cluster["id"])
+                removed.append(path)
+            if not removed:
+                return 0
+            if orphaned:
+                for path, cluster_id in self._assignments.items():
+                    survivor = self.resolve(cluster_id)
+                    if survivor in orphaned:
+                        self._clusters[survivor]["representative"] = path
+                        orphaned.discard(survivor)
+                        if not orphaned:
+                            break
+            gone = set(removed)
+            self._buffer = [b for b in self._buffer if os.path.abspath(b[0]) not in gone]
+            with _file_lock(self.lock_path), open(self.assignments_path, "a", encoding="utf-8") as f:
+                for path in removed:
+                    f.write(json.dumps({"filename": path, "deleted": True}) + "\n")
+            self._dirty = True
+            self._save_if_due()
+        return len(removed)
+
+    def cluster_info(self, cluster_id: int) -> Dict:
+        with self._lock:
+            return dict(self._clusters[self.resolve(cluster_id)])
+
+    def clusters(self) -> List[Dict]:
+        """Active clusters, largest first."""
+        with self._lock:
+            active = [dict(c) for c in self._clusters if c.get("merged_into") is None and c["size"] > 0]
+        return sorted(active, key=lambda c: c["size"], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clusters = []
+            self._centroids = None
+            self._active = None
+            self._buffer = []
+            self._assignments = {}
+            self._assignments_offset = 0
+            self.assignments_path.unlink(missing_ok=True)
+            self.save()
+
+
+def rebuild(clusters: FaceClusters, index: EmbeddingIndex) -> int:
+    """Re-cluster every indexed face in capture order; returns the number of faces."""
+    clusters.reset()
+    entries = sorted((e for e in index.entries() if e.get("filename")), key=lambda e: e["timestamp"])
+    vectors = index.vectors()
+    done = 0
+    for start in range(0, len(entries), _BLOCK_ROWS):
+        block = entries[start:start + _BLOCK_ROWS]
+        projected = clusters._project(np.asarray(vectors[[e["row"] for e in block]]))
+        rows = []
+        with clusters._lock:
+            for entry, vector in zip(block, projected):
+                timestamp = datetime.fromisoformat(entry["timestamp"])
+                rows.append((entry["filename"], clusters._assign_vector(vector, entry["filename"], timestamp), timestamp))
+                if len(clusters._buffer) >= clusters.refine_every:
+                    clusters._write_assignments(rows)
+                    rows = []
+                    clusters.refine()
+            clusters._write_assignments(rows)
+        done += len(block)
+        logging.info("Face clusters: %s/%s faces, %s clusters", done, len(entries), len(clusters))
+    clusters.refine()
+    clusters.flush()
+    return done
+
+
+def clusters_dir(index_dir: Path) -> Path:
+    return Path(index_dir) / "clusters"
+
+
+_shared_clusters: Optional[FaceClusters] = None
+_shared_lock = threading.Lock()
+
+
+def shared_face_clusters() -> Optional[FaceClusters]:
+    """Clusters of the shared embedding index, or None when clustering is disabled."""
+    global _shared_clusters
+    if not getattr(config, "clustering_enabled", True):
+        return None
+    index = shared_embedding_index()
+    if index is None:
+        return None
+    with _shared_lock:
+        if _shared_clusters is None:
+            _shared_clusters = FaceClusters(clusters_dir(index.directory), codec=load_configured_codec(index.directory))
+        return _shared_clusters
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Agrupar rostros guardados por persona")
+    parser.add_argument("command", choices=["rebuild", "info"])
+    parser.add_argument("--index-dir", type=Path, help="Indice de embeddings (por defecto el configurado)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    index = EmbeddingIndex(args.index_dir) if args.index_dir else shared_embedding_index() or EmbeddingIndex()
+    clusters = FaceClusters(clusters_dir(index.directory), codec=load_configured_codec(index.directory))
+    if args.command == "rebuild":
+        total = rebuild(clusters, index)
+        print(f"{total} rostros agrupados en {len(clusters)} personas")
+        return 0
+    active = clusters.clusters()
+    print(f"{len(active)} personas, {sum(c['size'] for c in active)} rostros")
+    for cluster in active[:20]:
+        print(f"  #{cluster['id']}: {cluster['size']} rostros, ultimo {cluster.get('last_seen')}, {cluster.get('representative')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
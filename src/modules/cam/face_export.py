@@ -0,0 +1,409 @@
+"""Streaming export of saved detections to a zip or tar with a manifest.
+
+Crops captured between two dates are written one at a time into the output
+archive (``.zip``, ``.tar``, ``.tar.gz``/``.tgz``), followed by a manifest
+(``manifest.json`` or ``manifest.csv``) with timestamp, quality, file size and,
+optionally, the embedding of every crop. The manifest is spooled to a
+temporary file while the crops are written, so memory use does not depend on
+how many detections are exported::
+
+    python -m src.modules.cam.face_export auditoria.zip --from "2025-01-01" --to "2025-01-31 23:59"
+    python -m src.modules.cam.face_export auditoria.tar.gz --manifest csv --embeddings
+
+Detections are read from the embedding index (which carries quality and the
+embedding row); run the backfill first so crops saved before the index existed
+are included. With the index disabled, the stored crops are listed shard by
+shard instead and the manifest has no quality or embedding. The output is
+written next to its final name as ``.part`` and renamed only when complete.
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.utils.config import config
+
+from .embedding_index import EmbeddingIndex, shared_embedding_index
+from .face_archive import FaceArchive, is_archive_ref, read_face_bytes, shared_face_archive
+from .face_layout import ShardedLayout, StoredFace, _is_image, timestamp_from_name
+from .pipeline_stats import stats
+
+MANIFEST_FIELDS = ("file", "source", "timestamp", "quality", "size_bytes", "embedding")
+CONTAINER_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+ProgressCallback = Callable[["ExportProgress"], None]
+
+
+class ExportProgress(NamedTuple):
+    done: int
+    total: int
+    bytes_written: int
+
+
+class ExportSummary(NamedTuple):
+    path: Path
+    exported: int
+    missing: int
+    bytes_written: int
+    cancelled: bool
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _Detection(NamedTuple):
+    source: str
+    timestamp: datetime
+    quality: Optional[str]
+    embedding_row: Optional[int]
+
+
+def container_kind(path: Path) -> str:
+    name = path.name.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar.gz"
+    if name.endswith(".tar"):
+        return "tar"
+    raise ValueError(f"Unsupported export format (use {', '.join(CONTAINER_SUFFIXES)}): {path.name}")
+
+
+def _image_suffix(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+
+def _in_range(ts: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    return (not start or ts >= start) and (not end or ts <= end)
+
+
+class _ContainerWriter:
+    """Adds members one by one to a zip or a (compressed) tar."""
+
+    def __init__(self, path: Path, kind: str):
+        self.kind = kind
+        if kind == "zip":
+            # crops are already compressed; only the manifest is deflated
+            self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._tar = tarfile.open(path, "w:gz" if kind == "tar.gz" else "w")
+
+    def add_bytes(self, name: str, data: bytes, timestamp: datetime) -> None:
+        if self.kind == "zip":
+            info = zipfile.ZipInfo(name, date_time=max(timestamp, datetime(1980, 1, 1)).timetuple()[:6])
+            self._zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = timestamp.timestamp()
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name: str, handle, size: int) -> None:
+        handle.seek(0)
+        if self.kind == "zip":
+            info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with self._zip.open(info, "w", force_zip64=True) as dest:
+                shutil.copyfileobj(handle, dest)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = time.time()
+            self._tar.addfile(info, handle)
+
+    def close(self) -> None:
+        if self.kind == "zip":
+            self._zip.close()
+        else:
+            self._tar.close()
+
+
+class _ManifestWriter:
+    """Manifest rows spooled to a temporary file (JSON array or CSV)."""
+
+    def __init__(self, fmt: str, include_embeddings: bool):
+        if fmt not in ("json", "csv"):
+            raise ValueError(f"Unsupported manifest format: {fmt}")
+        self.fmt = fmt
+        self.fields = MANIFEST_FIELDS if include_embeddings else MANIFEST_FIELDS[:-1]
+        self._handle = tempfile.TemporaryFile(mode="w+b")
+        self._text = io.TextIOWrapper(self._handle, encoding="utf-8", newline="")
+        self._rows = 0
+        if fmt == "csv":
+            self._csv = csv.writer(self._text)
+            self._csv.writerow(self.fields)
+        else:
+            self._text.write("[\n")
+
+    @property
+    def name(self) -> str:
+        return f"manifest.{self.fmt}"
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self.fmt == "csv":
+            values = []
+            for field in self.fields:
+                value = row.get(field)
+                if field == "embedding" and value is not None:
+                    value = " ".join(f"{v:.6g}" for v in value)
+                values.append("" if value is None else value)
+            self._csv.writerow(values)
+        else:
+            if self._rows:
+                self._text.write(",\n")
+            self._text.write(json.dumps({field: row.get(field) for field in self.fields}))
+        self._rows += 1
+
+    def finish(self) -> Tuple[Any, int]:
+        """The binary handle (rewound by the caller) and its size."""
+        if self.fmt == "json":
+            self._text.write("\n]\n")
+        self._text.flush()
+        self._text.detach()
+        return self._handle, self._handle.tell()
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+class DetectionExporter:
+    """Selects detections in a time range and streams them into an archive."""
+
+    def __init__(
+        self,
+        index: Optional[EmbeddingIndex] = None,
+        layout: Optional[ShardedLayout] = None,
+        archive: Optional[FaceArchive] = None,
+        use_index: bool = True,
+    ):
+        self.index = shared_embedding_index() if index is None and use_index else index
+        self.layout = layout or ShardedLayout()
+        self.archive = archive if archive is not None else shared_face_archive()
+
+    # --- selection -------------------------------------------------------
+
+    def _from_index(self, start: Optional[datetime], end: Optional[datetime]) -> Iterator[_Detection]:
+        rows = len(self.index)
+        deleted = self.index.deleted()
+        with open(self.index.entries_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    ts = datetime.fromisoformat(entry["timestamp"])
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    continue
+                if not entry.get("filename") or entry.get("row", rows) >= rows or not _in_range(ts, start, end):
+                    continue
+                if not self.index.is_live(entry, deleted):
+                    continue  # removed by retention
+                yield _Detection(entry["filename"], ts, entry.get("quality"), int(entry["row"]))
+
+    def _from_storage(self, start: Optional[datetime], end: Optional[datetime]) -> Iterator[_Detection]:
+        # one shard (at most an hour of crops) in memory at a time
+        for face in self.layout._flat_files():
+            if _in_range(face.timestamp, start, end):
+                yield _Detection(str(face.path), face.timestamp, None, None)
+        for _hour, shard in self.layout.shards(start, end):
+            faces = []
+            with os.scandir(shard) as it:
+                for entry in it:
+                    if entry.is_file() and _is_image(entry.name):
+                        ts = timestamp_from_name(entry.name) or datetime.fromtimestamp(entry.stat().st_mtime)
+                        if _in_range(ts, start, end):
+                            faces.append(StoredFace(Path(entry.path), ts))
+            for face in sorted(faces, key=lambda f: f.timestamp):
+                yield _Detection(str(face.path), face.timestamp, None, None)
+        if self.archive is not None:
+            for face in self.archive.iter_range(start, end):
+                yield _Detection(str(face.path), face.timestamp, None, None)
+
+    def detections(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[_Detection]:
+        if self.index is not None and self.index.entries_path.exists():
+            return self._from_index(start, end)
+        return self._from_storage(start, end)
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        return sum(1 for _ in self.detections(start, end))
+
+    def _read(self, detection: _Detection) -> Optional[bytes]:
+        data = read_face_bytes(detection.source)
+        if data is None and not is_archive_ref(detection.source):
+            # moved by ``face_layout migrate``, or indexed relative to another working directory
+            data = read_face_bytes(self.layout.shard_dir(detection.timestamp) / Path(detection.source).name)
+        return data
+
+    # --- export ----------------------------------------------------------
+
+    def export(
+        self,
+        output: Path,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        manifest: str = "json",
+        include_embeddings: bool = False,
+        progress: Optional[ProgressCallback] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> ExportSummary:
+        """Write every detection in [start, end] plus a manifest to ``output``."""
+        output = Path(output)
+        kind = container_kind(output)
+        total = self.count(start, end)
+        vectors = self.index.vectors() if include_embeddings and self.index is not None else None
+        partial = output.with_name(output.name + ".part")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        rows = _ManifestWriter(manifest, include_embeddings)
+        writer = _ContainerWriter(partial, kind)
+        done = missing = written = 0
+        cancelled = False
+        try:
+            for detection in self.detections(start, end):
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                data = self._read(detection)
+                if data is None:
+                    missing += 1
+                    logging.warning(f"Export: crop not found, skipped: {detection.source}")
+                else:
+                    ts = detection.timestamp
+                    name = f"faces/{ts:%Y-%m-%d}/{ts:%H}/face_{ts:%Y%m%d_%H%M%S_%f}_{done:07d}{_image_suffix(data)}"
+                    writer.add_bytes(name, data, ts)
+                    embedding = None
+                    if vectors is not None and detection.embedding_row is not None and detection.embedding_row < len(vectors):
+                        embedding = [float(v) for v in vectors[detection.embedding_row]]
+                    rows.write({
+                        "file": name,
+                        "source": detection.source,
+                        "timestamp": ts.isoformat(),
+                        "quality": detection.quality,
+                        "size_bytes": len(data),
+                        "embedding": embedding,
+                    })
+                    written += len(data)
+                    stats.incr("faces_exported")
+                done += 1
+                if progress is not None:
+                    progress(ExportProgress(done, max(total, done), written))
+            handle, size = rows.finish()
+            writer.add_file(rows.name, handle, size)
+            writer.close()
+            os.replace(partial, output)
+        except ExportCancelled:
+            cancelled = True
+            writer.close()
+            partial.unlink(missing_ok=True)
+        except BaseException:
+            writer.close()
+            partial.unlink(missing_ok=True)
+            raise
+        finally:
+            rows.close()
+        exported = done - missing
+        if cancelled:
+            logging.info(f"Export cancelled after {done} of {total} detections")
+        else:
+            logging.info(f"Exported {exported} detections ({written / 2**20:.1f} MiB) to {output}; {missing} missing")
+        return ExportSummary(output, exported, missing, written, cancelled)
+
+
+def export_detections(
+    output: Path,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    manifest: Optional[str] = None,
+    include_embeddings: Optional[bool] = None,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+) -> ExportSummary:
+    """Export with the configured faces directory, index and archive."""
+    return DetectionExporter().export(
+        output,
+        start,
+        end,
+        manifest=manifest or getattr(config, "export_manifest_format", "json"),
+        include_embeddings=bool(getattr(config, "export_include_embeddings", False) if include_embeddings is None else include_embeddings),
+        progress=progress,
+        cancel=cancel,
+    )
+
+
+def parse_datetime(value: str) -> datetime:
+    """``YYYY-MM-DD`` or ``YYYY-MM-DD HH:MM[:SS]``."""
+    return datetime.fromisoformat(value.strip())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Exporta detecciones entre dos fechas a un zip/tar con manifiesto")
+    parser.add_argument("output", type=Path, help="Archivo de salida (.zip, .tar, .tar.gz)")
+    parser.add_argument("--from", dest="start", type=parse_datetime, help="Desde (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--to", dest="end", type=parse_datetime, help="Hasta (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--manifest", choices=["json", "csv"], help="Formato del manifiesto")
+    parser.add_argument("--embeddings", action="store_true", default=None, help="Incluir el embedding de cada rostro")
+    parser.add_argument("--dir", type=Path, help="Carpeta de rostros (por defecto detected_faces_dir)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        container_kind(args.output)
+    except ValueError as e:
+        print(e)
+        return 2
+
+    last = {"t": 0.0}
+
+    def report(p: ExportProgress) -> None:
+        now = time.monotonic()
+        if now - last["t"] >= 0.5 or p.done == p.total:
+            last["t"] = now
+            pct = 100.0 * p.done / p.total if p.total else 100.0
+            print(f"\r{p.done}/{p.total} ({pct:5.1f}%) {p.bytes_written / 2**20:8.1f} MiB", end="", flush=True)
+
+    if args.dir:
+        exporter = DetectionExporter(
+            index=EmbeddingIndex(args.dir / ".index") if (args.dir / ".index").exists() else None,
+            layout=ShardedLayout(args.dir),
+            archive=FaceArchive(args.dir / ".archive") if (args.dir / ".archive").exists() else None,
+            use_index=False,
+        )
+    else:
+        exporter = DetectionExporter()
+    try:
+        summary = exporter.export(
+            args.output,
+            args.start,
+            args.end,
+            manifest=args.manifest or getattr(config, "export_manifest_format", "json"),
+            include_embeddings=bool(getattr(config, "export_include_embeddings", False) if args.embeddings is None else args.embeddings),
+            progress=report,
+        )
+    except KeyboardInterrupt:
+        print("\nExportacion cancelada")
+        return 130
+    print()
+    print(f"{summary.exported} detecciones exportadas a {summary.path} ({summary.bytes_written / 2**20:.1f} MiB)")
+    if summary.missing:
+        print(f"{summary.missing} recorte(s) no encontrados (eliminados por retencion o movidos)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""Date/hour sharded layout of ``detected_faces_dir`` plus a retention sweeper.
+
+Saved crops go to ``<root>/YYYY-MM-DD/HH/face_YYYYmmdd_HHMMSS_ffffff.jpg``; the
+name is reserved with an exclusive create, so two saves in the same instant get
+``_1``, ``_2``... instead of overwriting each other. No directory grows past one
+hour of detections, and listing a time range only reads the shards it covers.
+Files from the old flat layout (``<root>/face_*.jpg``) are still listed and
+swept; ``python -m src.modules.cam.face_layout migrate`` moves them into shards.
+
+``RetentionSweeper`` enforces ``retention_max_age_days``, ``retention_max_bytes``
+and ``retention_max_count`` (0 = unlimited) from a background thread, deleting
+oldest first. When the packed ``FaceArchive`` is used as well, the limits hold
+for both stores together: their crops form one inventory ordered by capture
+time. Per-shard totals are cached by directory mtime, so a sweep only
+rescans the shards that changed since the previous one.
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.utils.config import config
+
+from .pipeline_stats import stats
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+_DAY_FORMAT = "%Y-%m-%d"
+_NAME_RE = re.compile(r"(\d{8}_\d{6})(?:_(\d{6}))?")
+
+
+class StoredFace(NamedTuple):
+    path: Path
+    timestamp: datetime
+
+
+def timestamp_from_name(name: str) -> Optional[datetime]:
+    """Capture time encoded in ``face_YYYYmmdd_HHMMSS[_ffffff]`` names."""
+    match = _NAME_RE.search(name)
+    if not match:
+        return None
+    try:
+        ts = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+    return ts.replace(microsecond=int(match.group(2))) if match.group(2) else ts
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_SUFFIXES)
+
+
+class ShardedLayout:
+    """Where crops are written and how time ranges are listed."""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or config.detected_faces_dir)
+
+    def shard_dir(self, timestamp: datetime) -> Path:
+        return self.root / timestamp.strftime(_DAY_FORMAT) / timestamp.strftime("%H")
+
+    def reserve(self, timestamp: datetime, suffix: str = ".jpg") -> Path:
+        """Create (empty) and return a unique path for a crop captured at ``timestamp``."""
+        directory = self.shard_dir(timestamp)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"face_{timestamp.strftime('%Y%m%d_%H%M%S_%f')}"
+        path = directory / f"{stem}{suffix}"
+        n = 0
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                n += 1
+                path = directory / f"{stem}_{n}{suffix}"
+
+    def write(self, timestamp: datetime, data: bytes, suffix: str = ".jpg") -> Path:
+        """Write already encoded image bytes under a reserved name."""
+        path = self.reserve(timestamp, suffix)
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    def shards(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Tuple[datetime, Path]]:
+        """(hour start, directory) of every shard overlapping [start, end], oldest first."""
+        if not self.root.is_dir():
+            return
+        first_day = start.date() if start else None
+        last_day = end.date() if end else None
+        days = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                try:
+                    day = datetime.strptime(entry.name, _DAY_FORMAT)
+                except ValueError:
+                    continue  # .index, identities, ...
+                if (first_day and day.date() < first_day) or (last_day and day.date() > last_day):
+                    continue
+                days.append((day, entry.path))
+        for day, day_path in sorted(days):
+            hours = []
+            with os.scandir(day_path) as it:
+                for entry in it:
+                    if entry.is_dir() and entry.name.isdigit():
+                        hours.append((day + timedelta(hours=int(entry.name)), Path(entry.path)))
+            for hour, path in sorted(hours):
+                if (start and hour + timedelta(hours=1) <= start) or (end and hour > end):
+                    continue
+                yield hour, path
+
+    def _flat_files(self) -> Iterator[StoredFace]:
+        """Crops of the old flat layout, directly under the root."""
+        if not self.root.is_dir():
+            return
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and _is_image(entry.name):
+                    ts = timestamp_from_name(entry.name) or datetime.fromtimestamp(entry.stat().st_mtime)
+                    yield StoredFace(Path(entry.path), ts)
+
+    def list_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        newest_first: bool = True,
+    ) -> List[StoredFace]:
+        """Stored crops captured in [start, end], reading only the shards involved."""
+        faces = [f for f in self._flat_files() if (not start or f.timestamp >= start) and (not end or f.timestamp <= end)]
+        for _hour, shard in self.shards(start, end):
+            with os.scandir(shard) as it:
+                for entry in it:
+                    if not (entry.is_file() and _is_image(entry.name)):
+                        continue
+                    ts = timestamp_from_name(entry.name) or datetime.fromtimestamp(entry.stat().st_mtime)
+                    if (not start or ts >= start) and (not end or ts <= end):
+                        faces.append(StoredFace(Path(entry.path), ts))
+        faces.sort(key=lambda f: f.timestamp, reverse=newest_first)
+        return faces
+
+    def migrate_flat(self) -> int:
+        """Move old flat-layout crops into their shards; returns files moved."""
+        moved = 0
+        for face in list(self._flat_files()):
+            target = self.reserve(face.timestamp, face.path.suffix.lower())
+            os.replace(face.path, target)
+            moved += 1
+        return moved
+
+
+class RetentionPolicy(NamedTuple):
+    max_age_days: float = 0
+    max_total_bytes: int = 0
+    max_count: int = 0
+
+    @classmethod
+    def from_config(cls) -> "RetentionPolicy":
+        return cls(
+            float(getattr(config, "retention_max_age_days", 0) or 0),
+            int(getattr(config, "retention_max_bytes", 0) or 0),
+            int(getattr(config, "retention_max_count", 0) or 0),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age_days or self.max_total_bytes or self.max_count)
+
+
+class RetentionSweeper:
+    """Deletes the oldest crops until the retention policy holds."""
+
+    def __init__(
+        self,
+        layout: Optional[ShardedLayout] = None,
+        policy: Optional[RetentionPolicy] = None,
+        interval_seconds: Optional[float] = None,
+        archive=None,
+    ):
+        self.layout = layout or ShardedLayout()
+        # packed FaceArchive (storage_backend "archive"), counted together with the files
+        self.archive = archive
+        self.policy = policy or RetentionPolicy.from_config()
+        self.interval_seconds = float(interval_seconds or getattr(config, "retention_sweep_interval_seconds", 3600))
+        # shard path -> (mtime_ns, [(timestamp, size, path)] oldest first)
+        self._shard_cache: Dict[str, Tuple[int, List[Tuple[datetime, int, str]]]] = {}
+        self._listeners: List[Callable[[List[Path]], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, callback: Callable[[List[Path]], None]) -> None:
+        """``callback(paths)`` runs after each batch of deletions."""
+        self._listeners.append(callback)
+
+    def _notify(self, deleted: List[Path]) -> None:
+        with _sweeper_lock:
+            callbacks = self._listeners + _retention_listeners
+        for callback in callbacks:
+            try:
+                callback(deleted)
+            except Exception as e:
+                logging.error(f"Retention listener failed: {e}")
+
+    def _shard_files(self, shard: Path) -> List[Tuple[datetime, int, str]]:
+        mtime = shard.stat().st_mtime_ns
+        cached = self._shard_cache.get(str(shard))
+        if cached and cached[0] == mtime:
+            return cached[1]
+        files = []
+        with os.scandir(shard) as it:
+            for entry in it:
+                if entry.is_file() and _is_image(entry.name):
+                    st = entry.stat()
+                    files.append((timestamp_from_name(entry.name) or datetime.fromtimestamp(st.st_mtime), st.st_size, entry.path))
+        files.sort()
+        self._shard_cache[str(shard)] = (mtime, files)
+        return files
+
+    def _inventory(self) -> List[Tuple[Optional[Path], List[Tuple[datetime, int, str]]]]:
+        """(shard, files) oldest first; the flat legacy files form a shard of their own."""
+        flat = sorted((f.timestamp, f.path.stat().st_size, str(f.path)) for f in self.layout._flat_files())
+        shards: List[Tuple[Optional[Path], List[Tuple[datetime, int, str]]]] = [(None, flat)] if flat else []
+        live = set()
+        for _hour, shard in self.layout.shards():
+            live.add(str(shard))
+            shards.append((shard, self._shard_files(shard)))
+        for stale in set(self._shard_cache) - live:
+            del self._shard_cache[stale]
+        return shards
+
+    def sweep(self, now: Optional[datetime] = None) -> Tuple[int, int]:
+        """Apply the policy once; returns (crops deleted, bytes freed).
+
+        Files and archived crops count against the same limits, and the oldest
+        crop of either store goes first.
+        """
+        if not self.policy.enabled:
+            return 0, 0
+        now = now or datetime.now()
+        inventory = self._inventory()
+        archived = self.archive.live_records() if self.archive is not None else []
+        total_count = sum(len(files) for _s, files in inventory) + len(archived)
+        total_bytes = sum(size for _s, files in inventory for _t, size, _p in files) + sum(size for _t, size, _r in archived)
+        cutoff = now - timedelta(days=self.policy.max_age_days) if self.policy.max_age_days else None
+
+        def over_limit() -> bool:
+            return bool(
+                (self.policy.max_count and total_count > self.policy.max_count)
+                or (self.policy.max_total_bytes and total_bytes > self.policy.max_total_bytes)
+            )
+
+        deleted: List[Path] = []
+        freed = 0
+        remaining = []
+        for shard, files in inventory:
+            newest = files[-1][0] if files else None
+            if shard is not None and newest is not None and cutoff is not None and newest < cutoff:
+                # the whole shard expired: one rmtree instead of per-file unlinks
+                shutil.rmtree(shard, ignore_errors=True)
+                deleted.extend(Path(p) for _t, _s, p in files)
+                freed += sum(size for _t, size, _p in files)
+                total_count -= len(files)
+                total_bytes -= sum(size for _t, size, _p in files)
+                self._shard_cache.pop(str(shard), None)
+                self._remove_empty_day(shard)
+            else:
+                remaining.append((shard, files))
+
+        # oldest first across the remaining files (shard by shard) and the archive
+        files_stream = ((ts, size, path, shard, False) for shard, files in remaining for ts, size, path in files)
+        archive_stream = ((ts, size, ref, None, True) for ts, size, ref in archived)
+        touched = set()
+        archive_deleted = 0
+        for ts, size, path, shard, in_archive in heapq.merge(files_stream, archive_stream, key=lambda item: item[0]):
+            if not ((cutoff is not None and ts < cutoff) or over_limit()):
+                break
+            if in_archive:
+                if not self.archive.delete(path):
+                    continue
+                archive_deleted += 1
+            else:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Retention: cannot delete {path}: {e}")
+                    continue
+                if shard is not None:
+                    touched.add(shard)
+            deleted.append(Path(path))
+            freed += size
+            total_count -= 1
+            total_bytes -= size
+        for shard in touched:
+            self._remove_empty_day(shard)
+
+        if deleted:
+            stats.incr("retention_deleted", len(deleted))
+            logging.info(
+                "Retention: deleted %s crop(s) (%s archived), freed %.1f MiB", len(deleted), archive_deleted, freed / 2**20
+            )
+            self._notify(deleted)
+        if self.archive is not None:
+            self.archive.compact()
+        return len(deleted), freed
+
+    def _remove_empty_day(self, shard: Path) -> None:
+        for directory in (shard, shard.parent):
+            try:
+                directory.rmdir()  # only succeeds when empty
+            except OSError:
+                break
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Retention sweep failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="retention-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_sweeper: Optional[RetentionSweeper] = None
+_sweeper_lock = threading.Lock()
+# notified by every sweeper of this process, including one started later
+_retention_listeners: List[Callable[[List[Path]], None]] = []
+
+
+def add_retention_listener(callback: Callable[[List[Path]], None]) -> None:
+    """``callback(paths)`` runs after any retention sweep of this process deletes crops."""
+    with _sweeper_lock:
+        _retention_listeners.append(callback)
+
+
+def forget_deleted(paths: List[Path]) -> None:
+    """Hide deleted crops from the embedding index, the loaded search and the clusters."""
+    from .embedding_index import shared_embedding_index
+    from .face_search import forget_deleted as forget_in_search
+
+    from .face_clusters import shared_face_clusters
+
+    filenames = [str(path) for path in paths]
+    # each store is pruned on its own: one being unavailable must not skip the others
+    index = shared_embedding_index()
+    if index is not None:
+        index.mark_deleted(filenames)
+    forget_in_search(filenames)
+    clusters = shared_face_clusters()
+    if clusters is not None:
+        clusters.forget(filenames)
+
+
+def start_retention_sweeper() -> Optional[RetentionSweeper]:
+    """Start the process-wide sweeper; a no-op (None) when no retention limit is configured."""
+    global _sweeper
+    policy = RetentionPolicy.from_config()
+    if not policy.enabled:
+        return None
+    with _sweeper_lock:
+        if _sweeper is None:
+            from .face_archive import shared_face_archive
+
+            _sweeper = RetentionSweeper(policy=policy, archive=shared_face_archive())
+            _sweeper.add_listener(forget_deleted)
+            _sweeper.start()
+            logging.info("Retention sweeper started: %s", policy)
+        return _sweeper
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Organizacion y retencion de rostros guardados")
+    parser.add_argument("command", choices=["migrate", "sweep", "info"])
+    parser.add_argument("--dir", type=Path, help="Carpeta de rostros (por defecto detected_faces_dir)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    layout = ShardedLayout(args.dir)
+    if args.command == "migrate":
+        print(f"{layout.migrate_flat()} archivo(s) movidos a {layout.root}")
+    elif args.command == "sweep":
+        policy = RetentionPolicy.from_config()
+        if not policy.enabled:
+            print("No hay limites de retencion configurados (retention_max_*)")
+            return 1
+        archive = None
+        if args.dir is None:
+            from .face_archive import shared_face_archive
+
+            archive = shared_face_archive()
+        sweeper = RetentionSweeper(layout, policy, archive=archive)
+        if args.dir is None:
+            sweeper.add_listener(forget_deleted)  # the shared index lives under detected_faces_dir
+        deleted, freed = sweeper.sweep()
+        print(f"{deleted} archivo(s) eliminados, {freed / 2**20:.1f} MiB liberados")
+    else:
+        faces = layout.list_range()
+        shards = sum(1 for _ in layout.shards())
+        print(f"{len(faces)} rostros en {shards} carpetas horarias")
+        if faces:
+            print(f"  del {faces[-1].timestamp:%Y-%m-%d %H:%M} al {faces[0].timestamp:%Y-%m-%d %H:%M}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,11 +7,18 @@ import urllib.request
 import hashlib
 import zipfile
 import sys
+import threading
 from src.utils.config import config
 
+from .pipeline_stats import stats
+
 class FaceRecognition:
-    def __init__(self):
-        """Initialize face recognition with ResNet model."""
+    def __init__(self, load_dnn: bool = True):
+        """Initialize face recognition with ResNet model.
+
+        With ``load_dnn=False`` no model is downloaded or loaded and detection uses
+        the Haar cascade only (offline benchmarks, boxes without the model files).
+        """
         # Load model paths and thresholds from config
         self.models_dir = getattr(config, 'models_dir', 'models')
         mf = getattr(config, 'model_files', {}) or {}
@@ -24,14 +31,18 @@ class FaceRecognition:
         # Create models directory (models_dir may be a Path)
         Path(self.models_dir).mkdir(parents=True, exist_ok=True)
 
-        # Download or load models
-        self._ensure_models_exist()
+        self.face_net = None
+        if load_dnn:
+            # Download or load models
+            self._ensure_models_exist()
 
-        # Load DNN face detector (convert to str for OpenCV)
-        model_path = Path(self.models_dir) / self.model_files["model"]
-        config_path = Path(self.models_dir) / self.model_files["config"]
+            # Load DNN face detector (convert to str for OpenCV)
+            model_path = Path(self.models_dir) / self.model_files["model"]
+            config_path = Path(self.models_dir) / self.model_files["config"]
 
-        self.face_net = cv2.dnn.readNetFromCaffe(str(config_path), str(model_path))
+            self.face_net = cv2.dnn.readNetFromCaffe(str(config_path), str(model_path))
+        # cv2.dnn.Net is not thread-safe; serialize setInput/forward pairs
+        self._net_lock = threading.Lock()
 
         # Load face detector cascade as backup
         self.face_cascade = cv2.CascadeClassifier(
@@ -64,33 +75,52 @@ class FaceRecognition:
 
     def detect_faces(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """Detect faces using DNN model with cascade fallback."""
+        return self.detect_faces_batch([frame])[0]
+
+    def detect_faces_batch(self, frames: List[np.ndarray]) -> List[List[Tuple[int, int, int, int]]]:
+        """Detect faces on several frames with a single DNN forward pass.
+
+        Returns one list of (x, y, w, h) boxes per input frame, in the same order.
+        """
+        if not frames:
+            return []
+        if self.face_net is None:
+            return [self._detect_faces_cascade(frame) for frame in frames]
         try:
-            # DNN detection
-            blob = cv2.dnn.blobFromImage(
-                frame, 1.0, (300, 300), 
+            # DNN detection; blobFromImages resizes every frame to 300x300
+            blob = cv2.dnn.blobFromImages(
+                frames, 1.0, (300, 300),
                 [104, 117, 123], False, False
             )
-            self.face_net.setInput(blob)
-            detections = self.face_net.forward()
-            
-            faces = []
-            h, w = frame.shape[:2]
-            
-            for i in range(detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > 0.5:
-                    box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                    x1, y1, x2, y2 = box.astype(int)
-                    faces.append((x1, y1, x2-x1, y2-y1))
-            
+            with self._net_lock:
+                self.face_net.setInput(blob)
+                detections = self.face_net.forward()
+
+            # SSD output is [1, 1, N, 7] with rows (image_id, label, conf, x1, y1, x2, y2)
+            rows = detections.reshape(-1, 7)
+            rows = rows[rows[:, 2] > 0.5]
+
+            faces: List[List[Tuple[int, int, int, int]]] = [[] for _ in frames]
+            for row in rows:
+                idx = int(row[0])
+                if idx < 0 or idx >= len(frames):
+                    continue
+                h, w = frames[idx].shape[:2]
+                box = row[3:7] * np.array([w, h, w, h])
+                x1, y1, x2, y2 = box.astype(int)
+                faces[idx].append((x1, y1, x2-x1, y2-y1))
+
             return faces
-            
+
         except Exception as e:
             print(f"DNN detection failed, falling back to cascade: {e}")
             # Fallback to cascade detector
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            return [tuple(map(int, face)) for face in faces]
+            return [self._detect_faces_cascade(frame) for frame in frames]
+
+    def _detect_faces_cascade(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        return [tuple(map(int, face)) for face in faces]
 
     def get_face_embedding(self, face_img: np.ndarray) -> Optional[np.ndarray]:
         """Extract face features using HOG and LBP."""
@@ -182,13 +212,14 @@ class FaceRecognition:
             print(f"Error checking face quality: {e}")
             return False, "Error analyzing face"
 
-    def process_face(self, frame: np.ndarray, face_coords: Tuple[int, int, int, int]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[str]]:
-        """Process detected face and return cropped image with embedding and quality message."""
+    def crop_face(self, frame: np.ndarray, face_coords: Tuple[int, int, int, int]) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Quality gate plus the padded 112x112 crop, without computing the embedding."""
         try:
             # Check face quality first
-            is_quality_ok, quality_message = self.check_face_quality(frame, face_coords)
+            with stats.time("quality_gate"):
+                is_quality_ok, quality_message = self.check_face_quality(frame, face_coords)
             if not is_quality_ok:
-                return None, None, quality_message
+                return None, quality_message
             
             x, y, w, h = face_coords
             pad = 20
@@ -199,9 +230,29 @@ class FaceRecognition:
             
             face_img = frame[y1:y2, x1:x2]
             face_img = cv2.resize(face_img, (112, 112))
-            embedding = self.get_face_embedding(face_img)
-            
-            return face_img, embedding, quality_message
+            return face_img, quality_message
         except Exception as e:
             print(f"Error processing face: {e}")
-            return None, None, "Error processing face"
+            return None, "Error processing face"
+
+    def process_face(self, frame: np.ndarray, face_coords: Tuple[int, int, int, int]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[str]]:
+        """Process detected face and return cropped image with embedding and quality message."""
+        face_img, quality_message = self.crop_face(frame, face_coords)
+        if face_img is None:
+            return None, None, quality_message
+        with stats.time("embedding"):
+            embedding = self.get_face_embedding(face_img)
+        return face_img, embedding, quality_message
+
+
+_shared_recognizer: Optional[FaceRecognition] = None
+_shared_lock = threading.Lock()
+
+
+def shared_recognizer() -> FaceRecognition:
+    """Process-wide recognizer (the DNN is loaded once); starts no threads."""
+    global _shared_recognizer
+    with _shared_lock:
+        if _shared_recognizer is None:
+            _shared_recognizer = FaceRecognition()
+        return _shared_recognizer
@@ -0,0 +1,210 @@
+"""Reverse face search over the detection history ("when was this person seen?").
+
+Works entirely from the persistent ``EmbeddingIndex``: stored JPEGs are never
+decoded. Rows are projected with the configured codec (if any) into an
+in-memory float32 matrix that is extended incrementally as new faces are saved
+(only the appended tail of ``entries.jsonl`` is parsed, and the matrix grows by
+doubling), so a query is one embedding plus one matrix product (or an IVF lookup once
+``ann_enabled`` and the history exceeds ``ann_min_gallery``). Without a
+projection the matrix holds the raw 8100-dim rows; large histories should
+configure ``embedding_projection``.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+
+from .ann_index import IVFIndex
+from .embedding_codec import EmbeddingCodec, load_configured_codec
+from .embedding_index import EmbeddingIndex, shared_embedding_index
+from .face_recognition import FaceRecognition
+
+_BLOCK_ROWS = 8192
+_MIN_CAPACITY = 1024
+
+
+class SearchHit(NamedTuple):
+    filename: str
+    timestamp: datetime
+    similarity: float
+    quality: Optional[str]
+
+
+class FaceSearch:
+    """Top-k most similar historical detections for a query face."""
+
+    def __init__(self, index: Optional[EmbeddingIndex] = None, codec: Optional[EmbeddingCodec] = None):
+        self.index = index or shared_embedding_index() or EmbeddingIndex()
+        self.codec = codec if codec is not None else load_configured_codec(self.index.directory)
+        self._lock = threading.Lock()
+        self._entries: List[Dict] = []
+        self._by_filename: Dict[str, int] = {}
+        # rows [0, len(self._entries)) are in use, the rest is spare capacity
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._entries_offset = 0  # bytes of entries.jsonl already loaded
+        self._deleted_offset = 0  # bytes of deleted.txt already applied
+        self._deleted: Set[str] = set()
+        self._ann: Optional[IVFIndex] = None
+
+    def _project(self, vectors: np.ndarray) -> np.ndarray:
+        if self.codec is not None:
+            return self.codec.project(vectors)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _ensure_capacity(self, needed: int, dim: int) -> None:
+        capacity = len(self._matrix)
+        if needed <= capacity and self._matrix.shape[1] == dim:
+            return
+        capacity = max(_MIN_CAPACITY, capacity)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, dim), dtype=np.float32)
+        used = len(self._entries)
+        if used:
+            grown[:used] = self._matrix[:used]
+        self._matrix = grown
+
+    def _forget_locked(self, filenames: List[str]) -> List[int]:
+        positions = []
+        for name in filenames:
+            position = self._by_filename.pop(os.path.abspath(str(name)), None)
+            if position is not None:
+                positions.append(position)
+                self._entries[position]["deleted"] = True
+                self._matrix[position] = 0.0
+        if positions and self._ann is not None:
+            self._ann.remove(positions)
+        return positions
+
+    def refresh(self) -> int:
+        """Load rows appended (and apply deletions made) since the last call; returns the history size."""
+        with self._lock:
+            removed, self._deleted_offset = self.index.deleted_since(self._deleted_offset)
+            if removed:
+                self._deleted.update(os.path.abspath(name) for name in removed)
+                self._forget_locked(removed)
+            new_entries, self._entries_offset = self.index.entries_since(self._entries_offset)
+            new_entries = [e for e in new_entries if self.index.is_live(e, self._deleted)]
+            if not new_entries:
+                return len(self._entries)
+            vectors = self.index.vectors()
+            rows = np.array([e["row"] for e in new_entries], dtype=np.int64)
+            start = len(self._entries)
+            for offset in range(0, len(rows), _BLOCK_ROWS):
+                # project in blocks so the raw 8100-dim rows are never all in memory
+                projected = self._project(np.asarray(vectors[rows[offset:offset + _BLOCK_ROWS]]))
+                self._ensure_capacity(start + len(rows), projected.shape[1])  # grows on the first block only
+                self._matrix[start + offset:start + offset + len(projected)] = projected
+            for offset, entry in enumerate(new_entries):
+                entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+                self._entries.append(entry)
+                if entry.get("filename"):
+                    self._by_filename[os.path.abspath(entry["filename"])] = start + offset
+            if getattr(config, "ann_enabled", False):
+                added = self._matrix[start:len(self._entries)]
+                if self._ann is None:
+                    self._ann = IVFIndex(
+                        dim=added.shape[1],
+                        nlist=int(getattr(config, "ann_nlist", 0)) or None,
+                        nprobe=int(getattr(config, "ann_nprobe", 8)),
+                        train_size=int(getattr(config, "ann_min_gallery", 2048)),
+                    )
+                self._ann.add(added, np.arange(start, len(self._entries)))
+            logging.info("Face search: %s detections loaded (+%s)", len(self._entries), len(new_entries))
+            return len(self._entries)
+
+    def forget(self, filenames: List[str]) -> int:
+        """Drop detections whose crops were deleted; returns how many were loaded."""
+        with self._lock:
+            return len(self._forget_locked(filenames))
+
+    def embedding_for(self, filename: str) -> Optional[np.ndarray]:
+        """Projected embedding of an already indexed detection, or None."""
+        self.refresh()
+        position = self._by_filename.get(os.path.abspath(filename))
+        return None if position is None else self._matrix[position]
+
+    def search_vector(self, query: np.ndarray, k: int = 20, exclude: Optional[str] = None) -> List[SearchHit]:
+        """Search with a vector already in the projected space (see ``embedding_for``)."""
+        self.refresh()
+        n = len(self._entries)
+        if n == 0:
+            return []
+        wanted = min(n, k + (1 if exclude else 0))
+        if self._ann is not None and len(self._ann) >= self._ann.train_size:
+            ids, sims = self._ann.search(query, k=wanted)
+        else:
+            sims = self._matrix[:n] @ (query / (np.linalg.norm(query) or 1.0))
+            ids = np.argpartition(-sims, wanted - 1)[:wanted]
+            ids = ids[np.argsort(-sims[ids])]
+            sims = sims[ids]
+        excluded = os.path.abspath(exclude) if exclude else None
+        hits = []
+        for i, sim in zip(ids, sims):
+            entry = self._entries[int(i)]
+            if entry.get("deleted"):
+                continue
+            if excluded and entry.get("filename") and os.path.abspath(entry["filename"]) == excluded:
+                continue
+            hits.append(SearchHit(entry.get("filename") or "", entry["timestamp"], float(sim), entry.get("quality")))
+        return hits[:k]
+
+    def search_embedding(self, embedding: np.ndarray, k: int = 20) -> List[SearchHit]:
+        """Search with a raw embedding from ``FaceRecognition.get_face_embedding``."""
+        return self.search_vector(self._project(np.atleast_2d(embedding))[0], k=k)
+
+    def search_detection(self, filename: str, k: int = 20) -> List[SearchHit]:
+        """Detections similar to a stored one (its embedding comes from the index)."""
+        query = self.embedding_for(filename)
+        if query is None:
+            return []
+        return self.search_vector(query, k=k, exclude=filename)
+
+    def search_image(self, image: np.ndarray, recognizer: FaceRecognition, k: int = 20) -> List[SearchHit]:
+        """Detect the largest face of ``image``, embed it once and search."""
+        from .identity_gallery import enrollment_sample
+
+        _face, embedding, message = enrollment_sample(recognizer, image)
+        if embedding is None:
+            logging.info("Face search: no usable face in query image (%s)", message)
+            return []
+        return self.search_embedding(embedding, k=k)
+
+    def search_file(self, path: Path, recognizer: FaceRecognition, k: int = 20) -> List[SearchHit]:
+        """Search with a detection (indexed) or any other image on disk."""
+        if self.embedding_for(str(path)) is not None:
+            return self.search_detection(str(path), k=k)
+        image = cv2.imread(str(path))
+        if image is None:
+            return []
+        return self.search_image(image, recognizer, k=k)
+
+
+_shared_search: Optional[FaceSearch] = None
+_shared_lock = threading.Lock()
+
+
+def shared_face_search() -> FaceSearch:
+    global _shared_search
+    with _shared_lock:
+        if _shared_search is None:
+            _shared_search = FaceSearch()
+        return _shared_search
+
+
+def forget_deleted(filenames: List[str]) -> int:
+    """Prune the shared search, if it was ever loaded (a new one reads the index afresh)."""
+    with _shared_lock:
+        search = _shared_search
+    return search.forget(filenames) if search is not None else 0
@@ -1,33 +1,78 @@
 import logging
-import cv2
 import base64
 from datetime import datetime, timedelta
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 import os
+from .embedding_codec import EmbeddingCodec, load_configured_codec
+from .embedding_index import EmbeddingIndex, shared_embedding_index
+from .face_archive import FaceArchive, shared_face_archive
+from .face_clusters import FaceClusters, clusters_dir, shared_face_clusters
+from .face_layout import ShardedLayout, add_retention_listener
 from .face_recognition import FaceRecognition
+from .image_encoding import face_encoding
+from .perceptual_hash import RecentHashes, dhash
+from .recent_faces import RecentFaces
+from .pipeline_stats import stats
 from src.utils.config import config
 
 class FaceStorage:
-    def __init__(self):
+    def __init__(self, face_recognizer: Optional[FaceRecognition] = None, save_dir: Optional[Path] = None):
         self.faces: List[Dict] = []
 
         # Load values from config (config.detected_faces_dir is a Path)
-        self.save_dir: Path = Path(config.detected_faces_dir)
+        self.save_dir: Path = Path(save_dir or config.detected_faces_dir)
         self.last_detection_time = datetime.now()
         # Minimum time between attempts to save (avoid extremely rapid saves)
         self.min_detection_interval = timedelta(seconds=float(config.min_detection_interval_seconds))
         # Don't save repeats within this many seconds for the same face
         self.repeat_interval_seconds = float(config.repeat_interval_seconds)
-        # Track last saved face (embedding + timestamp) to quickly detect repeats
-        self.last_saved: Optional[Dict] = None
-        self.face_recognizer = FaceRecognition()
+        # normalized embeddings of faces saved within the dedup window, in time buckets
+        self.recent = RecentFaces(
+            max(float(config.recent_seconds), self.repeat_interval_seconds),
+            bucket_seconds=float(getattr(config, "recent_bucket_seconds", 1.0)),
+            max_faces=int(getattr(config, "recent_max_faces", 10000)),
+        )
+        # records kept for search(); the oldest are dropped past this many
+        self.max_faces_in_memory = int(getattr(config, "max_faces_in_memory", 20000))
+        self.face_recognizer = face_recognizer or FaceRecognition()
+        # dHash of recently saved crops: rejects obvious repeats before the embedding
+        self.hash_cache: Optional[RecentHashes] = None
+        if getattr(config, "phash_prefilter", True):
+            self.hash_cache = RecentHashes(self.repeat_interval_seconds, int(getattr(config, "phash_max_distance", 6)))
 
         # ensure save dir exists
         self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.layout = ShardedLayout(self.save_dir)
+        # format/quality/grayscale of the saved crops (see image_encoding)
+        self.encoding = face_encoding()
+        # packed segments instead of one file per crop (see face_archive)
+        self.archive: Optional[FaceArchive] = None
+        if getattr(config, "storage_backend", "files") == "archive":
+            self.archive = shared_face_archive() if save_dir is None else FaceArchive(self.save_dir / ".archive")
         self.setup_logging()
 
+        # persistent embeddings of saved crops (shared with the backfill job)
+        self.index: Optional[EmbeddingIndex] = None
+        if getattr(config, "embedding_index_enabled", True):
+            self.index = shared_embedding_index() if save_dir is None else EmbeddingIndex(self.save_dir / ".index")
+        # optional projection/quantization of the in-memory gallery (raw rows stay in the index)
+        self.codec: Optional[EmbeddingCodec] = load_configured_codec(self.index.directory if self.index else None)
+        # the dedup window keeps the compact codes and scores them with the codec's kernels
+        self.recent.use_codec(self.codec)
+        # online "same person" groups of saved faces (see face_clusters)
+        self.clusters: Optional[FaceClusters] = None
+        if self.index is not None and getattr(config, "clustering_enabled", True):
+            self.clusters = shared_face_clusters() if save_dir is None else FaceClusters(clusters_dir(self.index.directory), codec=self.codec)
+        # filenames deleted by retention, dropped from self.faces by the saving thread
+        self._forgotten: List[str] = []
+        if save_dir is None:
+            add_retention_listener(self.forget_files)
+        self._restore_recent()
+        stats.register_gauge("face_storage_faces", "Face records held in memory by FaceStorage", lambda: len(self.faces))
+        stats.register_gauge("face_storage_recent", "Faces inside the dedup window", lambda: len(self.recent))
+
     def setup_logging(self):
         log_dir = "logs"
         os.makedirs(log_dir, exist_ok=True)
@@ -41,27 +86,87 @@ class FaceStorage:
         )
         self.logger = logging.getLogger(__name__)
 
-    def find_similar_face(self, new_embedding: np.ndarray, recent_seconds: int = None) -> Optional[Dict]:
-        """Return a stored face dict that is similar to new_embedding (within recent_seconds), or None."""
-        if not self.faces or new_embedding is None:
+    def _restore_recent(self) -> None:
+        """Reload faces saved within the dedup window, so a restart doesn't re-save them."""
+        if self.index is None:
+            return
+        window = max(float(config.recent_seconds), self.repeat_interval_seconds)
+        try:
+            recent = self.index.recent(datetime.now() - timedelta(seconds=window))
+        except Exception as e:
+            self.logger.error(f"Failed to read embedding index: {e}")
+            return
+        for entry, embedding in recent:
+            record = self._make_record(embedding, entry["timestamp"], entry.get("filename"), entry.get("quality"))
+            self.faces.append(record)
+            self._register(record, self._query_vector(embedding))
+
+    def _make_record(self, embedding: np.ndarray, timestamp: datetime, filename: Optional[str], quality: Optional[str]) -> Dict:
+        """In-memory face record; holds the compact code instead of the raw embedding when a codec is set."""
+        record = {"timestamp": timestamp, "quality": quality, "filename": filename}
+        if self.codec is not None:
+            codes, scales = self.codec.encode(embedding)
+            record["code"] = codes[0]
+            record["scale"] = float(scales[0])
+        else:
+            record["embedding"] = np.asarray(embedding, dtype=np.float32)
+        return record
+
+    def _record_vector(self, record: Dict) -> np.ndarray:
+        """Float32 vector of a record in the space the dedup window compares."""
+        if "code" in record:
+            return self.codec.decode(record["code"][None, :], np.array([record["scale"]], dtype=np.float32))[0]
+        return np.asarray(record["embedding"], dtype=np.float32)
+
+    def _query_vector(self, embedding: np.ndarray) -> np.ndarray:
+        if self.codec is not None:
+            return self.codec.project(embedding)[0]
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _register(self, record: Dict, vector: Optional[np.ndarray] = None) -> None:
+        """Add a record to the dedup window."""
+        if "code" in record:
+            self.recent.add_code(record["code"], record["scale"], record, record["timestamp"])
+        else:
+            vector = self._record_vector(record) if vector is None else vector
+            self.recent.add(vector, record, record["timestamp"])
+
+    def rebuild_search_index(self) -> None:
+        """Re-register every in-memory record (after replacing ``self.faces`` wholesale)."""
+        self.recent.use_codec(self.codec)
+        for record in self.faces:
+            self._register(record)
+
+    def forget_files(self, paths: List[Path]) -> None:
+        """Retention listener: queue deleted crops; they leave the gallery on the next save."""
+        self._forgotten.extend(os.path.abspath(str(path)) for path in paths)
+
+    def _drop_forgotten(self) -> None:
+        if not self._forgotten:
+            return
+        pending, self._forgotten = self._forgotten, []
+        forgotten = set(pending)
+        self.faces = [f for f in self.faces if not (f.get("filename") and os.path.abspath(f["filename"]) in forgotten)]
+
+    def _trim_faces(self) -> None:
+        """Drop the oldest records past ``max_faces_in_memory`` (in chunks, to amortize the list copy)."""
+        self._drop_forgotten()
+        excess = len(self.faces) - self.max_faces_in_memory
+        if excess <= max(1, self.max_faces_in_memory // 10):
+            return
+        del self.faces[:excess]
+
+    def find_similar_face(self, new_embedding: np.ndarray, recent_seconds: Optional[float] = None, now: Optional[datetime] = None) -> Optional[Dict]:
+        """Most recent stored face similar to new_embedding within recent_seconds of now, or None."""
+        if new_embedding is None:
             return None
         if recent_seconds is None:
             recent_seconds = float(config.recent_seconds)
-
-        recent_time = datetime.now() - timedelta(seconds=float(recent_seconds))
-        recent_faces = [f for f in self.faces if f["timestamp"] > recent_time]
-
-        for stored_face in recent_faces:
-            if "embedding" in stored_face:
-                try:
-                    if self.face_recognizer.are_same_person(
-                        new_embedding,
-                        np.array(stored_face["embedding"])
-                    ):
-                        return stored_face
-                except Exception as e:
-                    self.logger.debug(f"Error comparing embeddings: {e}")
-        return None
+        now = now or datetime.now()
+        match = self.recent.most_recent_similar(
+            self._query_vector(new_embedding), self.face_recognizer.distance_threshold, now, float(recent_seconds)
+        )
+        return match.record if match else None
 
     def save_face(self, frame: np.ndarray, face_coords: Tuple[int, int, int, int]) -> bool:
         """Save face if quality ok and not duplicate within repeat interval."""
@@ -69,65 +174,120 @@ class FaceStorage:
         if current_time - self.last_detection_time < self.min_detection_interval:
             return False
 
-        face_img, embedding, quality_message = self.face_recognizer.process_face(frame, face_coords)
-
-        if face_img is None or embedding is None:
+        face_img, quality_message = self.face_recognizer.crop_face(frame, face_coords)
+        if face_img is None:
             self.logger.warning(f"Face rejected: {quality_message}")
             return False
+        if self.is_hash_duplicate(face_img, current_time):
+            return False
 
-        # Quick check against last saved face to avoid immediate repeats
-        if self.last_saved and "embedding" in self.last_saved:
-            try:
-                last_emb = np.array(self.last_saved["embedding"])
-                if self.face_recognizer.are_same_person(embedding, last_emb):
-                    elapsed_last = (current_time - self.last_saved["timestamp"]).total_seconds()
-                    if elapsed_last < self.repeat_interval_seconds:
-                        self.logger.info(f"Similar to last saved (elapsed {int(elapsed_last)}s) — skipping save")
-                        return False
-                    else:
-                        self.logger.info(f"Similar to last saved but older ({int(elapsed_last)}s) — will save")
-            except Exception as e:
-                self.logger.debug(f"Error comparing with last_saved: {e}")
+        with stats.time("embedding"):
+            embedding = self.face_recognizer.get_face_embedding(face_img)
+        if embedding is None:
+            self.logger.warning("Face rejected: embedding failed")
+            return False
+
+        return self._store_face(face_img, embedding, quality_message, current_time)
+
+    def is_hash_duplicate(self, face_img: np.ndarray, now: Optional[datetime] = None) -> bool:
+        """Fast path: True when the crop's dHash matches a face saved within repeat_interval_seconds."""
+        if self.hash_cache is None:
+            return False
+        with stats.time("hash_prefilter"):
+            match = self.hash_cache.match(dhash(face_img), now)
+        stats.incr("phash_checks")
+        if match is None:
+            return False
+        stats.incr("phash_duplicates")
+        stats.incr("faces_duplicate")
+        self.logger.debug(f"Perceptual hash duplicate (distance {match[0]}, {int(match[1])}s ago) — skipping save")
+        return True
+
+    def save_analyzed_face(
+        self,
+        face_img: np.ndarray,
+        embedding: np.ndarray,
+        quality_message: str,
+        timestamp: Optional[datetime] = None,
+    ) -> bool:
+        """Save a face already cropped/embedded elsewhere (e.g. by the analysis pool).
+
+        ``timestamp`` is the capture time (media time when ingesting files); dedup
+        and the minimum save interval are evaluated against it instead of now.
+        """
+        current_time = timestamp or datetime.now()
+        # a timestamp earlier than the last save (out-of-order files) is not throttled
+        if timedelta(0) <= current_time - self.last_detection_time < self.min_detection_interval:
+            return False
+        if face_img is None or embedding is None:
+            return False
+        return self._store_face(face_img, embedding, quality_message, current_time)
 
-        # Fallback: check other recent stored faces (older records)
-        similar = self.find_similar_face(embedding, recent_seconds=float(config.recent_seconds))
-        if similar is not None:
-            elapsed = (current_time - similar["timestamp"]).total_seconds()
-            if elapsed < self.repeat_interval_seconds:
-                self.logger.info(f"Similar face detected (elapsed {int(elapsed)}s) — skipping save")
-                return False
-            self.logger.info(f"Similar face found but older ({int(elapsed)}s) — saving new record")
+    def _store_face(self, face_img: np.ndarray, embedding: np.ndarray, quality_message: str, current_time: datetime) -> bool:
+        """Apply repeat checks and persist the face crop."""
+        with stats.time("dedup_lookup"):
+            duplicate_of = self._recent_duplicate(embedding, current_time)
+        if duplicate_of is not None:
+            stats.incr("faces_duplicate")
+            if self.hash_cache is not None:
+                # later frames of this repeat can stop at the hash, until the original save expires
+                self.hash_cache.add(dhash(face_img), duplicate_of)
+            return False
 
         # encode + save
-        ok, buf = cv2.imencode(".jpg", face_img)
-        if not ok:
+        with stats.time("disk_save"):
+            saved = self._write_face(face_img, embedding, quality_message, current_time)
+        if saved:
+            stats.incr("faces_saved")
+        return saved
+
+    def _recent_duplicate(self, embedding: np.ndarray, current_time: datetime) -> Optional[datetime]:
+        """Save time of the same person if saved less than repeat_interval_seconds ago, else None."""
+        record = self.find_similar_face(embedding, self.repeat_interval_seconds, current_time)
+        if record is None:
+            return None
+        elapsed = (current_time - record["timestamp"]).total_seconds()
+        self.logger.info(f"Similar face detected (elapsed {int(elapsed)}s) — skipping save")
+        return record["timestamp"]
+
+    def _write_face(self, face_img: np.ndarray, embedding: np.ndarray, quality_message: str, current_time: datetime) -> bool:
+        data = self.encoding.encode(face_img)
+        if data is None:
             self.logger.error("Failed to encode face image")
             return False
 
-        b64_img = base64.b64encode(buf).decode("utf-8")
-        timestamp_str = current_time.strftime('%Y%m%d_%H%M%S')
-        filepath = self.save_dir / f"face_{timestamp_str}.jpg"
-        filename = str(filepath)
+        b64_img = base64.b64encode(data).decode("utf-8")
         try:
-            cv2.imwrite(filename, face_img)
+            if self.archive is not None:
+                filename = self.archive.append(data, current_time)
+            else:
+                # date/hour shard, collision-free name (see face_layout)
+                filename = str(self.layout.write(current_time, data, self.encoding.suffix))
         except Exception as e:
             self.logger.error(f"Failed to write face image to disk: {e}")
             filename = None
 
-        face_data = {
-            "timestamp": current_time,
-            "image": b64_img,
-            "embedding": embedding.tolist(),
-            "quality": quality_message,
-            "filename": filename
-        }
+        face_data = self._make_record(embedding, current_time, filename, quality_message)
+        face_data["image"] = b64_img
+        if self.hash_cache is not None:
+            self.hash_cache.add(dhash(face_img), current_time)
         self.faces.append(face_data)
+        self._register(face_data, self._query_vector(embedding))
+        self._trim_faces()
         self.last_detection_time = current_time
-        # update last_saved reference
-        try:
-            self.last_saved = {"timestamp": current_time, "embedding": embedding.tolist(), "filename": filename}
-        except Exception:
-            self.last_saved = None
+        if self.index is not None and filename is not None:
+            try:
+                row = self.index.add(embedding, filename, current_time, quality_message)
+                if self.archive is not None:
+                    self.archive.set_embedding_row(filename, row)
+            except Exception as e:
+                self.logger.error(f"Failed to append embedding to index: {e}")
+        if self.clusters is not None and filename is not None:
+            try:
+                with stats.time("cluster"):
+                    face_data["cluster"] = self.clusters.assign(embedding, filename, current_time)
+            except Exception as e:
+                self.logger.error(f"Failed to cluster saved face: {e}")
 
         self.logger.info(f"New face saved at {current_time.strftime('%Y-%m-%d %H:%M:%S')} - Quality: {quality_message} - file: {filename}")
         return True
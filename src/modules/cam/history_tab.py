@@ -1,18 +1,36 @@
 import asyncio
+import threading
+import time
 from pathlib import Path
-import cv2
-import base64
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import flet as ft
-from typing import List
+from typing import Dict, List, Optional
 from src.utils.config import config
 
+from .face_archive import delete_stored_face, shared_face_archive, stored_timestamp
+from .face_clusters import shared_face_clusters
+from .face_export import ExportProgress, export_detections, parse_datetime
+from .face_layout import ShardedLayout, StoredFace
+from .face_recognition import shared_recognizer
+from .face_search import SearchHit, shared_face_search
+from .thumbnail_cache import thumbnail_cache
+
+
+# history period choices: dropdown key -> look-back (None = everything)
+PERIODS = {
+    "1h": ("Última hora", timedelta(hours=1)),
+    "24h": ("Últimas 24 horas", timedelta(days=1)),
+    "7d": ("Últimos 7 días", timedelta(days=7)),
+    "all": ("Todo", None),
+}
+
 
 class HistoryTab:
     def __init__(self, page: ft.Page, images_dir=None):
         self.page = page
         self.images_dir: Path = self._resolve_images_dir(images_dir)
+        self.layout = ShardedLayout(self.images_dir)
         self.path_text = ft.Text(self._path_message(), size=12, color="#616161")
         self.count_label = ft.Text("Imágenes registradas:", size=13, color="#424242")
         self.count_value = ft.Text("0", size=16, weight=ft.FontWeight.W_600, color="#212121")
@@ -23,8 +41,36 @@ class HistoryTab:
             expand=True,
         )
         self.refresh_button = ft.FilledTonalButton("Actualizar historial", on_click=lambda e: self.refresh(e))
+        self.search_picker = ft.FilePicker(on_result=self._on_search_file_picked)
+        self.page.overlay.append(self.search_picker)
+        self.search_button = ft.OutlinedButton(
+            "Buscar por foto",
+            icon=ft.Icons.IMAGE_SEARCH,
+            on_click=lambda e: self.search_picker.pick_files(allow_multiple=False, file_type=ft.FilePickerFileType.IMAGE),
+        )
+        self.export_picker = ft.FilePicker(on_result=self._on_export_target_picked)
+        self.page.overlay.append(self.export_picker)
+        self.export_button = ft.OutlinedButton(
+            "Exportar",
+            icon=ft.Icons.ARCHIVE_OUTLINED,
+            on_click=lambda e: self._open_export_dialog(),
+        )
+        self.group_switch = ft.Switch(
+            label="Agrupar por persona",
+            value=False,
+            disabled=not getattr(config, "clustering_enabled", True),
+            on_change=lambda e: self.refresh(e),
+        )
+        # only the date/hour shards of the selected period are read
+        self.period_dropdown = ft.Dropdown(
+            options=[ft.dropdown.Option(key, label) for key, (label, _span) in PERIODS.items()],
+            value=getattr(config, "history_default_period", "24h"),
+            width=190,
+            dense=True,
+            on_change=lambda e: self.refresh(e),
+        )
         self.header_row = ft.Row(
-            controls=[self.count_row, self.refresh_button],
+            controls=[self.count_row, self.period_dropdown, self.group_switch, self.search_button, self.export_button, self.refresh_button],
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
             vertical_alignment=ft.CrossAxisAlignment.CENTER,
         )
@@ -39,6 +85,10 @@ class HistoryTab:
         )
         self.dialog = None
         self.confirm = None
+        self.results_dialog = None
+        self.export_dialog = None
+        self.export_options = None
+        self.export_cancel: Optional[threading.Event] = None
         self.pending_refresh = False
         self._auto_refresh_interval = 10
         self._auto_refresh_task = None
@@ -66,30 +116,22 @@ class HistoryTab:
         return base_message
 
     def _encode_image(self, path: Path, max_side: int = 600) -> str:
-        img = cv2.imread(str(path))
-        if img is None:
-            logging.error(f"HistoryTab: failed to read image: {path}")
-            return ""
-        h, w = img.shape[:2]
-        scale = min(1.0, max_side / max(w, h))
-        if scale != 1.0:
-            img = cv2.resize(img, (int(w * scale), int(h * scale)))
-        ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        if not ok:
-            logging.error(f"HistoryTab: failed to encode image: {path}")
-            return ""
-        return base64.b64encode(buf).decode("utf-8")
-
-    def _list_images(self) -> List[Path]:
+        return thumbnail_cache.get(path, max_side)
+
+    def _list_images(self) -> List[StoredFace]:
         if not self.images_dir.exists() or not self.images_dir.is_dir():
             logging.warning(f"HistoryTab: images_dir does not exist: {self.images_dir}")
             return []
+        _label, span = PERIODS.get(self.period_dropdown.value, PERIODS["24h"])
+        start: Optional[datetime] = datetime.now() - span if span else None
         try:
-            files = [p for p in self.images_dir.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png')]
+            files = self.layout.list_range(start=start)
+            archive = shared_face_archive()
+            if archive is not None:
+                files = sorted(files + archive.list_range(start=start), key=lambda f: f.timestamp, reverse=True)
         except Exception as e:
             logging.error(f"HistoryTab: failed to list directory {self.images_dir}: {e}")
             return []
-        files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
         logging.info(f"HistoryTab: found {len(files)} image files in {self.images_dir}")
         return files
 
@@ -98,7 +140,8 @@ class HistoryTab:
         if not b64:
             return
         large_img = ft.Image(src_base64=b64, fit=ft.ImageFit.CONTAIN, width=800, height=600)
-        timestamp = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        captured = stored_timestamp(path)
+        timestamp = captured.strftime("%Y-%m-%d %H:%M:%S") if captured else "-"
         filename = path.name
 
         def on_delete(e):
@@ -108,6 +151,7 @@ class HistoryTab:
             title=ft.Text(filename),
             content=ft.Column([ft.Text(f"Detectado: {timestamp}", size=12), large_img], spacing=10),
             actions=[
+                ft.TextButton("Buscar similares", on_click=lambda e: self._start_search(path)),
                 ft.TextButton("Eliminar", on_click=on_delete),
                 ft.TextButton("Cerrar", on_click=lambda e: self._close_dialog())
             ],
@@ -121,12 +165,176 @@ class HistoryTab:
             # page may not be ready, mark pending
             self.pending_refresh = True
 
+    def _on_search_file_picked(self, e):
+        if e.files and e.files[0].path:
+            self._start_search(Path(e.files[0].path))
+
+    def _start_search(self, path: Path):
+        """Reverse search in a worker thread; results open in their own dialog."""
+        self._close_dialog()
+        self.page.open(ft.SnackBar(ft.Text("Buscando rostros similares...")))
+        self.page.run_thread(self._run_search, path)
+
+    def _run_search(self, path: Path):
+        try:
+            hits = shared_face_search().search_file(path, shared_recognizer(), k=int(getattr(config, "face_search_top_k", 20)))
+        except Exception as e:
+            logging.error(f"HistoryTab: face search failed: {e}")
+            hits = []
+        self._show_search_results(path, hits)
+
+    def _show_search_results(self, query: Path, hits: List[SearchHit]):
+        tiles = []
+        for hit in hits:
+            hit_path = Path(hit.filename)
+            b64 = self._encode_image(hit_path, max_side=300)
+            tiles.append(
+                ft.Container(
+                    content=ft.Column(
+                        [
+                            ft.Image(src_base64=b64, width=120, height=120, fit=ft.ImageFit.COVER) if b64
+                            else ft.Icon(ft.Icons.HIDE_IMAGE, size=48),
+                            ft.Text(hit.timestamp.strftime("%Y-%m-%d %H:%M:%S"), size=11),
+                            ft.Text(f"similitud {hit.similarity:.2f}", size=11, color="#616161"),
+                        ],
+                        spacing=4,
+                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                    ),
+                    on_click=(lambda e, p=hit_path: self._open_image_dialog(p)) if b64 else None,
+                    padding=4,
+                )
+            )
+        content = (
+            ft.GridView(tiles, max_extent=150, child_aspect_ratio=0.75, spacing=8, run_spacing=8, width=760, height=520)
+            if tiles else ft.Text("No se encontraron detecciones similares (¿falta ejecutar el backfill?)")
+        )
+        self.results_dialog = ft.AlertDialog(
+            title=ft.Text(f"Similares a {query.name}"),
+            content=content,
+            actions=[ft.TextButton("Cerrar", on_click=lambda e: self._close_results())],
+        )
+        self.page.dialog = self.results_dialog
+        self.results_dialog.open = True
+        self.page.update()
+
+    def _close_results(self):
+        if self.results_dialog:
+            self.results_dialog.open = False
+            self.page.update()
+            self.results_dialog = None
+
+    def _open_export_dialog(self):
+        """Date range and manifest options; the destination is chosen with a save dialog."""
+        _label, span = PERIODS.get(self.period_dropdown.value, PERIODS["24h"])
+        now = datetime.now()
+        start_field = ft.TextField(
+            label="Desde (AAAA-MM-DD HH:MM)",
+            value=(now - span).strftime("%Y-%m-%d %H:%M") if span else "",
+            dense=True,
+        )
+        end_field = ft.TextField(label="Hasta (AAAA-MM-DD HH:MM)", value=now.strftime("%Y-%m-%d %H:%M"), dense=True)
+        manifest_dropdown = ft.Dropdown(
+            label="Manifiesto",
+            options=[ft.dropdown.Option("json", "JSON"), ft.dropdown.Option("csv", "CSV")],
+            value=getattr(config, "export_manifest_format", "json"),
+            dense=True,
+        )
+        embeddings_check = ft.Checkbox(label="Incluir embeddings", value=bool(getattr(config, "export_include_embeddings", False)))
+        self.export_options = (start_field, end_field, manifest_dropdown, embeddings_check)
+        status = ft.Text("", size=12, color="#616161")
+
+        def choose_target(e):
+            try:
+                self._export_range()
+            except ValueError:
+                status.value = "Fechas no válidas"
+                self.page.update()
+                return
+            self.export_picker.save_file(
+                dialog_title="Exportar detecciones",
+                file_name=f"detecciones_{now:%Y%m%d_%H%M}.zip",
+                allowed_extensions=["zip", "tar", "gz", "tgz"],
+            )
+
+        self.export_dialog = ft.AlertDialog(
+            title=ft.Text("Exportar detecciones"),
+            content=ft.Column([start_field, end_field, manifest_dropdown, embeddings_check, status], spacing=10, tight=True, width=380),
+            actions=[
+                ft.TextButton("Elegir destino y exportar", on_click=choose_target),
+                ft.TextButton("Cancelar", on_click=lambda e: self._close_export()),
+            ],
+        )
+        self.page.dialog = self.export_dialog
+        self.export_dialog.open = True
+        self.page.update()
+
+    def _export_range(self):
+        start_field, end_field = self.export_options[:2]
+        start = parse_datetime(start_field.value) if (start_field.value or "").strip() else None
+        end = parse_datetime(end_field.value) if (end_field.value or "").strip() else None
+        return start, end
+
+    def _on_export_target_picked(self, e):
+        if not e.path or self.export_options is None:
+            return
+        target = Path(e.path)
+        if not target.name.lower().endswith((".zip", ".tar", ".tar.gz", ".tgz")):
+            target = target.with_name(target.name + ".zip")
+        start, end = self._export_range()
+        manifest = self.export_options[2].value or "json"
+        include_embeddings = bool(self.export_options[3].value)
+
+        progress_bar = ft.ProgressBar(value=0, width=380)
+        progress_text = ft.Text("Preparando...", size=12)
+        self.export_cancel = threading.Event()
+        self._close_export()
+        self.export_dialog = ft.AlertDialog(
+            title=ft.Text(f"Exportando a {target.name}"),
+            content=ft.Column([progress_bar, progress_text], spacing=10, tight=True, width=380),
+            actions=[ft.TextButton("Cancelar", on_click=lambda ev: self.export_cancel.set())],
+            modal=True,
+        )
+        self.page.dialog = self.export_dialog
+        self.export_dialog.open = True
+        self.page.update()
+        self.page.run_thread(self._run_export, target, start, end, manifest, include_embeddings, progress_bar, progress_text)
+
+    def _run_export(self, target: Path, start, end, manifest: str, include_embeddings: bool, progress_bar, progress_text):
+        last = {"t": 0.0}
+
+        def report(p: ExportProgress):
+            now = time.monotonic()
+            if now - last["t"] < 0.25 and p.done != p.total:
+                return
+            last["t"] = now
+            progress_bar.value = p.done / p.total if p.total else 1.0
+            progress_text.value = f"{p.done} de {p.total} detecciones - {p.bytes_written / 2**20:.1f} MiB"
+            self.page.update()
+
+        try:
+            summary = export_detections(target, start, end, manifest, include_embeddings, progress=report, cancel=self.export_cancel)
+            if summary.cancelled:
+                message = "Exportación cancelada"
+            else:
+                message = f"{summary.exported} detecciones exportadas a {summary.path}"
+                if summary.missing:
+                    message += f" ({summary.missing} no encontradas)"
+        except Exception as e:
+            logging.error(f"HistoryTab: export failed: {e}")
+            message = f"Error al exportar: {e}"
+        self._close_export()
+        self.page.open(ft.SnackBar(ft.Text(message)))
+
+    def _close_export(self):
+        if self.export_dialog:
+            self.export_dialog.open = False
+            self.page.update()
+            self.export_dialog = None
+
     def _show_confirm_delete(self, path: Path):
         def confirm_delete(e):
-            try:
-                path.unlink()
-            except Exception as ex:
-                print(f"Error deleting file: {ex}")
+            if not delete_stored_face(path):
+                print(f"Error deleting file: {path}")
             self._close_confirm()
             self._close_dialog()
             self.refresh()
@@ -158,6 +366,94 @@ class HistoryTab:
             self.page.update()
             self.confirm = None
 
+    def _group_by_person(self, files: List[StoredFace]) -> List[List[StoredFace]]:
+        """Files grouped by face cluster, most recent group first; unclustered files stay alone."""
+        clusters = shared_face_clusters()
+        assignments = clusters.assignments() if clusters is not None else {}
+        groups: Dict[object, List[StoredFace]] = {}
+        for face in files:
+            cluster_id = assignments.get(str(face.path.resolve()))
+            groups.setdefault(face.path if cluster_id is None else cluster_id, []).append(face)
+        result = []
+        for key, members in groups.items():
+            if clusters is not None and not isinstance(key, Path):
+                representative = clusters.cluster_info(key).get("representative")
+                if representative:
+                    # the most central face of the cluster goes first
+                    rep = Path(representative).resolve()
+                    members.sort(key=lambda f: f.path.resolve() != rep)
+            result.append(members)
+        return result
+
+    def _build_card(self, members: List[StoredFace]):
+        """Thumbnail card for one image, or for a person group (only its representative is encoded)."""
+        path, timestamp = members[0]
+        b64 = self._encode_image(path, max_side=300)
+        if not b64:
+            logging.info(f"HistoryTab.refresh: skipping file (encode failed): {path}")
+            return None
+        ts = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        thumb = ft.Image(src_base64=b64, width=150, height=150, fit=ft.ImageFit.COVER)
+        if len(members) > 1:
+            caption = ft.Text(f"{len(members)} detecciones - {ts}", size=11, color="#424242")
+            buttons = [
+                ft.TextButton("Ver todas", on_click=lambda e, m=members: self._open_group_dialog(m)),
+                ft.TextButton("Abrir", on_click=lambda e, p=path: self._open_image_dialog(p)),
+            ]
+        else:
+            caption = ft.Text(ts, size=11, color="#424242")
+            buttons = [
+                ft.TextButton("Abrir", on_click=lambda e, p=path: self._open_image_dialog(p)),
+                ft.TextButton("Eliminar", on_click=lambda e, p=path: self._show_confirm_delete(p)),
+            ]
+        return ft.Card(
+            content=ft.Container(
+                content=ft.Column(
+                    controls=[
+                        ft.Container(content=thumb, on_click=lambda e, p=path: self._open_image_dialog(p)),
+                        caption,
+                        ft.Row(controls=buttons, alignment=ft.MainAxisAlignment.CENTER),
+                    ],
+                    spacing=6,
+                ),
+                padding=6,
+            ),
+            elevation=1,
+        )
+
+    def _open_group_dialog(self, members: List[StoredFace]):
+        shown = members[:60]
+        tiles = []
+        for path, timestamp in shown:
+            b64 = self._encode_image(path, max_side=300)
+            if not b64:
+                continue
+            tiles.append(
+                ft.Container(
+                    content=ft.Column(
+                        [
+                            ft.Image(src_base64=b64, width=120, height=120, fit=ft.ImageFit.COVER),
+                            ft.Text(timestamp.strftime("%Y-%m-%d %H:%M:%S"), size=11),
+                        ],
+                        spacing=4,
+                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                    ),
+                    on_click=lambda e, p=path: self._open_image_dialog(p),
+                    padding=4,
+                )
+            )
+        title = f"{len(members)} detecciones de la misma persona"
+        if len(members) > len(shown):
+            title += f" (mostrando {len(shown)})"
+        self.results_dialog = ft.AlertDialog(
+            title=ft.Text(title),
+            content=ft.GridView(tiles, max_extent=150, child_aspect_ratio=0.8, spacing=8, run_spacing=8, width=760, height=520),
+            actions=[ft.TextButton("Cerrar", on_click=lambda e: self._close_results())],
+        )
+        self.page.dialog = self.results_dialog
+        self.results_dialog.open = True
+        self.page.update()
+
     def refresh(self, _e=None):
         """Rebuild thumbnail grid from detected_faces directory (most recent first)."""
         try:
@@ -180,34 +476,11 @@ class HistoryTab:
                     )
                 )
             else:
-                for path in files:
-                    b64 = self._encode_image(path, max_side=300)
-                    if not b64:
-                        logging.info(f"HistoryTab.refresh: skipping file (encode failed): {path}")
-                        continue
-                    ts = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                    thumb = ft.Image(src_base64=b64, width=150, height=150, fit=ft.ImageFit.COVER)
-                    card = ft.Card(
-                        content=ft.Container(
-                            content=ft.Column(
-                                controls=[
-                                    ft.Container(content=thumb, on_click=lambda e, p=path: self._open_image_dialog(p)),
-                                    ft.Text(ts, size=11, color="#424242"),
-                                    ft.Row(
-                                        controls=[
-                                            ft.TextButton("Abrir", on_click=lambda e, p=path: self._open_image_dialog(p)),
-                                            ft.TextButton("Eliminar", on_click=lambda e, p=path: self._show_confirm_delete(p)),
-                                        ],
-                                        alignment=ft.MainAxisAlignment.CENTER,
-                                    ),
-                                ],
-                                spacing=6,
-                            ),
-                            padding=6,
-                        ),
-                        elevation=1,
-                    )
-                    cards.append(card)
+                groups = self._group_by_person(files) if self.group_switch.value else [[f] for f in files]
+                for members in groups:
+                    card = self._build_card(members)
+                    if card is not None:
+                        cards.append(card)
             self.grid.controls = cards
 
             # Try updating grid and page; if grid not yet attached to page, defer
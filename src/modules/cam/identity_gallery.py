@@ -0,0 +1,238 @@
+"""Enrolled identities with precomputed templates for 1:N identification.
+
+Each person keeps every enrolled sample embedding on disk, but matching only
+uses ``templates_per_identity`` rows per person: the normalised centroid plus
+optional k-means sub-centroids (for people enrolled with glasses/without, two
+lighting setups, ...). All templates live in one contiguous
+``(capacity, templates_per_identity, dim)`` matrix, so identification is a single
+matrix product followed by a max per person and a top-k selection.
+
+Enrolling or removing someone only rewrites that person's slot (removal moves
+the last slot into the hole); nothing else is recomputed.
+
+Layout of ``identities_dir``::
+
+    identities.json          [{"id", "name", "created", "samples"}]
+    <id>/embeddings.npy      (samples, D) float32 raw embeddings
+    <id>/sample_<n>.jpg      enrolled face crops
+"""
+
+import json
+import logging
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+
+from .embedding_codec import EmbeddingCodec, load_configured_codec
+from .face_recognition import FaceRecognition
+
+_MIN_CAPACITY = 16
+
+
+class IdentityMatch(NamedTuple):
+    person_id: str
+    name: str
+    similarity: float
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class IdentityGallery:
+    """Persistent set of known people, matched with one matrix product per query."""
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        templates_per_identity: Optional[int] = None,
+        codec: Optional[EmbeddingCodec] = None,
+    ):
+        self.directory = Path(directory or getattr(config, "identities_dir", "identities"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.catalog_path = self.directory / "identities.json"
+        self.templates_per_identity = max(1, int(templates_per_identity or 1 + int(getattr(config, "identity_subcentroids", 0))))
+        self.threshold = float(getattr(config, "identity_threshold", 0) or getattr(config, "similarity_threshold", 0.6))
+        self.codec = codec if codec is not None else load_configured_codec()
+        self._lock = threading.RLock()
+        self._people: List[Dict] = []          # slot -> catalog entry
+        self._slots: Dict[str, int] = {}       # person id -> slot
+        self._templates: Optional[np.ndarray] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._people)
+
+    def people(self) -> List[Dict]:
+        with self._lock:
+            return [dict(p) for p in self._people]
+
+    # --- persistence -----------------------------------------------------
+
+    def _load(self) -> None:
+        if not self.catalog_path.exists():
+            return
+        try:
+            catalog = json.loads(self.catalog_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Identity gallery: cannot read {self.catalog_path}: {e}")
+            return
+        for person in catalog:
+            samples = self._read_samples(person["id"])
+            if samples is None or not len(samples):
+                continue
+            self._put_slot(person, self._build_templates(samples))
+
+    def _save_catalog(self) -> None:
+        tmp = self.catalog_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._people, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.catalog_path)
+
+    def _read_samples(self, person_id: str) -> Optional[np.ndarray]:
+        path = self.directory / person_id / "embeddings.npy"
+        if not path.exists():
+            return None
+        return np.load(path).astype(np.float32)
+
+    # --- templates -------------------------------------------------------
+
+    def _build_templates(self, samples: np.ndarray) -> np.ndarray:
+        """(templates_per_identity, dim) rows: centroid first, then sub-centroids."""
+        vectors = self.codec.project(samples) if self.codec is not None else _normalize(samples)
+        centroid = _normalize(vectors.mean(axis=0))[0]
+        templates = np.repeat(centroid[None, :], self.templates_per_identity, axis=0)
+        extra = self.templates_per_identity - 1
+        if extra and len(vectors) >= 2 * extra:
+            from sklearn.cluster import KMeans
+
+            kmeans = KMeans(n_clusters=extra, n_init=3, random_state=0).fit(vectors)
+            templates[1:] = _normalize(kmeans.cluster_centers_)
+        return templates
+
+    def _put_slot(self, person: Dict, templates: np.ndarray) -> None:
+        slot = self._slots.get(person["id"])
+        if slot is None:
+            slot = len(self._people)
+            if self._templates is None or slot >= len(self._templates):
+                capacity = max(_MIN_CAPACITY, 2 * slot)
+                grown = np.zeros((capacity, self.templates_per_identity, templates.shape[1]), dtype=np.float32)
+                if self._templates is not None:
+                    grown[:slot] = self._templates[:slot]
+                self._templates = grown
+            self._people.append(person)
+            self._slots[person["id"]] = slot
+        else:
+            self._people[slot] = person
+        self._templates[slot] = templates
+
+    # --- public API ------------------------------------------------------
+
+    def enroll(
+        self,
+        name: str,
+        embeddings: Sequence[np.ndarray],
+        images: Optional[Sequence[np.ndarray]] = None,
+        person_id: Optional[str] = None,
+    ) -> str:
+        """Add samples to a person (new unless ``person_id`` is given); returns the id."""
+        new = np.stack([np.asarray(e, dtype=np.float32).ravel() for e in embeddings])
+        with self._lock:
+            if person_id is None:
+                person_id = uuid.uuid4().hex[:12]
+                person = {"id": person_id, "name": name, "created": datetime.now().isoformat(), "samples": 0}
+            else:
+                person = dict(self._people[self._slots[person_id]])
+                person["name"] = name or person["name"]
+            person_dir = self.directory / person_id
+            person_dir.mkdir(parents=True, exist_ok=True)
+            previous = self._read_samples(person_id)
+            samples = new if previous is None else np.concatenate([previous, new])
+            np.save(person_dir / "embeddings.npy", samples)
+            for i, img in enumerate(images or []):
+                if img is not None:
+                    cv2.imwrite(str(person_dir / f"sample_{person['samples'] + i}.jpg"), img)
+            person["samples"] = int(len(samples))
+            self._put_slot(person, self._build_templates(samples))
+            self._save_catalog()
+        logging.info("Identity gallery: %s enrolled with %s sample(s)", name, len(samples))
+        return person_id
+
+    def remove(self, person_id: str) -> bool:
+        with self._lock:
+            slot = self._slots.pop(person_id, None)
+            if slot is None:
+                return False
+            last = len(self._people) - 1
+            if slot != last:
+                # keep the matrix dense: move the last identity into the hole
+                self._templates[slot] = self._templates[last]
+                self._people[slot] = self._people[last]
+                self._slots[self._people[slot]["id"]] = slot
+            self._people.pop()
+            self._save_catalog()
+        shutil.rmtree(self.directory / person_id, ignore_errors=True)
+        return True
+
+    def identify(self, embedding: np.ndarray, k: int = 1, threshold: Optional[float] = None) -> List[IdentityMatch]:
+        """Top-``k`` enrolled people above ``threshold`` (default ``identity_threshold``), best first."""
+        if embedding is None:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        query = self.codec.project(embedding)[0] if self.codec is not None else _normalize(embedding)[0]
+        with self._lock:
+            n = len(self._people)
+            if n == 0:
+                return []
+            templates = self._templates[:n]
+            # one product for every template row, then the best template per person
+            scores = (templates.reshape(-1, templates.shape[2]) @ query).reshape(n, -1).max(axis=1)
+            k = min(int(k), n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                IdentityMatch(self._people[i]["id"], self._people[i]["name"], float(scores[i]))
+                for i in top
+                if scores[i] > threshold
+            ]
+
+
+def enrollment_sample(recognizer: FaceRecognition, image: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], str]:
+    """(face crop, embedding, message) for the largest face of an enrollment photo.
+
+    Crops previously saved by the app (no detectable face, small image) are
+    embedded as they are.
+    """
+    faces = recognizer.detect_faces(image)
+    if not faces:
+        if max(image.shape[:2]) <= 200:
+            crop = cv2.resize(image, (112, 112))
+            embedding = recognizer.get_face_embedding(crop)
+            return crop, embedding, "Recorte de rostro"
+        return None, None, "No se detecto ningun rostro"
+    largest = max(faces, key=lambda f: f[2] * f[3])
+    face_img, embedding, message = recognizer.process_face(image, largest)
+    return face_img, embedding, message or ""
+
+
+_shared_gallery: Optional[IdentityGallery] = None
+_shared_lock = threading.Lock()
+
+
+def shared_identity_gallery() -> IdentityGallery:
+    """Gallery shared by the pipeline (matching) and the enrollment view."""
+    global _shared_gallery
+    with _shared_lock:
+        if _shared_gallery is None:
+            _shared_gallery = IdentityGallery()
+        return _shared_gallery
@@ -0,0 +1,89 @@
+"""Configurable encoding of saved face crops and history thumbnails.
+
+Crops used to be written as default-quality JPEG and thumbnails as JPEG 85.
+``ImageEncoding`` bundles format, quality and an optional grayscale
+conversion so both can be tuned from config (``face_image_*`` and
+``thumbnail_*``). Grayscale is safe for stored crops: the HOG embedding and
+the dHash are computed on grayscale anyway, and ``cv2.imread``/``imdecode``
+with ``IMREAD_COLOR`` hand back three channels either way.
+
+``benchmarks.encoding_benchmarks`` measures bytes per face and encode/decode
+time for each combination.
+"""
+
+import logging
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+
+# format -> (file suffix, OpenCV quality flag)
+FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+}
+_ALIASES = {"jpg": "jpeg"}
+
+
+def normalize_format(name: str) -> str:
+    name = str(name or "jpeg").strip().lower().lstrip(".")
+    name = _ALIASES.get(name, name)
+    if name not in FORMATS:
+        logging.warning(f"Unknown image format '{name}', using jpeg")
+        return "jpeg"
+    return name
+
+
+class ImageEncoding(NamedTuple):
+    format: str = "jpeg"
+    quality: int = 95
+    grayscale: bool = False
+
+    @property
+    def suffix(self) -> str:
+        return FORMATS[self.format][0]
+
+    def params(self) -> list:
+        flag = FORMATS[self.format][1]
+        if self.format == "png":
+            # lossless: map quality 0-100 onto compression 9-0 (smaller = faster, bigger file)
+            return [int(flag), int(round(9 - max(0, min(100, self.quality)) * 9 / 100))]
+        return [int(flag), max(1, min(100, int(self.quality)))]
+
+    def prepare(self, img: np.ndarray) -> np.ndarray:
+        if self.grayscale and img.ndim == 3:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img
+
+    def encode(self, img: np.ndarray) -> Optional[bytes]:
+        """Encoded bytes of ``img``, or None if OpenCV refuses it."""
+        ok, buf = cv2.imencode(self.suffix, self.prepare(img), self.params())
+        return buf.tobytes() if ok else None
+
+
+def decode(data: bytes) -> Optional[np.ndarray]:
+    """BGR image from encoded bytes (any supported format), or None."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def face_encoding() -> ImageEncoding:
+    """Encoding for saved face crops, from config."""
+    return ImageEncoding(
+        normalize_format(getattr(config, "face_image_format", "jpeg")),
+        int(getattr(config, "face_image_quality", 95)),
+        bool(getattr(config, "face_image_grayscale", False)),
+    )
+
+
+def thumbnail_encoding() -> ImageEncoding:
+    """Encoding for history/search thumbnails, from config."""
+    return ImageEncoding(
+        normalize_format(getattr(config, "thumbnail_format", "jpeg")),
+        int(getattr(config, "thumbnail_quality", 85)),
+        bool(getattr(config, "thumbnail_grayscale", False)),
+    )
@@ -0,0 +1,373 @@
+"""Bulk ingestion of video files and image folders into FaceStorage.
+
+Frames are decoded on a background thread (with striding, so skipped frames are
+only grabbed, not converted), analysed concurrently by the same workers the live
+pipeline uses (batched DNN + thread pool, or the process pool when
+``analysis_backend == "process"``) and saved in order through ``FaceStorage`` so
+dedup behaves exactly as it does for the camera. Results are streamed; at most
+``max_inflight`` frames are held in memory at any time::
+
+    python -m src.modules.cam.ingest data/videos/entrada.mp4 --every 0.5
+    python -m src.modules.cam.ingest data/fotos --recursive
+"""
+
+import argparse
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+from src.utils.thread_budget import current_allocation, pin_current_thread
+
+from .analysis_pool import AnalysisResult, analyze_frame, shared_analysis_pool
+from .batch_inference import shared_scheduler
+from .face_storage import FaceStorage
+from .pipeline_stats import stats
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VIDEO_SUFFIXES = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".webm", ".wmv")
+
+
+class IngestItem:
+    """One decoded frame plus where it came from."""
+
+    __slots__ = ("source", "index", "timestamp", "frame")
+
+    def __init__(self, source: str, index: int, timestamp: datetime, frame: np.ndarray):
+        self.source = source
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+
+
+class IngestResult:
+    """Outcome of one frame; the frame itself is not kept."""
+
+    __slots__ = ("source", "index", "timestamp", "faces", "accepted", "saved")
+
+    def __init__(self, source: str, index: int, timestamp: datetime, faces: int, accepted: int, saved: int):
+        self.source = source
+        self.index = index
+        self.timestamp = timestamp
+        self.faces = faces
+        self.accepted = accepted
+        self.saved = saved
+
+
+class IngestReport:
+    """Running totals of an ingestion job."""
+
+    def __init__(self):
+        self.frames = 0
+        self.faces = 0
+        self.accepted = 0
+        self.saved = 0
+        self.media_seconds = 0.0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def speedup(self) -> float:
+        """Media time processed per second of wall time (video only)."""
+        return self.media_seconds / self.elapsed if self.elapsed else 0.0
+
+    def add(self, result: IngestResult) -> None:
+        self.frames += 1
+        self.faces += result.faces
+        self.accepted += result.accepted
+        self.saved += result.saved
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        text = (
+            f"{self.frames} frames en {self.elapsed:.1f} s ({self.fps:.1f} fps) · "
+            f"rostros {self.faces} · aceptados {self.accepted} · guardados {self.saved}"
+        )
+        if self.media_seconds:
+            text += f" · {self.media_seconds:.0f} s de video (x{self.speedup:.1f} tiempo real)"
+        return text
+
+
+def iter_video_frames(
+    path: Path,
+    stride: int = 1,
+    every_seconds: Optional[float] = None,
+    start_time: Optional[datetime] = None,
+    report: Optional[IngestReport] = None,
+) -> Iterator[IngestItem]:
+    """Decode every ``stride``-th frame (or one frame every ``every_seconds``).
+
+    Timestamps are ``start_time`` (default: now) plus the media position, so dedup
+    intervals are measured in video time rather than wall time.
+    """
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise ValueError(f"No se pudo abrir el video {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        if every_seconds and fps > 0:
+            stride = max(1, int(round(every_seconds * fps)))
+        stride = max(1, int(stride))
+        start_time = start_time or datetime.now()
+        index = 0
+        while True:
+            # grab() skips decoding/colour conversion of the strided-out frames
+            if not cap.grab():
+                break
+            if index % stride == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if position <= 0 and fps > 0:
+                    position = index / fps
+                if report is not None:
+                    report.media_seconds = max(report.media_seconds, position)
+                yield IngestItem(str(path), index, start_time + timedelta(seconds=position), frame)
+            index += 1
+    finally:
+        cap.release()
+
+
+def iter_image_files(directory: Path, recursive: bool = False) -> Iterator[IngestItem]:
+    """Decode images one at a time, timestamped with their modification time."""
+    pattern = "**/*" if recursive else "*"
+    paths = sorted(p for p in directory.glob(pattern) if p.suffix.lower() in IMAGE_SUFFIXES)
+    for index, path in enumerate(paths):
+        frame = cv2.imread(str(path))
+        if frame is None:
+            logging.warning(f"Ingest: could not read image {path}")
+            continue
+        yield IngestItem(str(path), index, datetime.fromtimestamp(path.stat().st_mtime), frame)
+
+
+def iter_path(
+    path: Path,
+    stride: int = 1,
+    every_seconds: Optional[float] = None,
+    recursive: bool = False,
+    report: Optional[IngestReport] = None,
+) -> Iterator[IngestItem]:
+    """Frames of a video file, an image file or a folder of images and videos."""
+    if path.is_dir():
+        yield from iter_image_files(path, recursive=recursive)
+        pattern = "**/*" if recursive else "*"
+        for video in sorted(p for p in path.glob(pattern) if p.suffix.lower() in VIDEO_SUFFIXES):
+            yield from iter_video_frames(video, stride, every_seconds, report=report)
+    elif path.suffix.lower() in IMAGE_SUFFIXES:
+        frame = cv2.imread(str(path))
+        if frame is not None:
+            yield IngestItem(str(path), 0, datetime.fromtimestamp(path.stat().st_mtime), frame)
+    else:
+        yield from iter_video_frames(path, stride, every_seconds, report=report)
+
+
+def _prefetch(items: Iterable[IngestItem], size: int) -> Iterator[IngestItem]:
+    """Decode on a background thread so decoding overlaps analysis."""
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, size))
+    done = object()
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:  # surfaced on the consumer side
+            buffer.put(e)
+        finally:
+            buffer.put(done)
+
+    thread = threading.Thread(target=produce, name="ingest-decode", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full buffer
+        while thread.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                thread.join(timeout=0.1)
+
+
+def default_workers() -> int:
+    """Analysis threads for offline ingestion: every analysis core of the thread budget.
+
+    The live pipeline runs a single thread-backend worker (``analysis_workers``
+    resolves to 1), but ingestion is not paced by a camera and should fill the
+    cores the budget reserves for analysis.
+    """
+    alloc = current_allocation() or getattr(config, "thread_allocation", None)
+    if alloc is None:
+        return max(1, int(getattr(config, "analysis_workers", 1) or 1))
+    if alloc.backend == "process":
+        return max(1, int(alloc.analysis_workers))
+    return max(1, int(alloc.analysis_workers), len(alloc.analysis_cores))
+
+
+class Ingestor:
+    """Analyse frames concurrently and save them in order through ``FaceStorage``."""
+
+    def __init__(
+        self,
+        face_storage: Optional[FaceStorage] = None,
+        workers: Optional[int] = None,
+        max_inflight: Optional[int] = None,
+    ):
+        self.face_storage = face_storage or FaceStorage()
+        self.workers = max(1, int(workers or default_workers()))
+        self.max_inflight = max(1, int(max_inflight or self.workers * 2))
+        self.report = IngestReport()
+        self._pool = shared_analysis_pool()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self._pool is None:
+            self._detector = shared_scheduler()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="ingest",
+                initializer=pin_current_thread,
+                initargs=("analysis",),
+            )
+
+    def _analyze(self, frame: np.ndarray) -> AnalysisResult:
+        faces = self._detector.detect(frame)
+        return analyze_frame(self.face_storage.face_recognizer, frame, detect=lambda _f: faces)
+
+    def _submit(self, frame: np.ndarray) -> Future:
+        if self._pool is not None:
+            return self._pool.submit(frame)
+        return self._executor.submit(self._analyze, frame)
+
+    def _save(self, item: IngestItem, analysis: AnalysisResult) -> IngestResult:
+        accepted = saved = 0
+        for _coords, face_img, embedding, quality_message in analysis.faces():
+            if face_img is None or embedding is None:
+                continue
+            accepted += 1
+            if self.face_storage.save_analyzed_face(face_img, embedding, quality_message, timestamp=item.timestamp):
+                saved += 1
+        stats.incr("ingest_frames")
+        stats.incr("faces_detected", len(analysis))
+        stats.incr("faces_accepted", accepted)
+        return IngestResult(item.source, item.index, item.timestamp, len(analysis), accepted, saved)
+
+    def ingest(self, items: Iterable[IngestItem]) -> Iterator[IngestResult]:
+        """Yield one result per frame, in input order, as soon as it is saved."""
+        inflight: Deque[Tuple[IngestItem, Future]] = deque()
+        try:
+            for item in _prefetch(items, self.max_inflight):
+                inflight.append((item, self._submit(item.frame)))
+                while len(inflight) >= self.max_inflight or (inflight and inflight[0][1].done()):
+                    yield self._finish(*inflight.popleft())
+            while inflight:
+                yield self._finish(*inflight.popleft())
+        finally:
+            for _item, future in inflight:
+                future.cancel()
+
+    def _finish(self, item: IngestItem, future: Future) -> IngestResult:
+        try:
+            analysis = future.result()
+        except Exception as e:
+            logging.error(f"Ingest: analysis failed for {item.source}#{item.index}: {e}")
+            result = IngestResult(item.source, item.index, item.timestamp, 0, 0, 0)
+        else:
+            # drop the frame reference before saving; only crops are kept
+            item.frame = None
+            result = self._save(item, analysis)
+        self.report.add(result)
+        return result
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def ingest_path(
+    path: Path,
+    face_storage: Optional[FaceStorage] = None,
+    stride: int = 1,
+    every_seconds: Optional[float] = None,
+    recursive: bool = False,
+    workers: Optional[int] = None,
+    on_progress: Optional[Callable[[IngestReport], None]] = None,
+    progress_interval: float = 5.0,
+) -> IngestReport:
+    """Ingest a file or folder and return the final report."""
+    ingestor = Ingestor(face_storage, workers=workers)
+    next_progress = time.monotonic() + progress_interval
+    try:
+        items = iter_path(path, stride, every_seconds, recursive, report=ingestor.report)
+        for _result in ingestor.ingest(items):
+            if on_progress is not None and time.monotonic() >= next_progress:
+                next_progress = time.monotonic() + progress_interval
+                on_progress(ingestor.report)
+    finally:
+        ingestor.close()
+    return ingestor.report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingesta masiva de videos y carpetas de imagenes")
+    parser.add_argument("path", type=Path, help="Video, imagen o carpeta")
+    parser.add_argument("--stride", type=int, default=1, help="Procesar 1 de cada N frames de video")
+    parser.add_argument("--every", type=float, help="Procesar un frame cada N segundos de video (ignora --stride)")
+    parser.add_argument("--recursive", action="store_true", help="Recorrer subcarpetas")
+    parser.add_argument("--workers", type=int, help="Hilos de analisis (por defecto, los nucleos de analisis del presupuesto de hilos)")
+    parser.add_argument("--output-dir", type=Path, help="Carpeta destino (por defecto detected_faces_dir)")
+    parser.add_argument("--progress-interval", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if not args.path.exists():
+        print(f"No existe {args.path}")
+        return 2
+
+    storage = FaceStorage(save_dir=args.output_dir)
+    # the per-face save log would dominate the output of a long ingestion
+    storage.logger.setLevel(logging.WARNING)
+    report = ingest_path(
+        args.path,
+        storage,
+        stride=args.stride,
+        every_seconds=args.every,
+        recursive=args.recursive,
+        workers=args.workers,
+        on_progress=lambda r: logging.info("Ingesta: %s", r.summary()),
+        progress_interval=args.progress_interval,
+    )
+    print(report.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
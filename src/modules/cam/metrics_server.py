@@ -0,0 +1,173 @@
+"""Local Prometheus text-format endpoint for pipeline metrics.
+
+Everything exported is already maintained by ``pipeline_stats.stats``; a scrape
+only copies counters/histograms under a lock and samples the registered gauges,
+so it is cheap enough to leave on in production.
+"""
+
+import logging
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from src.utils.config import config
+
+from .pipeline_stats import LATENCY_BUCKETS, PipelineStats, stats
+
+PREFIX = "controlflow"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return counters
+    return None
+
+
+def process_memory_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None if the platform can't tell."""
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if sys.platform == "win32":
+            counters = _windows_memory_counters()
+            return None if counters is None else int(counters.WorkingSetSize)
+    except Exception as e:
+        logging.debug(f"Metrics: unable to read process memory: {e}")
+    # other POSIX systems only report the peak (see process_peak_memory_bytes)
+    return None
+
+
+def process_peak_memory_bytes() -> Optional[int]:
+    """Peak resident set size of this process since it started, or None."""
+    try:
+        if sys.platform == "win32":
+            counters = _windows_memory_counters()
+            return None if counters is None else int(counters.PeakWorkingSetSize)
+        import resource
+
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(peak if sys.platform == "darwin" else peak * 1024)
+    except Exception as e:
+        logging.debug(f"Metrics: unable to read peak process memory: {e}")
+        return None
+
+
+def render_metrics(source: PipelineStats = stats) -> str:
+    """Render every counter, stage histogram and gauge in Prometheus text format."""
+    lines: List[str] = []
+
+    lines.append(f"# HELP {PREFIX}_pipeline_events_total Pipeline events since start")
+    lines.append(f"# TYPE {PREFIX}_pipeline_events_total counter")
+    for name, total in sorted(source.counter_totals().items()):
+        # "rejected:<reason>" counters become a reason label
+        event, _, reason = name.partition(":")
+        labels = f'event="{_escape(event)}"'
+        if reason:
+            labels += f',reason="{_escape(reason)}"'
+        lines.append(f"{PREFIX}_pipeline_events_total{{{labels}}} {total}")
+
+    lines.append(f"# HELP {PREFIX}_stage_latency_seconds Latency of each pipeline stage")
+    lines.append(f"# TYPE {PREFIX}_stage_latency_seconds histogram")
+    for stage, (buckets, total_seconds) in sorted(source.histograms().items()):
+        label = f'stage="{_escape(stage)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, buckets):
+            cumulative += count
+            lines.append(f'{PREFIX}_stage_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        cumulative += buckets[-1]
+        lines.append(f'{PREFIX}_stage_latency_seconds_bucket{{{label},le="+Inf"}} {cumulative}')
+        lines.append(f"{PREFIX}_stage_latency_seconds_sum{{{label}}} {total_seconds:.6f}")
+        lines.append(f"{PREFIX}_stage_latency_seconds_count{{{label}}} {cumulative}")
+
+    for name, (help_text, value) in sorted(source.gauges().items()):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.append(f"{PREFIX}_{name} {value:g}")
+
+    rss = process_memory_bytes()
+    if rss is not None:
+        lines.append(f"# HELP {PREFIX}_process_resident_memory_bytes Resident memory of this process")
+        lines.append(f"# TYPE {PREFIX}_process_resident_memory_bytes gauge")
+        lines.append(f"{PREFIX}_process_resident_memory_bytes {rss}")
+    peak = process_peak_memory_bytes()
+    if peak is not None:
+        lines.append(f"# HELP {PREFIX}_process_peak_resident_memory_bytes Peak resident memory of this process")
+        lines.append(f"# TYPE {PREFIX}_process_peak_resident_memory_bytes gauge")
+        lines.append(f"{PREFIX}_process_peak_resident_memory_bytes {peak}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802 - http.server API
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002 - http.server API
+        logging.debug("Metrics: " + format, *args)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(host: Optional[str] = None, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Start the endpoint in a daemon thread if ``metrics_port`` is set (0 disables it)."""
+    global _server
+    if _server is not None:
+        return _server
+    host = host or getattr(config, "metrics_host", "127.0.0.1")
+    port = int(port if port is not None else getattr(config, "metrics_port", 0) or 0)
+    if port <= 0:
+        return None
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Metrics endpoint could not bind {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return _server
+
+
+def stop_metrics_server() -> None:
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,68 @@
+"""64-bit difference hash (dHash) of face crops for a cheap first-stage dedup.
+
+The crop is reduced to a 9x8 grayscale thumbnail and each bit records whether
+a pixel is brighter than its right neighbour. Two shots of the same face taken
+seconds apart differ in a handful of bits, so ``RecentHashes`` can reject
+obvious repeats by Hamming distance before the HOG embedding is computed. It
+only ever says "duplicate"; anything it is unsure about goes through the
+embedding comparison as before.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def dhash(image: np.ndarray) -> int:
+    """64-bit dHash of a BGR or grayscale image."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class RecentHashes:
+    """Hashes of recently saved crops, expired after ``ttl_seconds``."""
+
+    def __init__(self, ttl_seconds: float, max_distance: int = 6, capacity: int = 256):
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_distance = int(max_distance)
+        self._entries: Deque[Tuple[datetime, int]] = deque(maxlen=max(1, int(capacity)))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def add(self, value: int, saved_at: datetime) -> None:
+        """Remember a hash; ``saved_at`` is when that face was saved."""
+        with self._lock:
+            self._entries.append((saved_at, value))
+
+    def match(self, value: int, now: Optional[datetime] = None) -> Optional[Tuple[int, float]]:
+        """(distance, seconds since saved) of the closest live entry within ``max_distance``."""
+        now = now or datetime.now()
+        best: Optional[Tuple[int, float]] = None
+        with self._lock:
+            # entries arrive in save order: drop the expired head
+            while self._entries and (now - self._entries[0][0]).total_seconds() >= self.ttl_seconds:
+                self._entries.popleft()
+            for saved_at, stored in self._entries:
+                age = (now - saved_at).total_seconds()
+                if not 0 <= age < self.ttl_seconds:
+                    continue
+                distance = hamming(value, stored)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, age)
+        return best
@@ -0,0 +1,294 @@
+import asyncio
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.utils.config import config
+from src.utils.thread_budget import pin_current_thread
+
+from .analysis_pool import VERDICT_DUPLICATE, VERDICTS, AnalysisResult, analyze_frame, shared_analysis_pool
+from .batch_inference import shared_scheduler
+from .face_storage import FaceStorage
+from .identity_gallery import shared_identity_gallery
+from .pipeline_stats import stats
+from .profiling import profiler
+
+Event = Dict[str, Any]
+
+_executors_lock = threading.Lock()
+_capture_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _executors() -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    """Executors shared by every pipeline: blocking reads and CPU-bound stages."""
+    global _capture_executor, _cpu_executor
+    with _executors_lock:
+        if _capture_executor is None:
+            _capture_executor = ThreadPoolExecutor(
+                max_workers=4,
+                thread_name_prefix="capture",
+                initializer=pin_current_thread,
+                initargs=("capture",),
+            )
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(
+                max_workers=max(1, int(getattr(config, "analysis_workers", 1) or 1)),
+                thread_name_prefix="analysis",
+                initializer=pin_current_thread,
+                initargs=("analysis",),
+            )
+        return _capture_executor, _cpu_executor
+
+
+class CameraPipeline:
+    """Capture -> analysis -> publish stages connected by bounded asyncio queues.
+
+    Blocking reads and CPU work run in shared executors; ``publish`` is always
+    called on the event loop, so UI updates never race with Flet's own handlers.
+    When analysis falls behind, live capture drops the oldest queued frame instead
+    of letting the camera buffer go stale; non-live sources (replays, video files)
+    wait for room instead, so every frame is processed.
+
+    With ``preview=False`` (headless) frames are neither annotated nor encoded and
+    only detection/status events are published. ``preview_wanted`` is asked once
+    per frame: while it returns False (no visible viewer) the preview and the stats
+    overlay are skipped the same way, and they resume with the next frame.
+    """
+
+    def __init__(
+        self,
+        cap,
+        face_storage: FaceStorage,
+        publish: Callable[[Event], None],
+        queue_size: int = 2,
+        preview: bool = True,
+        preview_wanted: Optional[Callable[[], bool]] = None,
+    ):
+        self.cap = cap
+        self.preview = preview
+        self.preview_wanted = preview_wanted
+        self.face_storage = face_storage
+        self.publish = publish
+        self.queue_size = max(1, int(queue_size))
+        self.is_live = bool(getattr(cap, "is_live", True))
+        self.identities = shared_identity_gallery()
+        self.frames_dropped = 0
+        self._frames: Optional[asyncio.Queue] = None
+        self._results: Optional[asyncio.Queue] = None
+
+    def queue_depths(self) -> Tuple[int, int]:
+        """Frames waiting for analysis and results waiting to be published."""
+        frames = self._frames.qsize() if self._frames is not None else 0
+        results = self._results.qsize() if self._results is not None else 0
+        return frames, results
+
+    async def run(self) -> None:
+        """Run until the source ends or the task is cancelled."""
+        self._frames = asyncio.Queue(maxsize=self.queue_size)
+        self._results = asyncio.Queue(maxsize=self.queue_size)
+        profile_on_start = float(getattr(config, "profile_on_start_seconds", 0) or 0)
+        if profile_on_start > 0 and profiler.last_report is None:
+            profiler.request(profile_on_start)
+        stages = [
+            asyncio.create_task(self._capture_stage(), name="pipeline-capture"),
+            asyncio.create_task(self._analysis_stage(), name="pipeline-analysis"),
+            asyncio.create_task(self._publish_stage(), name="pipeline-publish"),
+        ]
+        try:
+            # the publish stage finishes last once the end-of-stream marker went through
+            await stages[-1]
+            for stage in stages[:-1]:
+                if stage.done() and not stage.cancelled() and stage.exception():
+                    raise stage.exception()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            capture_executor, _ = _executors()
+            # release on the capture executor, after any in-flight read has returned
+            await asyncio.get_running_loop().run_in_executor(capture_executor, self.cap.release)
+
+    async def _capture_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        capture_executor, _ = _executors()
+        try:
+            while True:
+                with stats.time("capture_wait"):
+                    ret, frame = await loop.run_in_executor(capture_executor, self.cap.read)
+                if not ret:
+                    self.publish({"type": "status", "message": "⚠️ No se pudo leer frame de la cámara", "running": False})
+                    break
+                stats.incr("frames_captured")
+                # capture time travels with the frame: replays dedup and name crops
+                # by recorded time, independent of how fast they are replayed
+                item = (frame, self._capture_time())
+                if not self.is_live:
+                    await self._frames.put(item)
+                    continue
+                if self._frames.full():
+                    # live source: keep the newest frame, drop the stale one
+                    self._frames.get_nowait()
+                    self.frames_dropped += 1
+                    stats.incr("frames_dropped")
+                self._frames.put_nowait(item)
+        finally:
+            await self._put_end(self._frames)
+
+    async def _analysis_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        _, cpu_executor = _executors()
+        analysis_pool = shared_analysis_pool()
+        face_detector = shared_scheduler() if analysis_pool is None else None
+        try:
+            while True:
+                item = await self._frames.get()
+                if item is None:
+                    break
+                frame, captured_at = item
+                if analysis_pool is not None:
+                    # remote workers do detection, quality and embedding in one call
+                    with stats.time("detection"):
+                        analysis = await asyncio.wrap_future(analysis_pool.submit(frame))
+                else:
+                    # batched across every running pipeline
+                    with stats.time("detection"):
+                        faces = await asyncio.wrap_future(face_detector.submit(frame))
+                    analysis = await loop.run_in_executor(
+                        cpu_executor, profiler.call, self._analyze_local, frame, faces, captured_at
+                    )
+                output = await loop.run_in_executor(
+                    cpu_executor, profiler.call, self._finish_frame, frame, analysis, captured_at
+                )
+                await self._results.put(output)
+        finally:
+            await self._put_end(self._results)
+
+    def _preview_active(self) -> bool:
+        return self.preview and (self.preview_wanted is None or self.preview_wanted())
+
+    async def _publish_stage(self) -> None:
+        overlay = bool(getattr(config, "stats_overlay", True))
+        next_stats = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            events = await self._results.get()
+            if events is None:
+                break
+            with stats.time("ui_update"):
+                for event in events:
+                    self.publish(event)
+            if overlay and loop.time() >= next_stats and self._preview_active():
+                next_stats = loop.time() + 1.0
+                self.publish({"type": "stats", "text": stats.summary_text()})
+            stats.log_if_due()
+
+    @staticmethod
+    async def _put_end(q: asyncio.Queue) -> None:
+        try:
+            q.put_nowait(None)
+        except asyncio.QueueFull:
+            # consumer is gone or far behind: make room for the marker
+            q.get_nowait()
+            q.put_nowait(None)
+
+    def _capture_time(self) -> datetime:
+        ts = getattr(self.cap, "last_timestamp", None)
+        return datetime.fromtimestamp(ts) if ts is not None else datetime.now()
+
+    def _analyze_local(
+        self, frame: np.ndarray, faces: List[Tuple[int, int, int, int]], captured_at: Optional[datetime] = None
+    ) -> AnalysisResult:
+        """Quality gate + embedding for boxes already found by the batch scheduler."""
+        skip = None
+        # identification needs every embedding; otherwise repeats can stop at the hash
+        if self.face_storage.hash_cache is not None and not len(self.identities):
+            skip = lambda face_img: self.face_storage.is_hash_duplicate(face_img, captured_at)  # noqa: E731
+        return analyze_frame(self.face_storage.face_recognizer, frame, detect=lambda _f: faces, skip=skip)
+
+    def _finish_frame(self, frame: np.ndarray, analysis: AnalysisResult, captured_at: Optional[datetime] = None) -> List[Event]:
+        """Annotate, save accepted faces and encode the preview (runs in the CPU executor)."""
+        events: List[Event] = []
+        frame_with_faces = None
+        if self._preview_active():
+            frame_with_faces = frame.copy()
+        elif self.preview:
+            stats.incr("previews_skipped")
+        stats.incr("frames_processed")
+        stats.incr("faces_detected", len(analysis))
+
+        for face_coords, face_img, embedding, quality_message in analysis.faces():
+            x, y, w, h = face_coords
+
+            if face_img is not None and embedding is not None:
+                match = None
+                if len(self.identities):
+                    with stats.time("identify"):
+                        matches = self.identities.identify(embedding, k=1)
+                    match = matches[0] if matches else None
+                    stats.incr("faces_identified" if match else "faces_unknown")
+                if frame_with_faces is not None:
+                    label = match.name if match else "OK"
+                    cv2.rectangle(frame_with_faces, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                    cv2.putText(frame_with_faces, label, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                stats.incr("faces_accepted")
+
+                saved = self.face_storage.save_analyzed_face(face_img, embedding, quality_message, timestamp=captured_at)
+                if saved:
+                    message = "✅ Nueva cara detectada y guardada"
+                else:
+                    message = f"👁️ Rostro detectado: {quality_message}"
+                if match:
+                    message += f" · {match.name} ({match.similarity:.2f})"
+                events.append({
+                    "type": "detection",
+                    "message": message,
+                    "saved": saved,
+                    "accepted": True,
+                    "identity": match.name if match else None,
+                })
+            elif quality_message == VERDICTS[VERDICT_DUPLICATE]:
+                if frame_with_faces is not None:
+                    cv2.rectangle(frame_with_faces, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                    cv2.putText(frame_with_faces, "OK", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                stats.incr("faces_accepted")
+                events.append({
+                    "type": "detection",
+                    "message": f"👁️ Rostro detectado: {quality_message}",
+                    "saved": False,
+                    "accepted": True,
+                    "identity": None,
+                })
+            else:
+                if frame_with_faces is not None:
+                    cv2.rectangle(frame_with_faces, (x, y), (x + w, y + h), (0, 0, 255), 2)
+                    cv2.putText(frame_with_faces, quality_message or "Error", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+                message = f"⚠️ Rostro rechazado: {quality_message}"
+                stats.incr("faces_rejected")
+                stats.incr(f"rejected:{quality_message or 'Error'}")
+                events.append({"type": "detection", "message": message, "saved": False, "accepted": False})
+
+        if frame_with_faces is None:
+            return events
+        # encode once, every viewer receives the same payload
+        with stats.time("preview_encode"):
+            b64 = encode_preview(frame_with_faces)
+        if b64:
+            events.append({"type": "frame", "image": b64})
+        return events
+
+
+def encode_preview(frame: np.ndarray) -> Optional[str]:
+    frame = cv2.resize(frame, (800, 600))
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+    if not ok:
+        logging.debug("Pipeline: preview encode failed")
+        return None
+    return base64.b64encode(buf).decode("utf-8")
@@ -0,0 +1,180 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.utils.config import config
+
+# Stage names, in pipeline order (used for display ordering)
+STAGES: Tuple[str, ...] = (
+    "capture_wait",
+    "detection",
+    "quality_gate",
+    "hash_prefilter",
+    "embedding",
+    "identify",
+    "dedup_lookup",
+    "disk_save",
+    "cluster",
+    "preview_encode",
+    "ui_update",
+)
+
+# Cumulative histogram bucket bounds in seconds (Prometheus style, +Inf implied)
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _RateCounter:
+    """Total count plus per-second buckets for the last ``horizon`` seconds."""
+
+    __slots__ = ("total", "_buckets", "_horizon")
+
+    def __init__(self, horizon: int = 60):
+        self.total = 0
+        self._horizon = horizon
+        self._buckets: Deque[List[int]] = deque()
+
+    def add(self, n: int, now_s: int) -> None:
+        self.total += n
+        if self._buckets and self._buckets[-1][0] == now_s:
+            self._buckets[-1][1] += n
+        else:
+            self._buckets.append([now_s, n])
+        while self._buckets and self._buckets[0][0] <= now_s - self._horizon:
+            self._buckets.popleft()
+
+    def rate(self, now_s: int, window: int) -> float:
+        """Average events/second over the last ``window`` complete seconds."""
+        start = now_s - window
+        count = sum(c for s, c in self._buckets if start <= s < now_s)
+        return count / float(window)
+
+
+class PipelineStats:
+    """Per-stage latency percentiles and per-second counters for the camera pipeline.
+
+    Latencies keep the last ``window`` samples per stage; counters keep totals and
+    one-second buckets. Everything is guarded by one lock because stages run on
+    several executor threads.
+    """
+
+    def __init__(self, window: int = 1024, rate_window: int = 10):
+        self.window = window
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counters: Dict[str, _RateCounter] = {}
+        # stage -> [bucket counts..., +Inf count], sum of seconds
+        self._histograms: Dict[str, List[int]] = {}
+        self._histogram_sums: Dict[str, float] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._last_log = time.monotonic()
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            buckets = self._histograms.get(stage)
+            if buckets is None:
+                buckets = self._histograms[stage] = [0] * (len(LATENCY_BUCKETS) + 1)
+                self._histogram_sums[stage] = 0.0
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self._histogram_sums[stage] += seconds
+
+    def incr(self, counter: str, n: int = 1) -> None:
+        now_s = int(time.time())
+        with self._lock:
+            rc = self._counters.get(counter)
+            if rc is None:
+                rc = self._counters[counter] = _RateCounter()
+            rc.add(n, now_s)
+
+    def register_gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> None:
+        """Expose a value sampled on demand (queue depth, cache size...); re-registering replaces it."""
+        with self._lock:
+            self._gauges[name] = (help_text, callback)
+
+    def counter_totals(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: rc.total for name, rc in self._counters.items()}
+
+    def histograms(self) -> Dict[str, Tuple[List[int], float]]:
+        """Per stage: non-cumulative bucket counts (last one is +Inf) and sum of seconds."""
+        with self._lock:
+            return {name: (list(b), self._histogram_sums[name]) for name, b in self._histograms.items()}
+
+    def gauges(self) -> Dict[str, Tuple[str, float]]:
+        with self._lock:
+            registered = list(self._gauges.items())
+        values: Dict[str, Tuple[str, float]] = {}
+        for name, (help_text, callback) in registered:
+            try:
+                values[name] = (help_text, float(callback()))
+            except Exception as e:
+                logging.debug(f"PipelineStats: gauge {name} failed: {e}")
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latency percentiles (ms) per stage and totals/rates per counter."""
+        now_s = int(time.time())
+        with self._lock:
+            samples = {name: np.fromiter(values, dtype=np.float64) for name, values in self._samples.items()}
+            counters = {
+                name: {"total": rc.total, "per_second": round(rc.rate(now_s, self.rate_window), 3)}
+                for name, rc in self._counters.items()
+            }
+        stages: Dict[str, Dict[str, float]] = {}
+        for name in sorted(samples, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            values = samples[name]
+            if not values.size:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99)) * 1000.0
+            stages[name] = {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "samples": int(values.size)}
+        return {"stages": stages, "counters": counters}
+
+    def summary_text(self) -> str:
+        """Compact multi-line view for the on-screen overlay."""
+        snap = self.snapshot()
+        counters = snap["counters"]
+
+        def rate(name: str) -> str:
+            return f"{counters.get(name, {}).get('per_second', 0.0):.1f}/s"
+
+        lines = [
+            f"capturados {rate('frames_captured')} · procesados {rate('frames_processed')} · descartados {rate('frames_dropped')}",
+            f"rostros {rate('faces_detected')} · aceptados {rate('faces_accepted')} · rechazados {rate('faces_rejected')}",
+        ]
+        for stage, values in snap["stages"].items():
+            lines.append(f"{stage}: p50 {values['p50_ms']:.1f} · p95 {values['p95_ms']:.1f} · p99 {values['p99_ms']:.1f} ms")
+        return "\n".join(lines)
+
+    def log_if_due(self) -> None:
+        """Write one structured (JSON) stats line every ``stats_log_interval_seconds``."""
+        interval = float(getattr(config, "stats_log_interval_seconds", 60) or 0)
+        if interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_log < interval:
+            return
+        self._last_log = now
+        logging.info("pipeline_stats %s", json.dumps(self.snapshot(), sort_keys=True))
+
+
+# process-wide instance shared by the pipeline, FaceRecognition and FaceStorage
+stats = PipelineStats()
@@ -0,0 +1,99 @@
+import cProfile
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from src.utils.config import config
+
+
+class PipelineProfiler:
+    """On-demand cProfile + tracemalloc capture of the camera processing stages.
+
+    While idle, ``call`` costs one attribute check per frame. ``request`` opens a
+    window of N seconds during which every processing call is profiled (one
+    ``cProfile.Profile`` per executor thread, merged at the end) and tracemalloc
+    records allocations. At the end of the window a ``.prof`` file and a
+    tracemalloc top-allocation report are written to ``dir_logs``.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.last_report: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: List[cProfile.Profile] = []
+        self._started_tracemalloc = False
+        self._timer: Optional[threading.Timer] = None
+        self._started_at = 0.0
+
+    def request(self, seconds: Optional[float] = None) -> bool:
+        """Start a profiling window; returns False if one is already running."""
+        seconds = float(seconds or getattr(config, "profile_seconds", 30))
+        with self._lock:
+            if self.active:
+                return False
+            self._profiles = []
+            self._local = threading.local()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_tracemalloc = True
+            self._started_at = time.monotonic()
+            self.active = True
+            self._timer = threading.Timer(seconds, self._finish)
+            self._timer.daemon = True
+            self._timer.start()
+        logging.info("Profiling camera pipeline for %.0f s", seconds)
+        return True
+
+    def call(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run ``func(*args)``, under this thread's profiler while a window is open."""
+        if not self.active:
+            return func(*args)
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._local.profile = profile
+            with self._lock:
+                self._profiles.append(profile)
+        return profile.runcall(func, *args)
+
+    def _finish(self) -> None:
+        with self._lock:
+            self.active = False
+            profiles, self._profiles = self._profiles, []
+            elapsed = time.monotonic() - self._started_at
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+        logs_dir = Path(getattr(config, "dir_logs", "logs") or "logs")
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        stem = logs_dir / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        try:
+            if profiles:
+                merged = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    merged.add(profile)
+                merged.dump_stats(str(stem.with_suffix(".prof")))
+            else:
+                logging.warning("Profiling window ended without processed frames (is the camera running?)")
+            if snapshot is not None:
+                with open(f"{stem}_tracemalloc.txt", "w", encoding="utf-8") as f:
+                    f.write(f"Top allocations after {elapsed:.1f} s of profiling\n\n")
+                    for stat in snapshot.statistics("lineno")[:30]:
+                        f.write(f"{stat}\n")
+            self.last_report = stem
+            logging.info("Profiling report written to %s.prof / %s_tracemalloc.txt", stem, stem)
+        except Exception as e:
+            logging.error(f"Failed to write profiling report: {e}")
+
+
+# process-wide profiler, triggered from config, the tray menu or Settings
+profiler = PipelineProfiler()
@@ -0,0 +1,183 @@
+"""Time-bucketed window of recently saved faces for dedup.
+
+Rows (unit-norm float32 vectors in the dedup space, plus their record and
+save time) are appended to one contiguous matrix. Consecutive rows are grouped
+into buckets of ``bucket_seconds``; a bucket that ages out of the window is
+dropped by moving the head past it, so expiry costs O(1) per bucket and the
+live rows always form a single slice. "Was a similar face saved in the last N
+seconds, and how long ago?" is one matrix-vector product over that slice,
+independent of how long the process has been running.
+
+With an ``EmbeddingCodec`` the rows are kept as its float16/int8 codes (plus
+one scale per row) and scored with ``EmbeddingCodec.similarities``, so the
+window holds the compact form instead of float32 copies.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .embedding_codec import EmbeddingCodec
+
+_MIN_CAPACITY = 256
+
+
+class RecentMatch(NamedTuple):
+    record: Any
+    similarity: float
+    age_seconds: float
+
+
+class RecentFaces:
+    """Sliding window of (vector, record) rows expiring in whole time buckets."""
+
+    def __init__(
+        self,
+        window_seconds: float,
+        bucket_seconds: float = 1.0,
+        max_faces: int = 10000,
+        codec: Optional[EmbeddingCodec] = None,
+    ):
+        self.window_seconds = float(window_seconds)
+        self.bucket_seconds = max(1e-3, float(bucket_seconds))
+        self.max_faces = max(1, int(max_faces))
+        self.codec = codec
+        self._lock = threading.Lock()
+        self.clear()
+
+    def use_codec(self, codec: Optional[EmbeddingCodec]) -> None:
+        """Switch the row storage (None = float32) and empty the window."""
+        with self._lock:
+            self.codec = codec
+            self.clear()
+
+    def clear(self) -> None:
+        self._vectors: Optional[np.ndarray] = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._times = np.zeros(0, dtype=np.float64)
+        self._records: List[Any] = []
+        self._head = 0
+        self._tail = 0
+        # (bucket key, row just past the bucket's last row), oldest first
+        self._buckets: Deque[Tuple[int, int]] = deque()
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def _make_room(self, dim: int) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((_MIN_CAPACITY, dim), dtype=self._dtype)
+            self._scales = np.ones(_MIN_CAPACITY, dtype=np.float32)
+            self._times = np.zeros(_MIN_CAPACITY, dtype=np.float64)
+            self._records = [None] * _MIN_CAPACITY
+            return
+        if self._tail < len(self._vectors):
+            return
+        live = self._tail - self._head
+        capacity = len(self._vectors)
+        if live * 2 > capacity:
+            capacity *= 2
+        # compact the live slice to the front (and grow if it is more than half full)
+        vectors = np.zeros((capacity, dim), dtype=self._dtype)
+        vectors[:live] = self._vectors[self._head:self._tail]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:live] = self._scales[self._head:self._tail]
+        times = np.zeros(capacity, dtype=np.float64)
+        times[:live] = self._times[self._head:self._tail]
+        records = self._records[self._head:self._tail] + [None] * (capacity - live)
+        shift = self._head
+        self._vectors, self._scales, self._times, self._records = vectors, scales, times, records
+        self._head, self._tail = 0, live
+        self._buckets = deque((key, end - shift) for key, end in self._buckets)
+
+    @property
+    def _dtype(self):
+        return self.codec.dtype if self.codec is not None else np.float32
+
+    def _drop_until(self, row: int) -> None:
+        self._records[self._head:row] = [None] * (row - self._head)
+        self._head = row
+
+    def add(self, vector: np.ndarray, record: Any, timestamp: datetime) -> None:
+        """Add a float vector in the dedup space (quantized first when a codec is set)."""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        vector = vector / (float(np.linalg.norm(vector)) or 1.0)
+        if self.codec is not None:
+            codes, scales = self.codec.quantize(vector)
+            self.add_code(codes[0], float(scales[0]), record, timestamp)
+        else:
+            self._append(vector, 1.0, record, timestamp)
+
+    def add_code(self, code: np.ndarray, scale: float, record: Any, timestamp: datetime) -> None:
+        """Add a row already encoded by ``self.codec`` (no decode/re-encode round trip)."""
+        self._append(np.asarray(code).ravel(), scale, record, timestamp)
+
+    def _append(self, row_value: np.ndarray, scale: float, record: Any, timestamp: datetime) -> None:
+        ts = timestamp.timestamp()
+        key = int(ts // self.bucket_seconds)
+        with self._lock:
+            self._make_room(len(row_value))
+            row = self._tail
+            self._vectors[row] = row_value
+            self._scales[row] = scale
+            self._times[row] = ts
+            self._records[row] = record
+            self._tail += 1
+            if self._buckets and self._buckets[-1][0] >= key:
+                # same bucket, or an out-of-order save joining the newest bucket
+                self._buckets[-1] = (self._buckets[-1][0], self._tail)
+            else:
+                self._buckets.append((key, self._tail))
+            while len(self) > self.max_faces and len(self._buckets) > 1:
+                _key, end = self._buckets.popleft()
+                self._drop_until(end)
+            if len(self) > self.max_faces:
+                self._drop_until(self._tail - self.max_faces)
+
+    def expire(self, now: Optional[datetime] = None) -> int:
+        """Drop every bucket entirely older than the window; returns rows dropped."""
+        cutoff = int(((now or datetime.now()).timestamp() - self.window_seconds) // self.bucket_seconds)
+        dropped = 0
+        with self._lock:
+            while self._buckets and self._buckets[0][0] < cutoff:
+                _key, end = self._buckets.popleft()
+                dropped += end - self._head
+                self._drop_until(end)
+            if not self._buckets:
+                self._head = self._tail = 0
+        return dropped
+
+    def most_recent_similar(
+        self,
+        vector: np.ndarray,
+        threshold: float,
+        now: Optional[datetime] = None,
+        within_seconds: Optional[float] = None,
+    ) -> Optional[RecentMatch]:
+        """Most recently saved row with similarity above ``threshold`` within ``within_seconds``."""
+        now = now or datetime.now()
+        self.expire(now)
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        query = query / (float(np.linalg.norm(query)) or 1.0)
+        encoded = self.codec.quantize(query) if self.codec is not None else None
+        within = self.window_seconds if within_seconds is None else float(within_seconds)
+        now_ts = now.timestamp()
+        with self._lock:
+            if self._tail == self._head:
+                return None
+            if encoded is not None:
+                sims = self.codec.similarities(
+                    encoded, self._vectors[self._head:self._tail], self._scales[self._head:self._tail]
+                )
+            else:
+                sims = self._vectors[self._head:self._tail] @ query
+            times = self._times[self._head:self._tail]
+            # later saves (out-of-order ingestion) count as recent too
+            candidates = np.flatnonzero((sims > threshold) & (times >= now_ts - within))
+            if not len(candidates):
+                return None
+            best = int(candidates[np.argmax(times[candidates])])
+            return RecentMatch(self._records[self._head + best], float(sims[best]), now_ts - float(times[best]))
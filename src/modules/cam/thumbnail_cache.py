@@ -0,0 +1,94 @@
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+
+from src.utils.config import config
+
+from .face_archive import is_archive_ref, read_face_bytes
+from .image_encoding import decode, thumbnail_encoding
+from .pipeline_stats import stats
+
+_Key = Tuple[str, int, int]
+
+
+class ThumbnailCache:
+    """LRU of base64 thumbnails keyed by (path, mtime, max_side).
+
+    The history views rebuild their grids every few seconds; without a cache every
+    refresh decodes, resizes and re-encodes every image on disk.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = int(max_entries or getattr(config, "thumbnail_cache_size", 512))
+        self._entries: "OrderedDict[_Key, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, path: Path, max_side: int) -> str:
+        """Return the thumbnail for ``path`` base64-encoded (``thumbnail_format``), or "" if it can't be read."""
+        if is_archive_ref(path):
+            # archived crops never change in place
+            key = (str(path), 0, int(max_side))
+        else:
+            try:
+                key = (str(path), path.stat().st_mtime_ns, int(max_side))
+            except OSError:
+                return ""
+        with self._lock:
+            b64 = self._entries.get(key)
+            if b64 is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                stats.incr("thumbnail_cache_hits")
+                return b64
+            self.misses += 1
+        stats.incr("thumbnail_cache_misses")
+
+        b64 = encode_thumbnail(path, max_side)
+        if b64:
+            with self._lock:
+                self._entries[key] = b64
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return b64
+
+
+def encode_thumbnail(path: Path, max_side: int) -> str:
+    if is_archive_ref(path):
+        img = decode(read_face_bytes(path))
+    else:
+        img = cv2.imread(str(path))
+    if img is None:
+        logging.error(f"Thumbnail: failed to read image: {path}")
+        return ""
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / max(w, h))
+    if scale != 1.0:
+        img = cv2.resize(img, (int(w * scale), int(h * scale)))
+    data = _ENCODING.encode(img)
+    if data is None:
+        logging.error(f"Thumbnail: failed to encode image: {path}")
+        return ""
+    return base64.b64encode(data).decode("utf-8")
+
+
+_ENCODING = thumbnail_encoding()
+
+# shared by HistoryTab and the Detecciones view
+thumbnail_cache = ThumbnailCache()
+stats.register_gauge("thumbnail_cache_entries", "Thumbnails held in memory", lambda: len(thumbnail_cache))
+stats.register_gauge("thumbnail_cache_hit_ratio", "Thumbnail cache hits / lookups", lambda: thumbnail_cache.hit_ratio)
@@ -10,6 +10,66 @@ _DEFAULTS: Dict[str, Any] = {
     "repeat_interval_seconds": 30,
     "recent_seconds": 60,
     "similarity_threshold": 0.6,
+    "dnn_batch_size": 8,
+    "dnn_batch_max_wait_ms": 15,
+    "analysis_backend": "thread",
+    "analysis_workers": 0,
+    "analysis_ring_slots": 0,
+    "analysis_max_frame": [1920, 1080],
+    "stats_log_interval_seconds": 60,
+    "stats_overlay": True,
+    "metrics_host": "127.0.0.1",
+    "metrics_port": 0,
+    "thumbnail_cache_size": 512,
+    "profile_seconds": 30,
+    "profile_on_start_seconds": 0,
+    "capture_device": 0,
+    "capture_source": "",
+    "capture_record_path": "",
+    "replay_pace": "original",
+    "embedding_index_enabled": True,
+    "embedding_index_dir": "",
+    "embedding_projection": "",
+    "embedding_storage": "float32",
+    "ann_enabled": False,
+    "ann_nlist": 0,
+    "ann_nprobe": 8,
+    "ann_min_gallery": 2048,
+    "identities_dir": "identities",
+    "identity_subcentroids": 0,
+    "identity_threshold": 0,
+    "face_search_top_k": 20,
+    "clustering_enabled": True,
+    "cluster_threshold": 0,
+    "cluster_refine_every": 200,
+    "phash_prefilter": True,
+    "phash_max_distance": 6,
+    "recent_bucket_seconds": 1.0,
+    "recent_max_faces": 10000,
+    "max_faces_in_memory": 20000,
+    "retention_max_age_days": 0,
+    "retention_max_bytes": 0,
+    "retention_max_count": 0,
+    "retention_sweep_interval_seconds": 3600,
+    "history_default_period": "24h",
+    "storage_backend": "files",
+    "archive_dir": "",
+    "archive_segment_bytes": 67108864,
+    "archive_compact_ratio": 0.5,
+    "face_image_format": "jpeg",
+    "face_image_quality": 95,
+    "face_image_grayscale": False,
+    "thumbnail_format": "jpeg",
+    "thumbnail_quality": 85,
+    "thumbnail_grayscale": False,
+    "export_manifest_format": "json",
+    "export_include_embeddings": False,
+    "thread_budget": {
+        "total_threads": 0,
+        "opencv_threads": 0,
+        "blas_threads": 0,
+        "pin_cores": False
+    },
     "models_dir": "models",
     "dir_logs": "logs",
     "model_files": {
@@ -74,8 +134,15 @@ def load_config() -> SimpleNamespace:
         lpath = root / lpath
     cfg['dir_logs'] = lpath.resolve()
 
+    # Ensure identities_dir absolute (project-root relative if needed)
+    idir = cfg.get('identities_dir') or _DEFAULTS['identities_dir']
+    ipath = Path(idir)
+    if not ipath.is_absolute():
+        ipath = root / ipath
+    cfg['identities_dir'] = ipath.resolve()
+
     # Create directories so app can write assets/logs
-    for key in ("detected_faces_dir", "models_dir", "dir_logs"):
+    for key in ("detected_faces_dir", "models_dir", "dir_logs", "identities_dir"):
         path = cfg.get(key)
         if isinstance(path, Path):
             try:
@@ -91,3 +158,8 @@ def load_config() -> SimpleNamespace:
 
 # singleton config
 config = load_config()
+
+# size OpenCV/BLAS/worker pools from one policy before NumPy/OpenCV are imported
+from src.utils.thread_budget import apply_thread_budget  # noqa: E402
+
+apply_thread_budget(config)
@@ -52,6 +52,7 @@ def setup_system_tray(
     on_show: Callable[[], None],
     on_about: Callable[[], None],
     on_exit: Callable[[], None],
+    on_profile: Optional[Callable[[], None]] = None,
 ) -> Optional["pystray.Icon"]:
     """Create and start a system tray icon in a background thread.
 
@@ -69,15 +70,18 @@ def setup_system_tray(
             logging.warning("System tray disabled: could not prepare tray icon image")
             return None
 
-        menu = pystray.Menu(
+        items = [
             pystray.MenuItem(
                 "Mostrar ventana",
                 lambda icon, item: on_show(),
                 default=True,
             ),
             pystray.MenuItem("Acerca de...", lambda icon, item: on_about()),
-            pystray.MenuItem("Salir", lambda icon, item: on_exit()),
-        )
+        ]
+        if on_profile is not None:
+            items.append(pystray.MenuItem("Perfilar pipeline", lambda icon, item: on_profile()))
+        items.append(pystray.MenuItem("Salir", lambda icon, item: on_exit()))
+        menu = pystray.Menu(*items)
 
         tray_icon = pystray.Icon(
             "controlflow_camera",
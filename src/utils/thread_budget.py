@@ -0,0 +1,190 @@
+"""Single CPU thread budget shared by OpenCV, NumPy/BLAS, capture and worker pools.
+
+Without coordination each library sizes its own thread pool to the full core
+count, which oversubscribes small boxes. ``apply_thread_budget`` is called once
+from ``src.utils.config`` at startup, before NumPy/OpenCV are imported.
+"""
+
+import logging
+import os
+import sys
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+_allocation: Optional[SimpleNamespace] = None
+
+
+def _usable_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        try:
+            return sorted(os.sched_getaffinity(0))
+        except OSError:
+            pass
+    return list(range(os.cpu_count() or 1))
+
+
+def compute_allocation(cfg: Any) -> SimpleNamespace:
+    """Derive thread counts and core sets from ``config.thread_budget``.
+
+    Policy: one core is kept for capture + UI, the rest goes to analysis. With the
+    process backend every worker gets one OpenCV thread; with the thread backend
+    OpenCV may use all analysis cores. BLAS stays single-threaded unless overridden,
+    since our NumPy work is many small products rather than a few large ones.
+    """
+    budget: Dict[str, Any] = dict(getattr(cfg, "thread_budget", None) or {})
+    cpus = _usable_cpus()
+    total = int(budget.get("total_threads") or 0) or len(cpus)
+    total = max(1, min(total, len(cpus)))
+    cpus = cpus[:total]
+
+    analysis_cores = cpus[1:] or cpus
+    work = len(analysis_cores)
+    backend = str(getattr(cfg, "analysis_backend", "thread")).lower()
+
+    workers = int(getattr(cfg, "analysis_workers", 0) or 0)
+    if backend == "process":
+        workers = workers or work
+        opencv_threads = 1
+    else:
+        workers = workers or 1
+        opencv_threads = work
+
+    opencv_threads = int(budget.get("opencv_threads") or 0) or opencv_threads
+    blas_threads = int(budget.get("blas_threads") or 0) or 1
+
+    return SimpleNamespace(
+        total_threads=total,
+        backend=backend,
+        analysis_workers=workers,
+        opencv_threads=opencv_threads,
+        worker_opencv_threads=1 if backend == "process" else opencv_threads,
+        blas_threads=blas_threads,
+        pin_cores=bool(budget.get("pin_cores", False)),
+        capture_cores=cpus[:1],
+        analysis_cores=analysis_cores,
+    )
+
+
+def _set_opencv_threads(count: int) -> None:
+    try:
+        import cv2
+
+        cv2.setNumThreads(int(count))
+    except Exception as exc:  # pragma: no cover - OpenCV optional at import time
+        logging.debug("Thread budget: cv2.setNumThreads failed: %s", exc)
+
+
+def apply_thread_budget(cfg: Any) -> SimpleNamespace:
+    """Apply the budget for this process and store it as ``cfg.thread_allocation``."""
+    global _allocation
+    alloc = compute_allocation(cfg)
+
+    # BLAS pools read these once, when NumPy is first imported; explicit env wins
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(alloc.blas_threads))
+    _set_opencv_threads(alloc.opencv_threads)
+
+    if not getattr(cfg, "analysis_workers", 0):
+        cfg.analysis_workers = alloc.analysis_workers
+    cfg.thread_allocation = alloc
+    _allocation = alloc
+    logging.info(
+        "Thread budget: %s CPUs, OpenCV=%s, BLAS=%s, workers=%s (%s)",
+        alloc.total_threads, alloc.opencv_threads, alloc.blas_threads, alloc.analysis_workers, alloc.backend,
+    )
+    return alloc
+
+
+def current_allocation() -> Optional[SimpleNamespace]:
+    return _allocation
+
+
+def apply_worker_budget() -> None:
+    """Called inside analysis worker processes: one OpenCV thread, analysis cores."""
+    if _allocation is None:
+        return
+    _set_opencv_threads(_allocation.worker_opencv_threads)
+    if _allocation.pin_cores:
+        pin_current_thread("analysis")
+
+
+def lower_process_priority() -> bool:
+    """Run the calling process at background priority (batch jobs next to the live app)."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            below_normal = 0x00004000  # BELOW_NORMAL_PRIORITY_CLASS
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), below_normal))
+        os.nice(10)
+        return True
+    except Exception as exc:
+        logging.debug("Thread budget: unable to lower process priority: %s", exc)
+    return False
+
+
+def pin_current_thread(role: str) -> bool:
+    """Pin the calling thread to the ``capture`` or ``analysis`` cores if pinning is on."""
+    alloc = _allocation
+    if alloc is None or not alloc.pin_cores:
+        return False
+    cores = alloc.capture_cores if role == "capture" else alloc.analysis_cores
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            # on Linux pid 0 means the calling thread
+            os.sched_setaffinity(0, cores)
+            return True
+        if sys.platform == "win32":
+            import ctypes
+
+            mask = 0
+            for core in cores:
+                mask |= 1 << core
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask))
+    except Exception as exc:
+        logging.debug("Thread budget: unable to pin %s thread: %s", role, exc)
+    return False
+
+
+def describe_allocation(alloc: Optional[SimpleNamespace] = None) -> str:
+    """Human readable view of the effective allocation (for diagnostics)."""
+    alloc = alloc or _allocation
+    if alloc is None:
+        return "Thread budget not applied"
+    lines = [
+        "PRESUPUESTO DE HILOS",
+        "--------------------",
+        f"CPUs asignadas: {alloc.total_threads}",
+        f"Backend de analisis: {alloc.backend} ({alloc.analysis_workers} worker(s))",
+        f"Hilos OpenCV (proceso principal): {alloc.opencv_threads}",
+        f"Hilos OpenCV por worker: {alloc.worker_opencv_threads}",
+        f"Hilos BLAS: {alloc.blas_threads}",
+        f"Fijar nucleos: {'si' if alloc.pin_cores else 'no'}",
+        f"Nucleos captura: {alloc.capture_cores}",
+        f"Nucleos analisis: {alloc.analysis_cores}",
+    ]
+    for var in BLAS_ENV_VARS:
+        lines.append(f"{var}={os.environ.get(var, '')}")
+    try:
+        import cv2
+
+        lines.append(f"cv2.getNumThreads()={cv2.getNumThreads()}")
+    except Exception:
+        pass
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from src.utils.config import config
+
+    print(describe_allocation(config.thread_allocation))
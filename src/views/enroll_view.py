@@ -1,10 +1,124 @@
+import cv2
 import flet as ft
 
+from src.modules.cam.face_recognition import shared_recognizer
+from src.modules.cam.identity_gallery import enrollment_sample, shared_identity_gallery
+
+
 def enroll_view(page):
+    gallery = shared_identity_gallery()
+
+    name_field = ft.TextField(label="Nombre de la persona", width=320)
+    status = ft.Text("", size=13)
+    people_list = ft.ListView(expand=True, spacing=4, padding=10)
+    selected = {"person_id": None}
+
+    def refresh_people():
+        people_list.controls = [
+            ft.ListTile(
+                leading=ft.Icon(ft.Icons.PERSON),
+                title=ft.Text(person["name"]),
+                subtitle=ft.Text(f"{person['samples']} muestra(s) · desde {person['created'][:10]}"),
+                trailing=ft.Row(
+                    [
+                        ft.IconButton(
+                            icon=ft.Icons.ADD_A_PHOTO,
+                            tooltip="Agregar fotos",
+                            on_click=lambda e, p=person: add_samples(p),
+                        ),
+                        ft.IconButton(
+                            icon=ft.Icons.DELETE,
+                            icon_color=ft.Colors.PINK_700,
+                            tooltip="Eliminar",
+                            on_click=lambda e, p=person: remove_person(p),
+                        ),
+                    ],
+                    tight=True,
+                ),
+            )
+            for person in sorted(gallery.people(), key=lambda p: p["name"].lower())
+        ]
+        if not people_list.controls:
+            people_list.controls = [ft.Text("No hay personas registradas", color="#616161")]
+
+    def enroll_files(paths, name, person_id):
+        # runs on a worker thread: decoding, detection and embedding are CPU bound
+        recognizer = shared_recognizer()
+        crops, embeddings, rejected = [], [], []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                rejected.append(f"{path}: no se pudo leer")
+                continue
+            face_img, embedding, message = enrollment_sample(recognizer, image)
+            if face_img is None or embedding is None:
+                rejected.append(f"{path}: {message}")
+                continue
+            crops.append(face_img)
+            embeddings.append(embedding)
+
+        if embeddings:
+            gallery.enroll(name, embeddings, crops, person_id=person_id)
+            status.value = f"✅ {name}: {len(embeddings)} muestra(s) registradas"
+        else:
+            status.value = "❌ Ninguna foto tenia un rostro valido"
+        if rejected:
+            status.value += f" · {len(rejected)} descartada(s)"
+        refresh_people()
+        page.update()
+
+    def on_files_picked(e: ft.FilePickerResultEvent):
+        if not e.files:
+            return
+        person_id = selected["person_id"]
+        name = name_field.value.strip() if person_id is None else selected["name"]
+        status.value = f"Procesando {len(e.files)} foto(s)..."
+        page.update()
+        paths = [f.path for f in e.files if f.path]
+        page.run_thread(enroll_files, paths, name, person_id)
+
+    picker = ft.FilePicker(on_result=on_files_picked)
+    page.overlay.append(picker)
+
+    def pick_photos(_e=None):
+        picker.pick_files(allow_multiple=True, file_type=ft.FilePickerFileType.IMAGE)
+
+    def enroll_new(e):
+        if not name_field.value or not name_field.value.strip():
+            status.value = "Escribe un nombre antes de elegir fotos"
+            page.update()
+            return
+        selected["person_id"] = None
+        pick_photos()
+
+    def add_samples(person):
+        selected["person_id"] = person["id"]
+        selected["name"] = person["name"]
+        pick_photos()
+
+    def remove_person(person):
+        if gallery.remove(person["id"]):
+            status.value = f"🗑️ {person['name']} eliminado"
+        refresh_people()
+        page.update()
+
+    refresh_people()
+
     return ft.Column(
         [
             ft.Text("Registro de rostro", size=22, weight="bold"),
-            ft.Text("Aquí irá UI para registrar personas"),
+            ft.Text("Registra personas con una o varias fotos; cada detección se compara contra ellas."),
+            ft.Row(
+                [
+                    name_field,
+                    ft.FilledButton("Elegir fotos y registrar", icon=ft.Icons.PERSON_ADD, on_click=enroll_new),
+                ],
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+            status,
+            ft.Divider(),
+            ft.Text("Personas registradas", size=16, weight=ft.FontWeight.W_600),
+            people_list,
         ],
         expand=True
     )
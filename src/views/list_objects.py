@@ -1,10 +1,11 @@
 import os
 from pathlib import Path
-from datetime import datetime
-import base64
-import cv2
 import flet as ft
 
+from src.modules.cam.face_archive import delete_stored_face, shared_face_archive
+from src.modules.cam.face_layout import ShardedLayout
+from src.modules.cam.thumbnail_cache import thumbnail_cache
+
 
 def list_objects_view(page: ft.Page):
 
@@ -27,17 +28,7 @@ def list_objects_view(page: ft.Page):
 
     # ---- Helpers ----
     def encode_img(path: Path, max_side=500):
-        img = cv2.imread(str(path))
-        if img is None:
-            return None
-        h, w = img.shape[:2]
-        scale = min(1.0, max_side / max(h, w))
-        if scale != 1.0:
-            img = cv2.resize(img, (int(w * scale), int(h * scale)))
-        ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        if not ok:
-            return None
-        return base64.b64encode(buf).decode()
+        return thumbnail_cache.get(path, max_side) or None
 
     def close_dialog(dialog):
         if dialog is None:
@@ -46,10 +37,8 @@ def list_objects_view(page: ft.Page):
         page.update()
 
     def delete_file(path: Path, confirm_dialog, parent_dialog=None):
-        try:
-            path.unlink()
-        except Exception as e:
-            print(f"Error eliminando archivo: {e}")
+        if not delete_stored_face(path):
+            print(f"Error eliminando archivo: {path}")
         close_dialog(confirm_dialog)
         if parent_dialog:
             close_dialog(parent_dialog)
@@ -117,21 +106,21 @@ def list_objects_view(page: ft.Page):
             page.update()
             return
 
-        files = sorted(
-            (p for p in images_dir.iterdir() if p.suffix.lower() in [".jpg", ".jpeg", ".png"]),
-            key=lambda p: p.stat().st_mtime,
-            reverse=True,
-        )
+        # date/hour shards plus any crops of the old flat layout, newest first
+        files = ShardedLayout(images_dir).list_range()
+        archive = shared_face_archive()
+        if archive is not None:
+            files = sorted(files + archive.list_range(), key=lambda f: f.timestamp, reverse=True)
 
         total_label.value = str(len(files))
         cards = []
 
-        for path in files:
+        for path, timestamp in files:
             b64 = encode_img(path)
             if not b64:
                 continue
 
-            ts = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+            ts = timestamp.strftime("%Y-%m-%d %H:%M:%S")
             
             thumb = ft.Image(
                 src_base64=b64,
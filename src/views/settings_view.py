@@ -2,6 +2,9 @@
 
 import flet as ft
 
+from src.modules.cam.profiling import profiler
+from src.utils.config import config
+
 
  
 def settings_view(page):
@@ -16,10 +19,25 @@ def settings_view(page):
     )
  
     
+    profile_seconds = float(getattr(config, "profile_seconds", 30))
+
+    def start_profiling(e):
+        if profiler.request(profile_seconds):
+            message = f"Perfilando pipeline {profile_seconds:.0f} s; reporte en {config.dir_logs}"
+        else:
+            message = "Ya hay un perfilado en curso."
+        page.open(ft.SnackBar(ft.Text(message)))
+
     return ft.Column(
         [
             ft.Text("Configuración", size=22, weight="bold"),
             ft.Text("Ajustes del sistema / rutas / log"),
+            ft.OutlinedButton(
+                f"Perfilar pipeline ({profile_seconds:.0f} s)",
+                icon=ft.Icons.SPEED,
+                tooltip="Guarda .prof y reporte tracemalloc en dir_logs",
+                on_click=start_profiling,
+            ),
             ft.ElevatedButton("Open dialog", on_click=lambda e: page.open(dlg)),
             ft.IconButton(
                     icon=ft.Icons.CHECK_CIRCLE,